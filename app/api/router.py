@@ -1,9 +1,10 @@
 from fastapi import APIRouter
-from app.api import users, items, auth
+from app.api import users, items, auth, tags
 
 router = APIRouter(prefix="/api")
 
 # 注册各个模块的路由
 router.include_router(auth.router, prefix="/auth", tags=["认证"])
 router.include_router(users.router, prefix="/users", tags=["用户"])
-router.include_router(items.router, prefix="/items", tags=["物品"]) 
\ No newline at end of file
+router.include_router(items.router, prefix="/items", tags=["物品"]) 
+router.include_router(tags.router, prefix="/tags", tags=["标签"])
\ No newline at end of file
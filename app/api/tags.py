@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Query, status
+
+from app.models.llm_dao import LlmDAO
+from app.models.tag_models import NearestTagResponse
+
+router = APIRouter()
+
+@router.get("/nearest", response_model=NearestTagResponse)
+def nearest_tag(
+    tag: str = Query(..., min_length=1, description="标签"),
+    tag_type: str = Query("geo", description="标签类型：geo、cultural、other"),
+    k: int = Query(5, ge=1, le=50, description="返回的标准标签数量")
+):
+    """查询标签对应的规范标签和最相近的标准标签"""
+    if tag_type not in LlmDAO.TAG_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的标签类型: {tag_type}"
+        )
+    # 标签索引依赖 numpy 和向量模型，首次请求时才导入和加载
+    from app.services.tag_comparison.tag_normalizer import get_tag_normalizer
+    
+    normalizer = get_tag_normalizer()
+    if normalizer is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="标签索引尚未构建"
+        )
+    return normalizer.nearest(tag.strip(), tag_type, k=k)
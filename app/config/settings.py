@@ -25,6 +25,15 @@ class Settings(BaseSettings):
     
     # coze api
     COZE_API_TOKEN: str = os.getenv("COZE_API_TOKEN", "your-secret-key-here")
+    COZE_API_BASE_URL: str = os.getenv("COZE_API_BASE_URL", "https://api.coze.cn")
+    COZE_MAX_CONCURRENCY: int = int(os.getenv("COZE_MAX_CONCURRENCY", "10"))
+    COZE_REQUEST_TIMEOUT: float = float(os.getenv("COZE_REQUEST_TIMEOUT", "600"))
+    COZE_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("COZE_RATE_LIMIT_PER_MINUTE", "60"))
+    COZE_BACKOFF_BASE: float = float(os.getenv("COZE_BACKOFF_BASE", "5"))
+    COZE_BACKOFF_MAX: float = float(os.getenv("COZE_BACKOFF_MAX", "120"))
+    COZE_ARCHIVE_DIR: str = os.getenv("COZE_ARCHIVE_DIR", "logs/coze_archive")
+    COZE_ARCHIVE_COMPRESSION: str = os.getenv("COZE_ARCHIVE_COMPRESSION", "gzip")
+    COZE_ARCHIVE_SEGMENT_MAX_MB: int = int(os.getenv("COZE_ARCHIVE_SEGMENT_MAX_MB", "64"))
     
     # 小红书设置
     XHS_COOKIE: str = os.getenv("XHS_COOKIE")
@@ -39,6 +48,41 @@ class Settings(BaseSettings):
     MODEL_BASE_URL: str = os.getenv("MODEL_BASE_URL")
     MODEL_API_KEY: str = os.getenv("MODEL_API_KEY")
     
+    # llm 请求
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    # 按模型别名单独设置并发数，格式: qwen-max:coze=8,gpt-4o-mini=4
+    LLM_ALIAS_CONCURRENCY: str = os.getenv("LLM_ALIAS_CONCURRENCY", "")
+    LLM_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "300"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "600"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    LLM_BACKOFF_BASE: float = float(os.getenv("LLM_BACKOFF_BASE", "5"))
+    LLM_BACKOFF_MAX: float = float(os.getenv("LLM_BACKOFF_MAX", "120"))
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "logs/llm_cache/llm_response_cache.sqlite3")
+    LLM_CACHE_TTL_DAYS: float = float(os.getenv("LLM_CACHE_TTL_DAYS", "90"))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "200000"))
+    
+    # 标签向量
+    TAG_MODEL_DEVICE: str = os.getenv("TAG_MODEL_DEVICE", "cpu")
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "logs/embedding_cache/tag_embeddings.sqlite3")
+    EMBEDDING_CACHE_MEMORY_SIZE: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "50000"))
+    
+    # 本地嵌入服务
+    EMBEDDING_SERVER_ENABLED: bool = os.getenv("EMBEDDING_SERVER_ENABLED", "True").lower() == "true"
+    EMBEDDING_SERVER_AUTOSTART: bool = os.getenv("EMBEDDING_SERVER_AUTOSTART", "False").lower() == "true"
+    EMBEDDING_SERVER_HOST: str = os.getenv("EMBEDDING_SERVER_HOST", "127.0.0.1")
+    EMBEDDING_SERVER_PORT: int = int(os.getenv("EMBEDDING_SERVER_PORT", "8765"))
+    EMBEDDING_SERVER_TIMEOUT: float = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "300"))
+    EMBEDDING_SERVER_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_SERVER_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_SERVER_MAX_BATCH: int = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "1024"))
+    
+    # 标签归一化索引
+    TAG_INDEX_DIR: str = os.getenv("TAG_INDEX_DIR", "logs/tag_index")
+    TAG_INDEX_MODEL: str = os.getenv("TAG_INDEX_MODEL", "distiluse-v2")
+    TAG_NORMALIZE_THRESHOLD: float = float(os.getenv("TAG_NORMALIZE_THRESHOLD", "0.9"))
+    TAG_NORMALIZE_ENABLED: bool = os.getenv("TAG_NORMALIZE_ENABLED", "False").lower() == "true"
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
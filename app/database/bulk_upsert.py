@@ -0,0 +1,63 @@
+from typing import List, Dict, Any, Optional, Sequence, Iterator
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from app.utils.logger import get_logger, debug
+
+logger = get_logger(__name__)
+
+# 每条多行INSERT语句包含的最大行数，避免单条语句超过 max_allowed_packet
+DEFAULT_CHUNK_SIZE = 500
+
+
+def chunked(rows: Sequence[Any], chunk_size: int) -> Iterator[Sequence[Any]]:
+    """按固定大小切分列表"""
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def bulk_upsert(
+    db: Session,
+    model: Any,
+    rows: List[Dict[str, Any]],
+    update_columns: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """
+    使用 INSERT ... ON DUPLICATE KEY UPDATE 分块批量写入
+
+    只执行语句，不提交事务，由调用方统一提交。
+
+    Args:
+        db: 数据库会话
+        model: SQLAlchemy模型类
+        rows: 待写入的行，所有行的键必须一致
+        update_columns: 主键/唯一键冲突时需要更新的列，默认更新除主键外的全部列
+        chunk_size: 每条语句包含的最大行数
+
+    Returns:
+        执行的语句数量
+    """
+    if not rows:
+        return 0
+
+    table = model.__table__
+    if update_columns is None:
+        primary_keys = {column.name for column in table.primary_key.columns}
+        update_columns = [key for key in rows[0].keys() if key not in primary_keys]
+
+    statements = 0
+    for chunk in chunked(rows, chunk_size):
+        stmt = mysql_insert(table).values(list(chunk))
+        if update_columns:
+            stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+        else:
+            # 没有需要更新的列时，用主键自赋值实现"存在则忽略"
+            primary_key = next(iter(table.primary_key.columns)).name
+            stmt = stmt.on_duplicate_key_update({primary_key: stmt.inserted[primary_key]})
+        db.execute(stmt)
+        statements += 1
+
+    debug(f"{table.name} 批量写入 {len(rows)} 行，共 {statements} 条语句")
+    return statements
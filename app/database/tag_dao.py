@@ -1,9 +1,10 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
-from sqlalchemy import select
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from datetime import datetime
 
+from app.database.bulk_upsert import bulk_upsert
 from app.database.db import get_db
 from app.models.tag_models import TagStandard, TagComparisonResult
 from app.utils.logger import get_logger, error
@@ -11,6 +12,39 @@ from app.utils.logger import get_logger, error
 logger = get_logger(__name__)
 
 class TagDAO:
+    # tag_comparison_results 唯一键 uk_note_llm_type_model 的列
+    COMPARISON_KEY_COLUMNS = ("note_id", "llm_name", "tag_type", "compare_model_name")
+    
+    @staticmethod
+    def get_standard_tags_version() -> Tuple[int, Optional[int], Optional[str]]:
+        """
+        获取标准标签的版本
+        
+        由 tag_standards 的记录数、最大ID和最近更新时间组成，任何进程新增、删除或修改标准标签并提交后都会变化，
+        用于让各进程(API、多进程分析的子进程等)的标准标签索引失效。
+        """
+        db = next(get_db())
+        try:
+            count, max_id, updated_at = db.execute(
+                select(func.count(TagStandard.id), func.max(TagStandard.id), func.max(TagStandard.updated_at))
+            ).one()
+            return count, max_id, updated_at.isoformat() if updated_at else None
+        finally:
+            db.close()
+    
+    @staticmethod
+    def get_all_standard_tags() -> Dict[str, List[str]]:
+        """一次查询获取全部标准标签，按标签类型分组"""
+        db = next(get_db())
+        try:
+            query = select(TagStandard.tag_type, TagStandard.tag_name).order_by(TagStandard.id)
+            tags: Dict[str, List[str]] = {}
+            for tag_type, tag_name in db.execute(query):
+                tags.setdefault(tag_type, []).append(tag_name)
+            return tags
+        finally:
+            db.close()
+    
     @staticmethod
     def get_standard_tags(tag_type: str) -> List[str]:
         """获取指定类型的标准标签列表"""
@@ -36,6 +70,37 @@ class TagDAO:
             error(f"保存标准标签失败: {str(e)}")
             return False
     
+    @staticmethod
+    def _build_comparison_dict(
+        note_id: str,
+        llm_name: str,
+        tag_type: str,
+        collected_tags: List[str],
+        standard_tags: List[str],
+        similarity_matrix: List[List[float]],
+        scores: Dict[str, float],
+        weighted_score: float,
+        interpretation: str,
+        compare_model_name: str
+    ) -> Dict[str, Any]:
+        """将标签对比结果转换为 tag_comparison_results 的行数据"""
+        return {
+            "note_id": note_id,
+            "llm_name": llm_name,
+            "tag_type": tag_type,
+            "compare_model_name": compare_model_name,
+            "collected_tags": json.dumps(collected_tags, ensure_ascii=False),
+            "standard_tags": json.dumps(standard_tags, ensure_ascii=False),
+            "similarity_matrix": json.dumps(similarity_matrix, ensure_ascii=False),
+            "max_similarity": float(scores['max_similarity']),
+            "optimal_matching": float(scores['optimal_matching']),
+            "threshold_matching": float(scores['threshold_matching']),
+            "average_similarity": float(scores['average_similarity']),
+            "coverage": float(scores['coverage']),
+            "weighted_score": float(weighted_score),
+            "interpretation": interpretation
+        }
+    
     @staticmethod
     def save_comparison_result(
         db: Session,
@@ -51,51 +116,58 @@ class TagDAO:
         compare_model_name: str = "distiluse-base-multilingual-cased-v2"
     ) -> bool:
         """保存标签对比结果，如果已存在则更新"""
-        try:
-            # 查找是否已存在记录
-            query = db.query(TagComparisonResult).filter(
-                TagComparisonResult.note_id == note_id,
-                TagComparisonResult.llm_name == llm_name,
-                TagComparisonResult.tag_type == tag_type,
-                TagComparisonResult.compare_model_name == compare_model_name
-            )
-            existing_result = query.first()
+        return TagDAO.save_comparison_results(db, [{
+            "note_id": note_id,
+            "llm_name": llm_name,
+            "tag_type": tag_type,
+            "collected_tags": collected_tags,
+            "standard_tags": standard_tags,
+            "similarity_matrix": similarity_matrix,
+            "scores": scores,
+            "weighted_score": weighted_score,
+            "interpretation": interpretation,
+            "compare_model_name": compare_model_name
+        }]) == 1
+    
+    @staticmethod
+    def save_comparison_results(db: Session, results: List[Dict[str, Any]]) -> int:
+        """
+        批量保存标签对比结果，整批只提交一次
+        
+        按唯一键 uk_note_llm_type_model(note_id, llm_name, tag_type, compare_model_name)
+        分块执行 INSERT ... ON DUPLICATE KEY UPDATE，已有记录更新结果并保留创建时间。
+        
+        Args:
+            db: 数据库会话
+            results: 对比结果列表，每项的键与 save_comparison_result 的参数一致
             
-            result_dict = {
-                "note_id": note_id,
-                "llm_name": llm_name,
-                "tag_type": tag_type,
-                "compare_model_name": compare_model_name,
-                "collected_tags": json.dumps(collected_tags, ensure_ascii=False),
-                "standard_tags": json.dumps(standard_tags, ensure_ascii=False),
-                "similarity_matrix": json.dumps(similarity_matrix, ensure_ascii=False),
-                "max_similarity": float(scores['max_similarity']),
-                "optimal_matching": float(scores['optimal_matching']),
-                "threshold_matching": float(scores['threshold_matching']),
-                "average_similarity": float(scores['average_similarity']),
-                "coverage": float(scores['coverage']),
-                "weighted_score": float(weighted_score),
-                "interpretation": interpretation
-            }
+        Returns:
+            成功写入的记录数量
+        """
+        if not results:
+            return 0
+        
+        try:
+            now = datetime.now()
+            rows: Dict[tuple, Dict[str, Any]] = {}
+            for result in results:
+                row = TagDAO._build_comparison_dict(**result)
+                row["created_at"] = now
+                row["updated_at"] = now
+                # 同一批中重复的键只保留最后一条，与逐条保存时后写覆盖先写一致
+                rows[tuple(row[column] for column in TagDAO.COMPARISON_KEY_COLUMNS)] = row
             
-            if existing_result:
-                # 更新现有记录
-                for key, value in result_dict.items():
-                    setattr(existing_result, key, value)
-                existing_result.updated_at = datetime.now()
-                db.flush()
-                db.commit()
-            else:
-                # 创建新记录
-                db_result = TagComparisonResult(**result_dict)
-                db.add(db_result)
-                db.commit()
-                
-            return True
+            update_columns = [
+                column for column in next(iter(rows.values()))
+                if column not in TagDAO.COMPARISON_KEY_COLUMNS and column != "created_at"
+            ]
+            bulk_upsert(db, TagComparisonResult, list(rows.values()), update_columns=update_columns)
+            db.commit()
+            return len(rows)
         except Exception as e:
-            error(f"保存对比结果失败: {str(e)}")
+            error(f"批量保存对比结果失败: {str(e)}")
             db.rollback()
-            return False
+            return 0
     
     @staticmethod
     def get_comparison_results(
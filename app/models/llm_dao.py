@@ -1,6 +1,8 @@
 from sqlalchemy.orm import Session
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
+from app.database.bulk_upsert import bulk_upsert, chunked, DEFAULT_CHUNK_SIZE
 from app.models.llm_models import LlmNoteDiagnosis
+from collections import Counter
 from datetime import datetime
 import json
 from app.utils.logger import get_logger, info, warning, error
@@ -10,6 +12,84 @@ logger = get_logger(__name__)
 class LlmDAO:
     """LLM数据访问对象"""
     
+    # 标签类型 -> llm_note_diagnosis 中的标签列
+    TAG_COLUMNS = {
+        "geo": "geo_tags",
+        "cultural": "cultural_tags",
+        "other": "other_tags"
+    }
+    
+    @staticmethod
+    def parse_tag_list(tags: Any) -> List[str]:
+        """
+        处理可能的字符串列表问题，统一转换为标签列表
+        
+        支持JSON字符串(包括被重复编码的JSON字符串)和逗号分隔的字符串，
+        只保留非空的字符串标签(去掉首尾空白)，数字、嵌套列表等异常元素会被丢弃。
+        """
+        if isinstance(tags, str):
+            try:
+                decoded = json.loads(tags)
+            except ValueError:
+                # 如果是一个字符串，尝试将其转换为列表
+                decoded = [tag.strip() for tag in tags.strip('[]').replace('"', '').split(',') if tag.strip()]
+            if isinstance(decoded, str):
+                return LlmDAO.parse_tag_list(decoded)
+            tags = decoded
+        if not isinstance(tags, list):
+            return []
+        return [tag.strip() for tag in tags if isinstance(tag, str) and tag.strip()]
+    
+    @staticmethod
+    def get_distinct_tags(db: Session) -> Dict[str, Counter]:
+        """
+        统计诊断结果中出现过的全部标签
+        
+        Args:
+            db: 数据库会话
+            
+        Returns:
+            {标签类型: Counter(标签 -> 出现次数)}
+        """
+        tag_counts: Dict[str, Counter] = {tag_type: Counter() for tag_type in LlmDAO.TAG_COLUMNS}
+        columns = [getattr(LlmNoteDiagnosis, column) for column in LlmDAO.TAG_COLUMNS.values()]
+        for row in db.query(*columns).yield_per(DEFAULT_CHUNK_SIZE):
+            for tag_type, value in zip(LlmDAO.TAG_COLUMNS, row):
+                for tag in LlmDAO.parse_tag_list(value):
+                    tag_counts[tag_type][tag] += 1
+        return tag_counts
+    
+    @staticmethod
+    def _build_diagnosis_dict(note_id: str, llm_name: str, diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """将模型返回的诊断数据转换为 llm_note_diagnosis 的行数据"""
+        keywords = diagnosis_data.get('keywords', {})
+        user_data = diagnosis_data.get('data', {}).get('user', {})
+        note_data = diagnosis_data.get('data', {}).get('note', {})
+        
+        has_visited = False
+        if note_data.get('has_visited'):
+            if isinstance(note_data.get('has_visited'), str):
+                has_visited = note_data.get('has_visited').lower() == "true"
+            elif isinstance(note_data.get('has_visited'), bool):
+                has_visited = note_data.get('has_visited')
+        
+        return {
+            "note_id": note_id,
+            "llm_name": llm_name,
+            "geo_tags": json.dumps(keywords.get('location', []), ensure_ascii=False),
+            "cultural_tags": json.dumps(keywords.get('culture', []), ensure_ascii=False),
+            "other_tags": json.dumps(keywords.get('others', []), ensure_ascii=False),
+            "user_gender": user_data.get('gendar'),
+            "user_age_range": user_data.get('age_range'),
+            "user_location": user_data.get('location'),
+            "user_tags": json.dumps(user_data.get('others', []), ensure_ascii=False),
+            "post_summary": json.dumps(note_data.get('instra', ''), ensure_ascii=False),
+            "content_tendency": note_data.get('preference'),
+            "content_tendency_reason": json.dumps(note_data.get('preference_reason', ''), ensure_ascii=False),
+            "has_visited": has_visited,
+            "diagnosed_at": datetime.now()
+        }
+    
     @staticmethod
     def store_note_diagnosis(db: Session, note_id: str, llm_name: str, diagnosis_data: Dict[str, Any]) -> Optional[LlmNoteDiagnosis]:
         """存储笔记诊断结果"""
@@ -20,34 +100,7 @@ class LlmDAO:
                 LlmNoteDiagnosis.llm_name == llm_name
             ).first()
             
-            # 准备数据
-            keywords = diagnosis_data.get('keywords', {})
-            user_data = diagnosis_data.get('data', {}).get('user', {})
-            note_data = diagnosis_data.get('data', {}).get('note', {})
-            
-            has_visited = False
-            if note_data.get('has_visited'):
-                if isinstance(note_data.get('has_visited'), str):
-                    has_visited = note_data.get('has_visited').lower() == "true"
-                elif isinstance(note_data.get('has_visited'), bool):
-                    has_visited = note_data.get('has_visited')
-            
-            diagnosis_dict = {
-                "note_id": note_id,
-                "llm_name": llm_name,
-                "geo_tags": json.dumps(keywords.get('location', []), ensure_ascii=False),
-                "cultural_tags": json.dumps(keywords.get('culture', []), ensure_ascii=False),
-                "other_tags": json.dumps(keywords.get('others', []), ensure_ascii=False),
-                "user_gender": user_data.get('gendar'),
-                "user_age_range": user_data.get('age_range'),
-                "user_location": user_data.get('location'),
-                "user_tags": json.dumps(user_data.get('others', []), ensure_ascii=False),
-                "post_summary": json.dumps(note_data.get('instra', ''), ensure_ascii=False),
-                "content_tendency": note_data.get('preference'),
-                "content_tendency_reason": json.dumps(note_data.get('preference_reason', ''), ensure_ascii=False),
-                "has_visited": has_visited,
-                "diagnosed_at": datetime.now()
-            }
+            diagnosis_dict = LlmDAO._build_diagnosis_dict(note_id, llm_name, diagnosis_data)
             
             if not diagnosis:
                 # 创建新记录
@@ -68,4 +121,59 @@ class LlmDAO:
         except Exception as e:
             db.rollback()
             error(f"存储诊断结果时出错: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+    
+    @staticmethod
+    def store_note_diagnoses(db: Session, llm_name: str, diagnoses: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        批量存储同一模型的笔记诊断结果，整批只提交一次
+        
+        llm_note_diagnosis 没有 (note_id, llm_name) 唯一键，先用一次 IN 查询找出已有记录，
+        已有记录按主键批量更新，新记录批量插入。
+        
+        Args:
+            db: 数据库会话
+            llm_name: 模型名称
+            diagnoses: (笔记ID, 诊断数据) 列表
+            
+        Returns:
+            成功写入的记录数量
+        """
+        if not diagnoses:
+            return 0
+        
+        try:
+            rows: Dict[str, Dict[str, Any]] = {}
+            for note_id, diagnosis_data in diagnoses:
+                try:
+                    rows[note_id] = LlmDAO._build_diagnosis_dict(note_id, llm_name, diagnosis_data)
+                except Exception as e:
+                    error(f"解析诊断结果时出错 {note_id}: {str(e)}")
+            
+            existing_ids: Dict[str, int] = {}
+            for note_ids_chunk in chunked(list(rows.keys()), DEFAULT_CHUNK_SIZE):
+                for diagnosis_id, note_id in db.query(LlmNoteDiagnosis.id, LlmNoteDiagnosis.note_id).filter(
+                    LlmNoteDiagnosis.note_id.in_(note_ids_chunk),
+                    LlmNoteDiagnosis.llm_name == llm_name
+                ).all():
+                    existing_ids[note_id] = diagnosis_id
+            
+            now = datetime.now()
+            new_rows = []
+            update_rows = []
+            for note_id, row in rows.items():
+                if note_id in existing_ids:
+                    update_rows.append({**row, "id": existing_ids[note_id], "updated_at": now})
+                else:
+                    new_rows.append(row)
+            
+            bulk_upsert(db, LlmNoteDiagnosis, update_rows)
+            bulk_upsert(db, LlmNoteDiagnosis, new_rows)
+            db.commit()
+            info(f"批量存储诊断结果: 新增 {len(new_rows)} 条，更新 {len(update_rows)} 条")
+            return len(rows)
+            
+        except Exception as e:
+            db.rollback()
+            error(f"批量存储诊断结果时出错: {str(e)}")
+            return 0
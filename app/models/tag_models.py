@@ -1,5 +1,7 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Float, BigInteger
+from typing import List
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Float, BigInteger, UniqueConstraint
 from app.database.db import Base
 
 class TagStandard(Base):
@@ -15,6 +17,9 @@ class TagStandard(Base):
 class TagComparisonResult(Base):
     """标签对比结果模型"""
     __tablename__ = "tag_comparison_results"
+    __table_args__ = (
+        UniqueConstraint("note_id", "llm_name", "tag_type", "compare_model_name", name="uk_note_llm_type_model"),
+    )
     
     id = Column(BigInteger, primary_key=True, autoincrement=True, comment="自增主键")
     note_id = Column(String(64), nullable=False, comment="笔记ID")
@@ -32,4 +37,20 @@ class TagComparisonResult(Base):
     weighted_score = Column(Float(precision=3), nullable=False, comment="加权总分")
     interpretation = Column(String(64), nullable=False, comment="相似度解释")
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment="更新时间")
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment="更新时间")
+
+
+# Pydantic模型 - 用于API响应
+class StandardTagScore(BaseModel):
+    tag: str
+    score: float
+
+
+class NearestTagResponse(BaseModel):
+    tag: str
+    tag_type: str
+    canonical_tag: str
+    canonical_score: float
+    standard_tags: List[StandardTagScore]
+    encode_ms: float
+    lookup_ms: float
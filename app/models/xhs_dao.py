@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from app.models.xhs_models import (
     XhsAuther, XhsNote, XhsKeywordGroup, XhsKeywordGroupNote, XhsNoteDetailResponse,
     XhsSearchResponse, XhsNoteDetail, XhsComment, XhsCommentAtUser,
@@ -10,6 +10,7 @@ from datetime import datetime
 import json
 import traceback
 import uuid
+from app.database.bulk_upsert import bulk_upsert, chunked, DEFAULT_CHUNK_SIZE
 from app.utils.logger import get_logger, info, warning, error, debug
 from rich import print as rich_print
 
@@ -191,80 +192,23 @@ class XhsDAO:
     
     @staticmethod
     def store_search_results(db: Session, req_info: Dict[str, Any], search_response: XhsSearchResponse) -> List[XhsNote]:
-        """存储搜索结果数据，确保幂等性操作"""
-        stored_notes = []
+        """存储搜索结果数据，确保幂等性操作
         
+        作者、笔记、笔记详情和关键词关联分别用分块的 INSERT ... ON DUPLICATE KEY UPDATE 批量写入，
+        一次搜索结果只需要少量语句。已有的作者资料和笔记详情字段(简介、粉丝数、描述、互动数等)不会被搜索结果中的默认值覆盖。
+        """
         # 在开始前确保会话是干净的
         db.rollback()
         
         try:
-            # 1. 首先收集所有需要处理的note_ids和auther_ids
-            note_ids = [note.note_id for note in search_response.data]
-            auther_ids = [note.auther_user_id for note in search_response.data]
-            
-            info(f"开始处理 {len(note_ids)} 条笔记数据")
+            info(f"开始处理 {len(search_response.data)} 条笔记数据")
+            now = datetime.now()
             
-            # 2. 批量查询已存在的笔记和作者
-            existing_notes = {}
-            existing_authers = {}
-            
-            # 查询笔记
-            try:
-                existing_notes = {
-                    note.note_id: note 
-                    for note in db.query(XhsNote).filter(XhsNote.note_id.in_(note_ids)).all()
-                }
-                info(f"找到 {len(existing_notes)} 条已存在的笔记")
-            except Exception as e:
-                error(f"查询笔记信息时出错: {str(e)}")
+            # 1. 在内存中整理作者、笔记和笔记详情的行数据，按主键去重
+            auther_rows: Dict[str, Dict[str, Any]] = {}
+            note_rows: Dict[str, Dict[str, Any]] = {}
+            note_detail_rows: Dict[str, Dict[str, Any]] = {}
             
-            # 查询作者
-            try:
-                existing_authers = {
-                    auther.auther_user_id: auther 
-                    for auther in db.query(XhsAuther).filter(XhsAuther.auther_user_id.in_(auther_ids)).all()
-                }
-                info(f"找到 {len(existing_authers)} 个已存在的作者")
-            except Exception as e:
-                error(f"查询作者信息时出错: {str(e)}")
-                
-                # 尝试单独查询每个作者，以便找出问题所在
-                for auther_id in auther_ids:
-                    try:
-                        auther = db.query(XhsAuther).filter(XhsAuther.auther_user_id == auther_id).first()
-                        if auther:
-                            existing_authers[auther.auther_user_id] = auther
-                    except Exception as e2:
-                        error(f"查询单个作者 {auther_id} 时出错: {str(e2)}")
-            
-            # 3. 获取或创建关键词群组
-            keyword_group = None
-            existing_associations = set()
-            
-            keywords = [req_info.get("keywords")] if req_info.get("keywords") else []
-            if keywords:
-                # 确保关键词是字符串
-                # keywords = [str(k) for k in keywords if k]
-                try:
-                    keyword_group = XhsDAO.get_or_create_keyword_group(db, keywords)
-                    
-                    # 只有当关键词群组创建成功且有有效ID时才查询关联关系
-                    if keyword_group and keyword_group.group_id > 0:
-                        # 批量查询已存在的关联关系
-                        existing_associations = {
-                            note_id 
-                            for (note_id,) in db.query(XhsKeywordGroupNote.note_id).filter(
-                                XhsKeywordGroupNote.group_id == keyword_group.group_id,
-                                XhsKeywordGroupNote.note_id.in_(note_ids)
-                            ).all()
-                        }
-                        info(f"关键词群组: {keywords}, 已存在关联关系数量: {len(existing_associations)}")
-                except Exception as e:
-                    error(f"处理关键词群组时出错: {str(e)}")
-                    keyword_group = None
-                    existing_associations = set()
-            
-            # 4. 处理每个笔记
             for note_item in search_response.data:
                 try:
                     # 处理作者信息
@@ -280,24 +224,10 @@ class XhsDAO:
                         "auther_tags": None,
                         "auther_fans": 0,
                         "auther_follows": 0,
-                        "auther_gender": None
+                        "auther_gender": None,
+                        "updated_at": now
                     }
-                    
-                    # 获取或更新作者
-                    auther = existing_authers.get(note_item.auther_user_id)
-                    if auther:
-                        # 更新现有作者信息
-                        for key, value in auther_data.items():
-                            if hasattr(auther, key):
-                                setattr(auther, key, value)
-                        auther.updated_at = datetime.now()
-                        info(f"更新作者信息: {auther.auther_user_id}")
-                    else:
-                        # 创建新作者
-                        auther = XhsAuther(**auther_data)
-                        db.add(auther)
-                        existing_authers[auther.auther_user_id] = auther
-                        info(f"创建新作者: {auther.auther_user_id}")
+                    auther_rows[auther_data["auther_user_id"]] = auther_data
                     
                     # 准备笔记数据（确保数值类型正确）
                     note_data = {
@@ -318,36 +248,21 @@ class XhsDAO:
                         "auther_avatar": str(note_item.auther_avatar) if note_item.auther_avatar else "",
                         "auther_home_page_url": str(note_item.auther_home_page_url) if note_item.auther_home_page_url else ""
                     }
-                    
-                    # 获取或更新笔记
-                    note = existing_notes.get(note_item.note_id)
-                    if note:
-                        # 更新现有笔记
-                        for key, value in note_data.items():
-                            if hasattr(note, key):
-                                setattr(note, key, value)
-                        note.updated_at = datetime.now()
-                        info(f"更新笔记: {note.note_id}")
-                    else:
-                        # 创建新笔记
-                        note = XhsNote(**note_data)
-                        db.add(note)
-                        existing_notes[note.note_id] = note
-                        info(f"创建新笔记: {note.note_id}")
+                    note_rows[note_data["note_id"]] = note_data
                     
                     # 同步存储或更新笔记详情
-                    note_detail_data = {
-                        "note_id": note.note_id,
-                        "note_url": note.note_url,  # 从笔记中获取URL
-                        "auther_user_id": note.auther_user_id,
-                        "note_last_update_time": datetime.now(),
-                        "note_create_time": datetime.now(),
-                        "note_model_type": note.note_model_type,  # 从笔记中获取模型类型
-                        "note_card_type": note.note_card_type,  # 从笔记中获取卡片类型
-                        "note_display_title": note.note_display_title,  # 从笔记中获取标题
+                    note_detail_rows[note_data["note_id"]] = {
+                        "note_id": note_data["note_id"],
+                        "note_url": note_data["note_url"],  # 从笔记中获取URL
+                        "auther_user_id": note_data["auther_user_id"],
+                        "note_last_update_time": now,
+                        "note_create_time": now,
+                        "note_model_type": note_data["note_model_type"],  # 从笔记中获取模型类型
+                        "note_card_type": note_data["note_card_type"],  # 从笔记中获取卡片类型
+                        "note_display_title": note_data["note_display_title"],  # 从笔记中获取标题
                         "note_desc": None,
                         "comment_count": 0,
-                        "note_liked_count": note.note_liked_count,  # 从笔记中获取点赞数
+                        "note_liked_count": note_data["note_liked_count"],  # 从笔记中获取点赞数
                         "share_count": 0,
                         "collected_count": 0,
                         "video_id": None,
@@ -358,57 +273,54 @@ class XhsDAO:
                         "note_duration": None,
                         "note_image_list": None,
                         "note_tags": None,
-                        "note_liked": note.note_liked,  # 从笔记中获取是否点赞
-                        "collected": False
+                        "note_liked": note_data["note_liked"],  # 从笔记中获取是否点赞
+                        "collected": False,
+                        "updated_at": now
                     }
-
-                    # 获取或更新笔记详情
-                    note_detail = db.query(XhsNoteDetail).filter(XhsNoteDetail.note_id == note.note_id).first()
-                    if note_detail:
-                        # 更新现有笔记详情
-                        for key, value in note_detail_data.items():
-                            if hasattr(note_detail, key):
-                                setattr(note_detail, key, value)
-                        note_detail.updated_at = datetime.now()
-                        info(f"更新笔记详情: {note_detail.note_id}")
-                    else:
-                        # 创建新笔记详情
-                        note_detail = XhsNoteDetail(**note_detail_data)
-                        db.add(note_detail)
-                        info(f"创建新笔记详情: {note_detail.note_id}")
-
-                    stored_notes.append(note)
-                    
-                    # 处理关键词群组关联
-                    if keywords and keyword_group and keyword_group.group_id > 0 and note.note_id not in existing_associations:
-                        try:
-                            association = XhsKeywordGroupNote(
-                                note_id=note.note_id,
-                                group_id=keyword_group.group_id,  # 使用整数类型，不需要转换为字符串
-                                retrieved_at=datetime.now()
-                            )
-                            db.add(association)
-                            existing_associations.add(note.note_id)
-                            info(f"创建关键词关联: {note.note_id} -> {keywords}")
-                        except Exception as e:
-                            error(f"创建关键词关联时出错: {str(e)}")
                 
                 except Exception as e:
                     error(f"处理笔记时出错 {getattr(note_item, 'note_id', '未知')}: {str(e)}\n{''.join(traceback.format_tb(e.__traceback__))}")
                     continue
             
-            # 5. 提交事务
+            # 2. 获取或创建关键词群组，生成关联行
+            association_rows = []
+            keywords = [req_info.get("keywords")] if req_info.get("keywords") else []
+            if keywords:
+                try:
+                    keyword_group = XhsDAO.get_or_create_keyword_group(db, keywords)
+                    # 只有当关键词群组创建成功且有有效ID时才写入关联关系
+                    if keyword_group and keyword_group.group_id > 0:
+                        association_rows = [
+                            {"group_id": keyword_group.group_id, "note_id": note_id, "retrieved_at": now}
+                            for note_id in note_rows
+                        ]
+                except Exception as e:
+                    error(f"处理关键词群组时出错: {str(e)}")
+            
+            # 3. 批量写入并提交事务
             try:
-                # 每100条记录提交一次，避免事务过大
-                db.flush()
+                statements = 0
+                statements += bulk_upsert(
+                    db, XhsAuther, list(auther_rows.values()),
+                    update_columns=["auther_nick_name", "auther_avatar", "auther_home_page_url", "updated_at"]
+                )
+                statements += bulk_upsert(db, XhsNote, list(note_rows.values()))
+                statements += bulk_upsert(
+                    db, XhsNoteDetail, list(note_detail_rows.values()),
+                    update_columns=[
+                        "note_url", "auther_user_id", "note_model_type", "note_card_type",
+                        "note_display_title", "note_liked_count", "note_liked", "updated_at"
+                    ]
+                )
+                statements += bulk_upsert(db, XhsKeywordGroupNote, association_rows, update_columns=["retrieved_at"])
                 db.commit()
-                info(f"成功处理并存储 {len(stored_notes)} 条笔记数据")
+                info(f"成功处理并存储 {len(note_rows)} 条笔记数据，{len(auther_rows)} 个作者，{len(association_rows)} 条关键词关联，共 {statements} 条写入语句")
             except Exception as e:
                 db.rollback()
                 error_detail = f"提交事务时出错: {str(e)}\n{''.join(traceback.format_tb(e.__traceback__))}"
                 error(error_detail)
-                # 不抛出异常，而是返回已处理的笔记
-                warning("由于事务提交错误，可能有部分数据未能成功存储")
+                warning("由于事务提交错误，本次搜索结果未能成功存储")
+                return []
             
         except Exception as e:
             db.rollback()
@@ -416,15 +328,16 @@ class XhsDAO:
             error(f"存储过程中发生错误: {error_detail}")
             raise
         
-        return stored_notes
+        return [XhsNote(**note_data) for note_data in note_rows.values()]
 
     @staticmethod
-    def store_note_detail(db: Session, req_info: Dict[str, Any], note_detail_response: 'XhsNoteDetailResponse') -> XhsNote:
-        """存储笔记详情数据，确保幂等性操作"""
+    def store_note_detail(db: Session, req_info: Dict[str, Any], note_detail_response: 'XhsNoteDetailResponse', commit: bool = True) -> XhsNote:
+        """存储笔记详情数据，确保幂等性操作；commit为False时只flush不提交，由调用方统一提交"""
         
         
         # 在开始前确保会话是干净的
-        db.rollback()
+        if commit:
+            db.rollback()
         
         try:
             # 获取笔记详情数据
@@ -540,6 +453,10 @@ class XhsDAO:
                 db.add(note_detail)
                 info(f"创建新笔记详情: {note_detail.note_id}")
             
+            if not commit:
+                db.flush()
+                return note
+            
             # 提交事务
             try:
                 db.flush()
@@ -554,16 +471,50 @@ class XhsDAO:
                 return None
                 
         except Exception as e:
-            db.rollback()
+            if commit:
+                db.rollback()
             error_detail = f"{str(e)}\n{''.join(traceback.format_tb(e.__traceback__))}"
             error(f"存储笔记详情过程中发生错误: {error_detail}")
             raise 
 
     @staticmethod
-    def store_comments(db: Session, req_info: Dict[str, Any], comments_response: 'XhsCommentsResponse') -> List[XhsComment]:
-        """存储评论数据，确保幂等性操作"""
+    def store_note_details(db: Session, detail_responses: List[Tuple[Dict[str, Any], 'XhsNoteDetailResponse']]) -> List[XhsNote]:
+        """批量存储笔记详情，整批只提交一次，单条失败时回滚到保存点，不影响同批其他笔记"""
         
+        # 在开始前确保会话是干净的
+        db.rollback()
         
+        stored_notes = []
+        for req_info, note_detail_response in detail_responses:
+            savepoint = db.begin_nested()
+            try:
+                note = XhsDAO.store_note_detail(db, req_info, note_detail_response, commit=False)
+                savepoint.commit()
+                if note:
+                    stored_notes.append(note)
+            except Exception as e:
+                savepoint.rollback()
+                error(f"批量存储笔记详情时跳过 {req_info.get('noteUrl', '未知')}: {str(e)}")
+        
+        # 提交事务
+        try:
+            db.commit()
+            info(f"成功批量存储 {len(stored_notes)}/{len(detail_responses)} 条笔记详情数据")
+            return stored_notes
+        except Exception as e:
+            db.rollback()
+            error_detail = f"提交事务时出错: {str(e)}\n{''.join(traceback.format_tb(e.__traceback__))}"
+            error(error_detail)
+            warning("由于事务提交错误，本批笔记详情未能成功存储")
+            return []
+
+    @staticmethod
+    def store_comments(db: Session, req_info: Dict[str, Any], comments_response: 'XhsCommentsResponse') -> List[XhsComment]:
+        """存储评论数据，确保幂等性操作
+        
+        先在内存中展开评论树(主评论及各级子评论)，一次查询取出这些评论下已有的@用户记录，
+        然后在同一个事务中用分块的多行 upsert 写入评论和@用户关系。
+        """
         # 在开始前确保会话是干净的
         db.rollback()
         
@@ -576,75 +527,75 @@ class XhsDAO:
                 return []
                 
             info(f"开始处理评论数据，共 {len(comments_data)} 条评论")
+            now = datetime.now()
             
-            # 收集所有评论ID和用户ID
-            comment_ids = []
-            user_ids = []
-            
-            for comment in comments_data:
-                comment_ids.append(comment.comment_id)
-                user_ids.append(comment.comment_user_id)
-                
-                # 收集子评论的ID和用户ID
-                for sub_comment in comment.comment_sub:
-                    comment_ids.append(sub_comment.comment_id)
-                    user_ids.append(sub_comment.comment_user_id)
-            
-            # 去重
-            comment_ids = list(set(comment_ids))
-            user_ids = list(set(user_ids))
-            
-            info(f"共有 {len(comment_ids)} 条不重复评论，{len(user_ids)} 个不重复用户")
-            
-            # 查询已存在的评论
-            existing_comments = {
-                comment.comment_id: comment 
-                for comment in db.query(XhsComment).filter(XhsComment.comment_id.in_(comment_ids)).all()
-            }
-            
-            info(f"找到 {len(existing_comments)} 条已存在的评论")
-            
-            # 存储评论数据
-            stored_comments = []
+            # 1. 展开评论树，按评论ID去重，同时收集@用户；各级子评论的 parent_comment_id 均为所属的主评论ID
+            comment_rows: Dict[str, Dict[str, Any]] = {}
+            at_user_items: Dict[Tuple[str, str], 'XhsCommentAtUserItem'] = {}
+            top_comment_ids: List[str] = []
             
             for comment_item in comments_data:
-                try:
-                    # 处理主评论
-                    comment = XhsDAO._process_comment(db, comment_item, existing_comments)
-                    
-                    # 处理@用户
-                    if comment_item.comment_at_users:
-                        for at_user in comment_item.comment_at_users:
-                            XhsDAO._process_comment_at_user(db, comment.comment_id, at_user)
-                    
-                    # 处理子评论
-                    if comment_item.comment_sub:
-                        for sub_comment_item in comment_item.comment_sub:
-                            sub_comment = XhsDAO._process_comment(db, sub_comment_item, existing_comments, parent_id=comment.comment_id)
-                            
-                            # 处理子评论的@用户
-                            if sub_comment_item.comment_at_users:
-                                for at_user in sub_comment_item.comment_at_users:
-                                    XhsDAO._process_comment_at_user(db, sub_comment.comment_id, at_user)
-                    
-                    stored_comments.append(comment)
-                    
-                except Exception as e:
-                    error(f"处理评论时出错 {comment_item.comment_id}: {str(e)}")
-                    continue
+                stack = [(comment_item, None)]
+                while stack:
+                    item, root_id = stack.pop()
+                    try:
+                        comment_rows[item.comment_id] = XhsDAO._build_comment_row(item, root_id, now)
+                        for at_user in item.comment_at_users or []:
+                            at_user_items[(item.comment_id, at_user.at_user_id)] = at_user
+                        for sub_item in item.comment_sub or []:
+                            stack.append((sub_item, root_id or item.comment_id))
+                    except Exception as e:
+                        error(f"处理评论时出错 {item.comment_id}: {str(e)}")
+                        continue
+                if comment_item.comment_id in comment_rows:
+                    top_comment_ids.append(comment_item.comment_id)
+            
+            comment_ids = list(comment_rows.keys())
+            info(f"共有 {len(comment_ids)} 条不重复评论，{len(at_user_items)} 条@用户关系")
+            
+            # 2. 一次查询取出已存在的@用户关系
+            existing_at_users: Dict[Tuple[str, str], int] = {}
+            if at_user_items:
+                for comment_ids_chunk in chunked(comment_ids, DEFAULT_CHUNK_SIZE):
+                    for row_id, comment_id, at_user_id in db.query(
+                        XhsCommentAtUser.id, XhsCommentAtUser.comment_id, XhsCommentAtUser.at_user_id
+                    ).filter(XhsCommentAtUser.comment_id.in_(comment_ids_chunk)).all():
+                        existing_at_users[(comment_id, at_user_id)] = row_id
+            
+            new_at_user_rows = []
+            update_at_user_rows = []
+            for key, at_user in at_user_items.items():
+                row = {
+                    "comment_id": key[0],
+                    "at_user_id": key[1],
+                    "at_user_nickname": at_user.at_user_nickname,
+                    "at_user_home_page_url": at_user.at_user_home_page_url
+                }
+                if key in existing_at_users:
+                    row["id"] = existing_at_users[key]
+                    update_at_user_rows.append(row)
+                else:
+                    new_at_user_rows.append(row)
             
-            # 提交事务
+            # 3. 批量写入并提交事务
             try:
-                db.flush()
+                bulk_upsert(db, XhsComment, list(comment_rows.values()))
+                # xhs_comment_at_users 没有唯一键，已有记录按主键更新，新记录直接插入
+                bulk_upsert(
+                    db, XhsCommentAtUser, update_at_user_rows,
+                    update_columns=["at_user_nickname", "at_user_home_page_url"]
+                )
+                bulk_upsert(db, XhsCommentAtUser, new_at_user_rows)
                 db.commit()
-                info(f"成功处理并存储 {len(stored_comments)} 条评论数据")
+                info(f"成功处理并存储 {len(comment_rows)} 条评论数据，新增 {len(new_at_user_rows)} 条、更新 {len(update_at_user_rows)} 条@用户关系")
             except Exception as e:
                 db.rollback()
                 error_detail = f"提交事务时出错: {str(e)}\n{''.join(traceback.format_tb(e.__traceback__))}"
                 error(error_detail)
-                warning("由于事务提交错误，可能有部分数据未能成功存储")
+                warning("由于事务提交错误，本次评论数据未能成功存储")
+                return []
             
-            return stored_comments
+            return [XhsComment(**comment_rows[comment_id]) for comment_id in top_comment_ids]
             
         except Exception as e:
             db.rollback()
@@ -653,12 +604,8 @@ class XhsDAO:
             raise
     
     @staticmethod
-    def _process_comment(db: Session, comment_item: 'XhsCommentItem', existing_comments: Dict[str, XhsComment], parent_id: Optional[str] = None) -> XhsComment:
-        """处理单条评论数据"""
-        
-        
-        # 检查评论是否已存在
-        comment = existing_comments.get(comment_item.comment_id)
+    def _build_comment_row(comment_item: Any, parent_id: Optional[str], now: datetime) -> Dict[str, Any]:
+        """将单条评论(或子评论)转换为待写入的行数据"""
         
         # 转换评论创建时间
         comment_create_time = None
@@ -667,9 +614,9 @@ class XhsDAO:
                 comment_create_time = datetime.strptime(comment_item.comment_create_time, "%Y-%m-%d %H:%M:%S")
             except Exception as e:
                 warning(f"解析评论创建时间出错: {str(e)}")
-                comment_create_time = datetime.now()
+                comment_create_time = now
         else:
-            comment_create_time = datetime.now()
+            comment_create_time = now
         
         # 转换评论标签
         comment_show_tags = None
@@ -679,85 +626,32 @@ class XhsDAO:
             except Exception as e:
                 warning(f"转换评论标签出错: {str(e)}")
         
-        if not comment:
-            # 创建新评论
-            comment = XhsComment(
-                comment_id=comment_item.comment_id,
-                note_id=comment_item.note_id,
-                parent_comment_id=parent_id,
-                comment_user_id=comment_item.comment_user_id,
-                comment_user_image=comment_item.comment_user_image,
-                comment_user_nickname=comment_item.comment_user_nickname,
-                comment_user_home_page_url=comment_item.comment_user_home_page_url,
-                comment_content=comment_item.comment_content,
-                comment_like_count=int(comment_item.comment_like_count) if comment_item.comment_like_count and str(comment_item.comment_like_count).isdigit() else 0,
-                comment_sub_comment_count=int(comment_item.comment_sub_comment_count) if comment_item.comment_sub_comment_count and str(comment_item.comment_sub_comment_count).isdigit() else 0,
-                comment_create_time=comment_create_time,
-                comment_liked=comment_item.comment_liked,
-                comment_show_tags=comment_show_tags,
-                comment_sub_comment_cursor=comment_item.comment_sub_comment_cursor,
-                comment_sub_comment_has_more=comment_item.comment_sub_comment_has_more
-            )
-            db.add(comment)
-            db.flush()
-            existing_comments[comment.comment_id] = comment
-            info(f"创建新评论: {comment.comment_id}")
-        else:
-            # 更新现有评论
-            comment.note_id = comment_item.note_id
-            comment.parent_comment_id = parent_id
-            comment.comment_user_id = comment_item.comment_user_id
-            comment.comment_user_image = comment_item.comment_user_image
-            comment.comment_user_nickname = comment_item.comment_user_nickname
-            comment.comment_user_home_page_url = comment_item.comment_user_home_page_url
-            comment.comment_content = comment_item.comment_content
-            comment.comment_like_count = int(comment_item.comment_like_count) if comment_item.comment_like_count and str(comment_item.comment_like_count).isdigit() else 0
-            comment.comment_sub_comment_count = int(comment_item.comment_sub_comment_count) if comment_item.comment_sub_comment_count and str(comment_item.comment_sub_comment_count).isdigit() else 0
-            comment.comment_create_time = comment_create_time
-            comment.comment_liked = comment_item.comment_liked
-            comment.comment_show_tags = comment_show_tags
-            comment.comment_sub_comment_cursor = comment_item.comment_sub_comment_cursor
-            comment.comment_sub_comment_has_more = comment_item.comment_sub_comment_has_more
-            comment.updated_at = datetime.now()
-            info(f"更新评论: {comment.comment_id}")
-        
-        return comment
-    
-    @staticmethod
-    def _process_comment_at_user(db: Session, comment_id: str, at_user_item: 'XhsCommentAtUserItem') -> XhsCommentAtUser:
-        """处理评论@用户数据"""
-        
-        
-        # 检查@用户关系是否已存在
-        at_user = db.query(XhsCommentAtUser).filter(
-            XhsCommentAtUser.comment_id == comment_id,
-            XhsCommentAtUser.at_user_id == at_user_item.at_user_id
-        ).first()
-        
-        if not at_user:
-            # 创建新的@用户关系
-            at_user = XhsCommentAtUser(
-                comment_id=comment_id,
-                at_user_id=at_user_item.at_user_id,
-                at_user_nickname=at_user_item.at_user_nickname,
-                at_user_home_page_url=at_user_item.at_user_home_page_url
-            )
-            db.add(at_user)
-            db.flush()
-            info(f"创建新的@用户关系: {comment_id} -> {at_user_item.at_user_id}")
-        else:
-            # 更新现有@用户关系
-            at_user.at_user_nickname = at_user_item.at_user_nickname
-            at_user.at_user_home_page_url = at_user_item.at_user_home_page_url
-            info(f"更新@用户关系: {comment_id} -> {at_user_item.at_user_id}")
-        
-        return at_user 
+        return {
+            "comment_id": comment_item.comment_id,
+            "note_id": comment_item.note_id,
+            "parent_comment_id": parent_id,
+            "comment_user_id": comment_item.comment_user_id,
+            "comment_user_image": comment_item.comment_user_image,
+            "comment_user_nickname": comment_item.comment_user_nickname,
+            "comment_user_home_page_url": comment_item.comment_user_home_page_url,
+            "comment_content": comment_item.comment_content,
+            "comment_like_count": int(comment_item.comment_like_count) if comment_item.comment_like_count and str(comment_item.comment_like_count).isdigit() else 0,
+            "comment_sub_comment_count": int(comment_item.comment_sub_comment_count) if comment_item.comment_sub_comment_count and str(comment_item.comment_sub_comment_count).isdigit() else 0,
+            "comment_create_time": comment_create_time,
+            "comment_liked": comment_item.comment_liked,
+            "comment_show_tags": comment_show_tags,
+            "comment_sub_comment_cursor": comment_item.comment_sub_comment_cursor,
+            "comment_sub_comment_has_more": comment_item.comment_sub_comment_has_more,
+            "updated_at": now
+        }
 
     @staticmethod
     def store_auther_notes(db: Session, req_info: Dict[str, Any], auther_notes_response: 'XhsAutherNotesResponse') -> List[XhsNote]:
-        """存储作者笔记数据，确保幂等性操作"""
-        
+        """存储作者笔记数据，确保幂等性操作
         
+        用一次 IN 查询区分新增和已有的笔记，然后将作者和全部笔记分块批量 upsert，
+        语句数量与笔记数量无关(每块一条)。
+        """
         # 在开始前确保会话是干净的
         db.rollback()
         
@@ -771,6 +665,7 @@ class XhsDAO:
                 return []
                 
             info(f"开始处理作者笔记数据，作者ID: {auther_info.user_id}, 笔记数量: {len(notes_data)}")
+            now = datetime.now()
             
             # 处理作者信息
             auther_data = {
@@ -785,14 +680,12 @@ class XhsDAO:
                 "auther_tags": json.dumps(auther_info.tags, ensure_ascii=False) if auther_info.tags else None,
                 "auther_fans": int(auther_info.fans) if auther_info.fans and str(auther_info.fans).isdigit() else 0,
                 "auther_follows": int(auther_info.follows) if auther_info.follows and str(auther_info.follows).isdigit() else 0,
-                "auther_gender": str(auther_info.gender) if auther_info.gender else None
+                "auther_gender": str(auther_info.gender) if auther_info.gender else None,
+                "updated_at": now
             }
             
-            # 获取或更新作者
-            auther = XhsDAO.get_or_create_auther(db, auther_data)
-            
-            # 处理笔记数据
-            stored_notes = []
+            # 处理笔记数据，按笔记ID去重
+            note_rows: Dict[str, Dict[str, Any]] = {}
             
             for note_item in notes_data:
                 try:
@@ -813,28 +706,37 @@ class XhsDAO:
                         "note_model_type": str(note_item.note_model_type) if note_item.note_model_type else "",
                         "auther_nick_name": str(auther_info.nick_name) if auther_info.nick_name else "",
                         "auther_avatar": str(auther_info.avatar) if auther_info.avatar else "",
-                        "auther_home_page_url": str(auther_info.user_link_url) if auther_info.user_link_url else ""
+                        "auther_home_page_url": str(auther_info.user_link_url) if auther_info.user_link_url else "",
+                        "updated_at": now
                     }
-                    
-                    # 获取或更新笔记
-                    note = XhsDAO.get_or_create_note(db, note_data)
-                    stored_notes.append(note)
+                    note_rows[note_data["note_id"]] = note_data
                     
                 except Exception as e:
                     error(f"处理笔记时出错 {note_item.note_id}: {str(e)}")
                     continue
             
+            # 一次查询区分新增和已有的笔记
+            existing_note_ids = set()
+            for note_ids_chunk in chunked(list(note_rows.keys()), DEFAULT_CHUNK_SIZE):
+                existing_note_ids.update(
+                    note_id for (note_id,) in db.query(XhsNote.note_id).filter(XhsNote.note_id.in_(note_ids_chunk)).all()
+                )
+            updated_count = len(existing_note_ids)
+            inserted_count = len(note_rows) - updated_count
+            
             # 提交事务
             try:
-                db.flush()
+                bulk_upsert(db, XhsAuther, [auther_data])
+                statements = bulk_upsert(db, XhsNote, list(note_rows.values()))
                 db.commit()
-                info(f"成功处理并存储作者笔记数据，作者ID: {auther_info.user_id}, 存储笔记数: {len(stored_notes)}")
-                return stored_notes
+                info(f"成功处理并存储作者笔记数据，作者ID: {auther_info.user_id}, 存储笔记数: {len(note_rows)}"
+                     f"(新增 {inserted_count}，更新 {updated_count})，写入语句 {statements} 条")
+                return [XhsNote(**note_data) for note_data in note_rows.values()]
             except Exception as e:
                 db.rollback()
                 error_detail = f"提交事务时出错: {str(e)}\n{''.join(traceback.format_tb(e.__traceback__))}"
                 error(error_detail)
-                warning("由于事务提交错误，可能有部分数据未能成功存储")
+                warning("由于事务提交错误，本次作者笔记数据未能成功存储")
                 return []
                 
         except Exception as e:
@@ -845,7 +747,11 @@ class XhsDAO:
 
     @staticmethod
     def store_topics(db: Session, req_info: Dict[str, Any], topics_response: XhsTopicsResponse) -> List[XhsTopicDiscussion]:
-        """存储话题数据，确保幂等性操作"""
+        """
+        存储话题数据，确保幂等性操作
+
+        话题浏览量按日期记录，默认记到当天；回放历史响应时由 req_info["record_date"] 指定响应实际采集的日期。
+        """
         
         
         # 在开始前确保会话是干净的
@@ -861,8 +767,8 @@ class XhsDAO:
             
             info(f"开始处理话题数据，共 {len(topics_data)} 个话题")
             
-            # 获取当前日期（只保留到日期部分）
-            current_date = datetime.now().date()
+            # 获取记录日期（只保留到日期部分），未指定时为当天
+            current_date = req_info.get("record_date") or datetime.now().date()
             
             # 收集所有话题名称
             topic_names = [topic.name for topic in topics_data]
@@ -0,0 +1,131 @@
+import asyncio
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+from app.config.settings import settings
+from app.services.rate_limiter import AdaptiveTokenBucket
+from app.utils.json_utils import json_loads
+from app.utils.logger import get_logger, info, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+
+class CozeClient:
+    """
+    Coze工作流异步客户端
+
+    内部持有一个带keep-alive连接池的aiohttp会话，并用信号量限制同时在途的工作流数量，
+    多个采集任务可以共享同一个客户端并发调用工作流。rate_limiter 为所有调用方共享的自适应令牌桶，
+    其学习到的速率在重建连接池后依然保留。
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_token: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        """
+        初始化Coze客户端
+
+        Args:
+            base_url: Coze API地址，默认读取配置 COZE_API_BASE_URL
+            api_token: Coze API令牌，默认读取配置 COZE_API_TOKEN
+            max_concurrency: 最大并发工作流数量，默认读取配置 COZE_MAX_CONCURRENCY
+            timeout: 单次请求超时时间(秒)，默认读取配置 COZE_REQUEST_TIMEOUT
+        """
+        self.base_url = (base_url or settings.COZE_API_BASE_URL).rstrip("/")
+        self.api_token = api_token or settings.COZE_API_TOKEN
+        self.max_concurrency = max_concurrency or settings.COZE_MAX_CONCURRENCY
+        self.timeout = timeout or settings.COZE_REQUEST_TIMEOUT
+        self.rate_limiter = AdaptiveTokenBucket(rate_per_minute=settings.COZE_RATE_LIMIT_PER_MINUTE)
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __aenter__(self) -> "CozeClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """
+        获取当前事件循环上的会话，不存在或已切换事件循环时重新创建
+
+        切换事件循环时先关闭旧会话，避免旧连接池中的keep-alive连接泄漏；旧事件循环仍在其他线程运行时
+        说明客户端被多个事件循环同时使用，关闭会中断对方在途的请求，直接抛出异常。
+
+        Raises:
+            RuntimeError: 旧会话所在的事件循环仍在运行
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is not loop:
+            if self._loop is not None and not self._loop.is_closed() and self._loop.is_running():
+                raise RuntimeError("Coze客户端正在被另一个事件循环使用，不能在多个事件循环之间共享")
+            info("事件循环已切换，关闭旧的Coze连接池")
+            # 先摘下旧会话再等待关闭，等待期间其他请求直接创建新会话，不会被关闭流程覆盖
+            old_session, self._session = self._session, None
+            try:
+                await old_session.close()
+            except Exception as e:
+                error(f"关闭旧的Coze连接池失败: {e}")
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "Authorization": f"Bearer {self.api_token}",
+                    "Content-Type": "application/json",
+                },
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+            info(f"创建Coze连接池，最大并发: {self.max_concurrency}")
+        return self._session
+
+    async def run_workflow(self, workflow_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        运行Coze工作流
+
+        Args:
+            workflow_id: 工作流ID
+            parameters: 工作流参数
+
+        Returns:
+            API响应结果
+
+        Raises:
+            aiohttp.ClientError: 网络请求失败或HTTP状态码异常
+        """
+        session = await self._ensure_session()
+        payload = {
+            "parameters": parameters,
+            "workflow_id": workflow_id
+        }
+
+        async with self._semaphore:
+            async with session.post(f"{self.base_url}/v1/workflow/run", json=payload) as response:
+                response.raise_for_status()
+                # 只读取一次响应体，直接对字节串解析，省去一次解码和拷贝
+                body = await response.read()
+        return json_loads(body)
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            try:
+                await self._session.close()
+            except Exception as e:
+                error(f"关闭Coze连接池失败: {e}")
+        self._session = None
+        self._semaphore = None
+        self._loop = None
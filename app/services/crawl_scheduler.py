@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import random
+import time
+import traceback
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
+
+from app.services.rate_limiter import AdaptiveTokenBucket
+from app.utils.logger import get_logger, info, warning, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+
+class CrawlCheckpoint:
+    """采集进度存储，以JSON文件形式保存在 logs/crawl_state 目录下"""
+
+    def __init__(self, name: str, checkpoint_dir: str = "logs/crawl_state"):
+        """
+        初始化进度存储
+
+        Args:
+            name: 任务名称，用作文件名
+            checkpoint_dir: 进度文件目录
+        """
+        self.path = os.path.join(checkpoint_dir, f"{name}.json")
+
+    def load(self) -> Dict[str, Any]:
+        """读取进度，不存在或损坏时返回空字典"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            warning(f"读取采集进度失败，将从头开始: {self.path} - {e}")
+            return {}
+
+    def save(self, state: Dict[str, Any]) -> None:
+        """保存进度，先写临时文件再替换，避免中途退出导致文件损坏"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        """删除进度文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CrawlScheduler:
+    """
+    并发采集调度器
+
+    将任务放入工作队列，由多个worker并发处理。所有worker共享一个令牌桶作为全局速率预算，
+    每个worker处理完任务后按礼貌策略随机等待一段时间。已完成的任务记录在进度文件中，
+    重启后会跳过，全部成功后清除进度。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        worker_count: int = 3,
+        rate_per_minute: float = 6,
+        min_delay: float = 0,
+        max_delay: float = 0,
+        resume: bool = True,
+    ):
+        """
+        初始化调度器
+
+        Args:
+            name: 任务名称，用于进度文件和日志
+            worker_count: 并发worker数量
+            rate_per_minute: 全局每分钟最多开始的任务数
+            min_delay: 每个worker两次任务之间的最小等待时间(秒)
+            max_delay: 每个worker两次任务之间的最大等待时间(秒)
+            resume: 是否从上次的进度继续
+        """
+        self.name = name
+        self.worker_count = max(1, worker_count)
+        self.rate_limiter = AdaptiveTokenBucket(
+            rate_per_minute=rate_per_minute,
+            max_rate_per_minute=rate_per_minute,
+        )
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.resume = resume
+        self.checkpoint = CrawlCheckpoint(name)
+
+    async def run(self, tasks: List[Tuple[str, Any]], handler: Callable[[Any], Awaitable[int]]) -> List[Dict[str, Any]]:
+        """
+        执行任务
+
+        Args:
+            tasks: 任务列表，每项为 (任务唯一键, 任务参数)
+            handler: 处理单个任务的协程函数，返回本次任务的产出数量
+
+        Returns:
+            本次执行的任务统计列表，每项包含 key、status、latency、yield
+        """
+        state = self.checkpoint.load() if self.resume else {}
+        done: Dict[str, Any] = state.get("done", {})
+
+        queue: asyncio.Queue = asyncio.Queue()
+        skipped = 0
+        for key, payload in tasks:
+            if key in done:
+                skipped += 1
+                continue
+            queue.put_nowait((key, payload))
+
+        if skipped:
+            info(f"[{self.name}] 从上次进度继续，跳过 {skipped} 个已完成的任务")
+        info(f"[{self.name}] 共 {queue.qsize()} 个待处理任务，worker数量: {self.worker_count}")
+
+        stats: List[Dict[str, Any]] = []
+
+        async def worker(worker_id: int):
+            while True:
+                try:
+                    key, payload = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                await self.rate_limiter.acquire()
+                started_at = time.monotonic()
+                try:
+                    yield_count = await handler(payload)
+                    latency = time.monotonic() - started_at
+                    stat = {"key": key, "status": "done", "latency": round(latency, 2), "yield": yield_count}
+                    done[key] = {"latency": stat["latency"], "yield": yield_count}
+                    self.checkpoint.save({"done": done})
+                    info(f"[{self.name}] worker-{worker_id} 完成 '{key}'，耗时 {latency:.1f} 秒，产出 {yield_count} 条")
+                except Exception as e:
+                    latency = time.monotonic() - started_at
+                    stat = {"key": key, "status": "failed", "latency": round(latency, 2), "yield": 0}
+                    error(f"[{self.name}] worker-{worker_id} 处理 '{key}' 出错: {e}")
+                    error(traceback.format_exc())
+                stats.append(stat)
+
+                if self.max_delay > 0 and not queue.empty():
+                    await asyncio.sleep(random.uniform(self.min_delay, self.max_delay))
+
+        await asyncio.gather(*(worker(i) for i in range(self.worker_count)))
+
+        failed = [stat for stat in stats if stat["status"] == "failed"]
+        if failed:
+            warning(f"[{self.name}] {len(failed)} 个任务失败，进度已保存，重新运行将只处理未完成的任务")
+        else:
+            self.checkpoint.clear()
+
+        self.report(stats)
+        return stats
+
+    def report(self, stats: List[Dict[str, Any]]) -> None:
+        """输出任务统计"""
+        if not stats:
+            return
+        total_yield = sum(stat["yield"] for stat in stats)
+        total_latency = sum(stat["latency"] for stat in stats)
+        info(f"[{self.name}] 统计: 完成 {len(stats)} 个任务，产出 {total_yield} 条，平均耗时 {total_latency / len(stats):.1f} 秒")
+        for stat in sorted(stats, key=lambda s: s["latency"], reverse=True):
+            info(f"  - {stat['key']}: {stat['status']}，耗时 {stat['latency']:.1f} 秒，产出 {stat['yield']} 条")
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from app.config.settings import settings
+from app.utils.logger import get_logger, info, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+# 每写入多少条执行一次过期和容量淘汰
+EVICT_EVERY_PUTS = 100
+
+
+class LlmResponseCache:
+    """
+    LLM响应持久化缓存
+
+    以 (模型别名, 提示词版本, 笔记内容哈希) 为键保存模型返回的文本，存储在本地SQLite文件中。
+    超过有效期的记录会被删除，记录数超过上限时按最近访问时间淘汰最旧的记录。
+    命中/未命中次数在进程内统计。
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_days: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite文件路径，默认读取配置 LLM_CACHE_PATH
+            ttl_days: 有效期(天)，默认读取配置 LLM_CACHE_TTL_DAYS
+            max_entries: 最大记录数，默认读取配置 LLM_CACHE_MAX_ENTRIES
+        """
+        self.path = path or settings.LLM_CACHE_PATH
+        self.ttl_seconds = (ttl_days if ttl_days is not None else settings.LLM_CACHE_TTL_DAYS) * 86400
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        # 请求在多个线程中执行，共用一个连接并用锁串行化
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_response_cache (
+                cache_key TEXT PRIMARY KEY,
+                llm_alias TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON llm_response_cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        """计算笔记内容的哈希"""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(llm_alias: str, prompt_version: str, content: str) -> str:
+        """生成缓存键"""
+        return f"{llm_alias}|{prompt_version}|{LlmResponseCache.content_hash(content)}"
+
+    def get(self, llm_alias: str, prompt_version: str, content: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            llm_alias: 模型别名
+            prompt_version: 提示词版本
+            content: 笔记内容
+
+        Returns:
+            缓存的响应文本，未命中或已过期时返回None
+        """
+        key = self.make_key(llm_alias, prompt_version, content)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_response_cache SET accessed_at = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, llm_alias: str, prompt_version: str, content: str, response: str) -> None:
+        """
+        写入缓存
+
+        Args:
+            llm_alias: 模型别名
+            prompt_version: 提示词版本
+            content: 笔记内容
+            response: 模型返回的文本
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache "
+                "(cache_key, llm_alias, prompt_version, content_hash, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.make_key(llm_alias, prompt_version, content), llm_alias, prompt_version,
+                 self.content_hash(content), response, now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % EVICT_EVERY_PUTS == 0:
+                self._evict(now)
+
+    def delete(self, llm_alias: str, prompt_version: str, content: str) -> None:
+        """删除一条缓存，用于响应无法解析等情况"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM llm_response_cache WHERE cache_key = ?", (self.make_key(llm_alias, prompt_version, content),)
+            )
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """删除过期记录，并在超过容量时按最近访问时间删除最旧的记录(调用方需持有锁)"""
+        try:
+            self._conn.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_response_cache WHERE cache_key IN "
+                    "(SELECT cache_key FROM llm_response_cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+        except Exception as e:
+            error(f"清理LLM响应缓存失败: {e}")
+
+    def evict(self) -> None:
+        """立即执行过期和容量淘汰"""
+        with self._lock:
+            self._evict(time.time())
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_response_cache")
+            self._conn.commit()
+        info(f"已清空LLM响应缓存: {self.path}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            包含记录数、本进程命中/未命中次数和命中率的字典
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -1,19 +1,107 @@
+import asyncio
 import datetime
+import hashlib
 import json
 import os
+import threading
+import uuid
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Callable, TYPE_CHECKING
 from datetime import datetime
 from app.models.llm_dao import LlmDAO
 from app.database.db import get_db
-from app.utils.logger import get_logger, info, error
-from openai import OpenAI
+from app.services.llm_cache import LlmResponseCache
+from app.services.rate_limiter import AdaptiveTokenBucket, backoff_delay
+from app.utils.logger import get_logger, info, warning, error
 from app.config.settings import settings
 
+# openai、httpx 导入较慢，只在创建客户端或请求模型时导入
+if TYPE_CHECKING:
+    from openai import OpenAI
+
 logger = get_logger(__name__)
 
+# 提取笔记标签使用的系统提示词
+PROMPT_FILE = "docs/prompt/coze_make_tag_from_notes_v0.2.md"
+
+# 批量提取时追加在系统提示词后的说明
+BATCH_PROMPT_FILE = "docs/prompt/coze_make_tag_from_notes_batch_v0.1.md"
+
+
+def get_retryable_errors() -> Tuple[type, ...]:
+    """可以退避重试的异常：限流、超时、连接失败和服务端错误"""
+    from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    return RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+
 class LlmService:
     """LLM服务类"""
+    # 每个模型别名的并发信号量和令牌桶
+    _alias_semaphores: Dict[str, asyncio.Semaphore] = {}
+    _semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+    _alias_rate_limiters: Dict[str, AdaptiveTokenBucket] = {}
+    # 每个模型别名共享的客户端: {llm_alias: (client, model_name)}
+    _clients: Dict[str, Tuple["OpenAI", str]] = {}
+    _clients_lock = threading.Lock()
+    # 提示词缓存: {文件路径: (修改时间, 内容, 版本)}
+    _prompt_cache: Dict[str, Tuple[int, str, str]] = {}
+    _response_cache: Optional[LlmResponseCache] = None
+    
+    @staticmethod
+    def get_alias_concurrency(llm_alias: str) -> int:
+        """
+        获取模型别名的并发上限，优先读取 LLM_ALIAS_CONCURRENCY 中的单独配置
+        
+        Args:
+            llm_alias: 模型别名
+            
+        Returns:
+            并发上限
+        """
+        for item in settings.LLM_ALIAS_CONCURRENCY.split(","):
+            alias, _, value = item.strip().rpartition("=")
+            if alias == llm_alias and value.isdigit():
+                return max(1, int(value))
+        return max(1, settings.LLM_MAX_CONCURRENCY)
+    
+    @staticmethod
+    def _get_alias_semaphore(llm_alias: str, concurrency: Optional[int] = None) -> asyncio.Semaphore:
+        """获取当前事件循环上模型别名对应的信号量，切换事件循环后重新创建"""
+        loop = asyncio.get_running_loop()
+        if LlmService._semaphore_loop is not loop:
+            LlmService._alias_semaphores = {}
+            LlmService._semaphore_loop = loop
+        if llm_alias not in LlmService._alias_semaphores:
+            LlmService._alias_semaphores[llm_alias] = asyncio.Semaphore(concurrency or LlmService.get_alias_concurrency(llm_alias))
+        return LlmService._alias_semaphores[llm_alias]
+    
+    @staticmethod
+    def _get_alias_rate_limiter(llm_alias: str) -> AdaptiveTokenBucket:
+        """获取模型别名对应的令牌桶，限流后学习到的速率在整个进程内保留"""
+        if llm_alias not in LlmService._alias_rate_limiters:
+            LlmService._alias_rate_limiters[llm_alias] = AdaptiveTokenBucket(rate_per_minute=settings.LLM_RATE_LIMIT_PER_MINUTE)
+        return LlmService._alias_rate_limiters[llm_alias]
+    
+    @staticmethod
+    def store_note_diagnoses(llm_alias: str, diagnoses: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        批量存储笔记诊断结果
+        
+        Args:
+            llm_alias: 模型名称
+            diagnoses: (笔记ID, 诊断数据) 列表
+            
+        Returns:
+            成功写入的记录数量
+        """
+        db = next(get_db())
+        try:
+            return LlmDAO.store_note_diagnoses(db=db, llm_name=llm_alias, diagnoses=diagnoses)
+        except Exception as e:
+            error(f"批量存储笔记诊断结果时出错: {str(e)}")
+            return 0
+        finally:
+            db.close()
     
     @staticmethod
     def store_note_diagnosis(note_id: str, llm_alias: str, diagnosis_data: Dict[str, Any]) -> bool:
@@ -46,28 +134,157 @@ class LlmService:
             return False
         
     @staticmethod
-    def request_llm(llm_alias: str, prompt: str, log_file_prefix: str):
+    def _resolve_model(llm_alias: str) -> Tuple[str, str, str]:
+        """根据模型别名获取 (api_key, model_name, base_url)"""
+        if (llm_alias == "qwen-max:coze"):
+            # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+            return settings.QWEN_MODEL_API_KEY, settings.QWEN_MODEL_NAME, settings.QWEN_MODEL_BASE_URL
+        return settings.MODEL_API_KEY, settings.MODEL_NAME, settings.MODEL_BASE_URL
+    
+    @staticmethod
+    def get_client(llm_alias: str) -> Tuple["OpenAI", str]:
+        """
+        获取模型别名对应的共享客户端
+        
+        每个别名只创建一次客户端，底层 httpx 连接池保持长连接，多个线程可以共享。
+        
+        Args:
+            llm_alias: 模型别名
+            
+        Returns:
+            (客户端, 模型名称)
+        """
+        entry = LlmService._clients.get(llm_alias)
+        if entry is None:
+            with LlmService._clients_lock:
+                entry = LlmService._clients.get(llm_alias)
+                if entry is None:
+                    import httpx
+                    from openai import OpenAI
+                    
+                    api_key, model_name, base_url = LlmService._resolve_model(llm_alias)
+                    # 连接池大小与该别名的并发上限一致
+                    pool_size = LlmService.get_alias_concurrency(llm_alias)
+                    client = OpenAI(
+                        api_key=api_key,
+                        base_url=base_url,
+                        http_client=httpx.Client(
+                            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                            timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10.0),
+                        ),
+                    )
+                    entry = (client, model_name)
+                    LlmService._clients[llm_alias] = entry
+                    info(f"创建LLM客户端: {llm_alias} -> {model_name}，连接池大小: {pool_size}")
+        return entry
+    
+    @staticmethod
+    def get_system_prompt(prompt_file: str = PROMPT_FILE) -> str:
+        """
+        读取系统提示词，按文件修改时间缓存，文件变化后自动重新加载
+        
+        Args:
+            prompt_file: 提示词文件路径
+            
+        Returns:
+            提示词内容
+        """
+        return LlmService._load_prompt(prompt_file)[0]
+    
+    @staticmethod
+    def get_prompt_version(prompt_file: str = PROMPT_FILE) -> str:
+        """
+        获取提示词版本(内容哈希)，提示词修改后版本随之变化，旧的缓存响应不再命中
+        
+        Args:
+            prompt_file: 提示词文件路径
+            
+        Returns:
+            提示词版本
+        """
+        return LlmService._load_prompt(prompt_file)[1]
+    
+    @staticmethod
+    def get_batch_prompt_version() -> str:
+        """
+        获取批量请求的提示词版本，由单篇提示词和批量说明的版本组成，两者任一修改后批量拆分的缓存响应不再命中
+        
+        Returns:
+            批量提示词版本
+        """
+        return f"{LlmService.get_prompt_version()}+{LlmService.get_prompt_version(BATCH_PROMPT_FILE)}"
+    
+    @staticmethod
+    def _load_prompt(prompt_file: str) -> Tuple[str, str]:
+        """读取提示词及其版本，文件修改时间不变时直接使用缓存"""
+        mtime = os.stat(prompt_file).st_mtime_ns
+        cached = LlmService._prompt_cache.get(prompt_file)
+        if cached is None or cached[0] != mtime:
+            with open(prompt_file, "r", encoding="utf-8") as f:
+                content = f.read()
+            cached = (mtime, content, hashlib.sha1(content.encode("utf-8")).hexdigest()[:12])
+            LlmService._prompt_cache[prompt_file] = cached
+            info(f"加载提示词: {prompt_file}，版本: {cached[2]}")
+        return cached[1], cached[2]
+    
+    @staticmethod
+    def get_response_cache() -> Optional[LlmResponseCache]:
+        """获取共享的LLM响应缓存，LLM_CACHE_ENABLED 为 False 时返回None"""
+        if not settings.LLM_CACHE_ENABLED:
+            return None
+        if LlmService._response_cache is None:
+            with LlmService._clients_lock:
+                if LlmService._response_cache is None:
+                    LlmService._response_cache = LlmResponseCache()
+        return LlmService._response_cache
+    
+    @staticmethod
+    def get_cached_response(llm_alias: str, prompt: str) -> Optional[str]:
+        """查询笔记内容在当前提示词版本下的缓存响应，单篇请求的响应优先，其次是当前批量提示词版本下拆分出的响应"""
+        cache = LlmService.get_response_cache()
+        if cache is None:
+            return None
+        cached = cache.get(llm_alias, LlmService.get_prompt_version(), prompt)
+        if cached is None:
+            cached = cache.get(llm_alias, LlmService.get_batch_prompt_version(), prompt)
+        return cached
+    
+    @staticmethod
+    def invalidate_cached_response(llm_alias: str, prompt: str) -> None:
+        """删除缓存响应，用于响应内容无法解析的情况，避免下次继续命中错误结果"""
+        cache = LlmService.get_response_cache()
+        if cache is not None:
+            cache.delete(llm_alias, LlmService.get_prompt_version(), prompt)
+            cache.delete(llm_alias, LlmService.get_batch_prompt_version(), prompt)
+    
+    @staticmethod
+    def _save_response_log(log_file_prefix: str, response_text: str) -> None:
+        """保存模型响应内容到 logs/llm_http_request"""
+        # 确保目录存在
+        log_dir = "logs/llm_http_request"
+        date = datetime.now().strftime("%Y%m%d")
+        os.makedirs(f"{log_dir}/{log_file_prefix}/{date}", exist_ok=True)
+        # 生成文件名,并发请求可能落在同一秒，追加随机后缀避免重名
+        timestamp = datetime.now().strftime("%H%M%S")
+        filename = f"{log_dir}/{log_file_prefix}/{date}/{timestamp}_{uuid.uuid4().hex[:8]}.json"
+        # 保存响应内容
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(response_text, f, ensure_ascii=False, indent=2)
+    
+    @staticmethod
+    def request_llm(llm_alias: str, prompt: str, log_file_prefix: str, use_cache: bool = True):
         """
         请求LLM
+        
+        相同模型别名、提示词版本和笔记内容的请求优先返回缓存的响应，新的响应会写入缓存。
         """
-        if (llm_alias == "qwen-max:coze"):
-            # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-            api_key = settings.QWEN_MODEL_API_KEY
-            model_name = settings.QWEN_MODEL_NAME
-            base_url = settings.QWEN_MODEL_BASE_URL
-        else:
-            api_key = settings.MODEL_API_KEY
-            model_name = settings.MODEL_NAME
-            base_url = settings.MODEL_BASE_URL
-        
-        client = OpenAI(
-            api_key=api_key, 
-            base_url=base_url,
-        )
-        # 从 md 文件中读取 prompt 内容
-        prompt_file = "docs/prompt/coze_make_tag_from_notes_v0.2.md"
-        with open(prompt_file, "r", encoding="utf-8") as f:
-            system_prompt = f.read()
+        if use_cache:
+            cached = LlmService.get_cached_response(llm_alias, prompt)
+            if cached is not None:
+                return cached
+        
+        client, model_name = LlmService.get_client(llm_alias)
+        system_prompt, prompt_version = LlmService._load_prompt(PROMPT_FILE)
         completion = client.chat.completions.create(
             model=model_name, 
             messages=[
@@ -78,15 +295,120 @@ class LlmService:
 </小红书笔记>"""}],
         )
         response_text = completion.choices[0].message.content
-        # 确保目录存在
-        log_dir = "logs/llm_http_request"
-        date = datetime.now().strftime("%Y%m%d")
-        os.makedirs(f"{log_dir}/{log_file_prefix}/{date}", exist_ok=True)
-        # 生成文件名,使用时间戳避免重名
-        timestamp = datetime.now().strftime("%H%M%S")
-        filename = f"{log_dir}/{log_file_prefix}/{date}/{timestamp}.json"
-        # 保存响应内容
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(response_text, f, ensure_ascii=False, indent=2)
+        LlmService._save_response_log(log_file_prefix, response_text)
+        
+        cache = LlmService.get_response_cache()
+        if cache is not None and response_text:
+            cache.put(llm_alias, prompt_version, prompt, response_text)
         
         return response_text
+    
+    @staticmethod
+    async def request_llm_async(llm_alias: str, prompt: str, log_file_prefix: str, concurrency: Optional[int] = None) -> str:
+        """
+        异步请求LLM
+        
+        命中响应缓存时直接返回，不占用并发和速率配额。
+        同一模型别名的请求受并发信号量和自适应令牌桶限制；遇到限流、超时或服务端错误时
+        按带抖动的指数退避重试，最多重试 LLM_MAX_RETRIES 次。
+        
+        Args:
+            llm_alias: 模型别名
+            prompt: 笔记内容
+            log_file_prefix: log文件前缀
+            concurrency: 并发上限，默认按模型别名读取配置
+            
+        Returns:
+            模型返回的文本
+        """
+        cached = LlmService.get_cached_response(llm_alias, prompt)
+        if cached is not None:
+            return cached
+        
+        return await LlmService._request_with_retry(
+            llm_alias, concurrency, LlmService.request_llm, llm_alias, prompt, log_file_prefix, False
+        )
+    
+    @staticmethod
+    async def _request_with_retry(llm_alias: str, concurrency: Optional[int], func: Callable[..., str], *args) -> str:
+        """在模型别名的并发和速率限制下执行同步请求函数，失败时退避重试，退避等待期间不占用并发名额"""
+        rate_limiter = LlmService._get_alias_rate_limiter(llm_alias)
+        semaphore = LlmService._get_alias_semaphore(llm_alias, concurrency)
+        from openai import RateLimitError
+        
+        retryable_errors = get_retryable_errors()
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                async with semaphore:
+                    await rate_limiter.acquire()
+                    response_text = await asyncio.to_thread(func, *args)
+                rate_limiter.on_success()
+                return response_text
+            except retryable_errors as e:
+                if isinstance(e, RateLimitError):
+                    rate_limiter.on_throttled()
+                if attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, settings.LLM_BACKOFF_BASE, settings.LLM_BACKOFF_MAX)
+                warning(f"请求 {llm_alias} 失败({type(e).__name__})，{delay:.1f} 秒后进行第 {attempt + 1} 次重试")
+                # 已释放并发名额，退避期间其他请求可以继续执行，重试时重新获取
+                await asyncio.sleep(delay)
+    
+    @staticmethod
+    def request_llm_batch(llm_alias: str, prompts: List[str], log_file_prefix: str) -> str:
+        """
+        在一次请求中提交多篇笔记
+        
+        系统提示词在单篇提示词后追加批量说明，要求模型输出 {"results": [{"id": 编号, ...}]}，
+        编号为笔记在 prompts 中的序号(从1开始)。批量响应不写入缓存，由调用方拆分后通过 cache_response 按单篇写入。
+        
+        Args:
+            llm_alias: 模型别名
+            prompts: 笔记内容列表
+            log_file_prefix: log文件前缀
+            
+        Returns:
+            模型返回的文本
+        """
+        client, model_name = LlmService.get_client(llm_alias)
+        system_prompt = LlmService.get_system_prompt() + LlmService.get_system_prompt(BATCH_PROMPT_FILE)
+        notes_content = "\n".join(
+            f"""<小红书笔记 id="{index}">
+{prompt}
+</小红书笔记>""" for index, prompt in enumerate(prompts, 1)
+        )
+        completion = client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': f"""请分别分析以下 {len(prompts)} 篇小红书笔记内容：
+{notes_content}"""}],
+        )
+        response_text = completion.choices[0].message.content
+        LlmService._save_response_log(log_file_prefix, response_text)
+        return response_text
+    
+    @staticmethod
+    async def request_llm_batch_async(llm_alias: str, prompts: List[str], log_file_prefix: str, concurrency: Optional[int] = None) -> str:
+        """
+        异步批量请求LLM，并发、限流和重试策略与 request_llm_async 相同
+        
+        Args:
+            llm_alias: 模型别名
+            prompts: 笔记内容列表
+            log_file_prefix: log文件前缀
+            concurrency: 并发上限，默认按模型别名读取配置
+            
+        Returns:
+            模型返回的文本
+        """
+        return await LlmService._request_with_retry(
+            llm_alias, concurrency, LlmService.request_llm_batch, llm_alias, prompts, log_file_prefix
+        )
+    
+    @staticmethod
+    def cache_response(llm_alias: str, prompt: str, response_text: str) -> None:
+        """将批量响应拆分出的单篇结果写入缓存，按批量提示词版本存储，批量说明修改后不再命中"""
+        cache = LlmService.get_response_cache()
+        if cache is not None:
+            cache.put(llm_alias, LlmService.get_batch_prompt_version(), prompt, response_text)
@@ -0,0 +1,104 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+from app.utils.logger import get_logger, info
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+
+class AdaptiveTokenBucket:
+    """
+    自适应令牌桶限流器
+
+    按当前速率发放令牌，被限流时乘性降低速率、请求成功时加性恢复速率(AIMD)，
+    从而逐步逼近服务端的真实配额。等待令牌使用 asyncio.sleep，不会阻塞事件循环上的其他任务。
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        min_rate_per_minute: float = 1,
+        max_rate_per_minute: Optional[float] = None,
+        decrease_factor: float = 0.5,
+        increase_per_success: float = 1,
+    ):
+        """
+        初始化令牌桶
+
+        Args:
+            rate_per_minute: 初始速率(每分钟请求数)
+            min_rate_per_minute: 速率下限
+            max_rate_per_minute: 速率上限，默认为初始速率的2倍
+            decrease_factor: 被限流时速率的缩放系数
+            increase_per_success: 每次成功后速率增加量(每分钟请求数)
+        """
+        self.rate_per_minute = float(rate_per_minute)
+        self.min_rate_per_minute = float(min_rate_per_minute)
+        self.max_rate_per_minute = float(max_rate_per_minute or rate_per_minute * 2)
+        self.decrease_factor = decrease_factor
+        self.increase_per_success = increase_per_success
+
+        # 桶容量随速率变化，最多允许一秒内的突发量，且至少为1
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def capacity(self) -> float:
+        """桶容量"""
+        return max(1.0, self.rate_per_minute / 60)
+
+    def _refill(self) -> None:
+        """按流逝时间补充令牌"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_minute / 60)
+        self._updated_at = now
+
+    def _get_lock(self) -> asyncio.Lock:
+        """获取当前事件循环上的锁，限流状态可以跨事件循环保留"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    async def acquire(self) -> None:
+        """获取一个令牌，令牌不足时异步等待"""
+        async with self._get_lock():
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * 60 / self.rate_per_minute)
+
+    def on_success(self) -> None:
+        """请求成功，加性恢复速率"""
+        self.rate_per_minute = min(self.max_rate_per_minute, self.rate_per_minute + self.increase_per_success)
+
+    def on_throttled(self) -> None:
+        """请求被限流，乘性降低速率并清空已积累的令牌"""
+        self._refill()
+        self.rate_per_minute = max(self.min_rate_per_minute, self.rate_per_minute * self.decrease_factor)
+        self._tokens = 0.0
+        info(f"触发限流，速率调整为每分钟 {self.rate_per_minute:.1f} 次")
+
+
+def backoff_delay(attempt: int, base: float, max_delay: float) -> float:
+    """
+    计算带抖动的指数退避时间
+
+    Args:
+        attempt: 当前重试次数(从0开始)
+        base: 基础等待时间(秒)
+        max_delay: 最大等待时间(秒)
+
+    Returns:
+        等待时间(秒)，取值在 [delay/2, delay] 之间，其中 delay = min(max_delay, base * 2^attempt)
+    """
+    delay = min(max_delay, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
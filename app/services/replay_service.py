@@ -0,0 +1,230 @@
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.database.db import get_db
+from app.models.xhs_dao import XhsDAO
+from app.models.xhs_models import (
+    XhsSearchResponse, XhsAutherNotesResponse, XhsCommentsResponse, XhsNoteDetailResponse, XhsTopicsResponse
+)
+from app.services.response_archive import iter_archive_segments, read_archive_segment
+from app.services.xhs_service import XhsService
+from app.utils.json_utils import json_loads
+from app.utils.logger import get_logger, info, warning, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+# 旧版逐条保存的响应目录: logs/coze_http_request/<前缀>/<日期>/<时分秒>.json
+LEGACY_LOG_DIR = "logs/coze_http_request"
+
+# 归档前缀 -> (响应类型, 存储方法名, 由请求参数生成 req_info 的函数)
+# 与 XhsService 中各采集方法的 log_file_prefix 和 req_info 保持一致
+REPLAY_HANDLERS: Dict[str, Tuple[type, str, Any]] = {
+    "get_notes_by_tag": (
+        XhsSearchResponse, "store_search_results",
+        lambda params: {"keywords": params.get("search_tag"), "search_num": params.get("search_num")},
+    ),
+    "xhs_get_notes_by_auther": (
+        XhsAutherNotesResponse, "store_auther_notes",
+        lambda params: {"userProfileUrl": params.get("userProfileUrl")},
+    ),
+    "xhs_get_comments_by_note": (
+        XhsCommentsResponse, "store_comments",
+        lambda params: {"noteUrl": params.get("noteUrl"), "totalNumber": params.get("comments_num")},
+    ),
+    "xhs_get_note_detail": (
+        XhsNoteDetailResponse, "store_note_details",
+        lambda params: {"noteUrl": params.get("noteUrl")},
+    ),
+    "xhs_get_topics": (
+        XhsTopicsResponse, "store_topics",
+        lambda params: {"keyword": params.get("keyword")},
+    ),
+}
+
+
+def _parse_records(prefix: str, records: List[Tuple[Dict[str, Any], Dict[str, Any], Optional[date]]]) -> Tuple[List[Tuple[Dict[str, Any], Any]], int]:
+    """
+    将 (请求参数, 原始响应, 采集日期) 列表解析为 (req_info, 响应对象) 列表，返回解析结果和跳过数量
+
+    采集日期已知时写入 req_info["record_date"]，按日期记录的数据(如话题浏览量)回放时记到响应实际采集的日期，而不是回放当天。
+    """
+    response_type, _, build_req_info = REPLAY_HANDLERS[prefix]
+    parsed = []
+    skipped = 0
+    for parameters, response, record_date in records:
+        # 限流、服务端繁忙等失败响应没有数据，直接跳过
+        if not isinstance(response, dict) or response.get("code") != 0:
+            skipped += 1
+            continue
+        response_obj, _ = XhsService._process_response(response, response_type)
+        if response_obj is None:
+            skipped += 1
+            continue
+        req_info = build_req_info(parameters or {})
+        if record_date:
+            req_info["record_date"] = record_date
+        parsed.append((req_info, response_obj))
+    return parsed, skipped
+
+
+def _parse_legacy_files(prefix: str, paths: List[str]) -> Tuple[str, List[Tuple[Dict[str, Any], Any]], int, int]:
+    """
+    工作进程：解析一批旧版响应文件
+
+    旧版文件只保存了响应本身，没有请求参数，因此 req_info 中的字段为空(例如搜索结果不会关联关键词群组)。
+    采集日期取自文件所在的日期目录。
+    """
+    records = []
+    for path in paths:
+        try:
+            record_date = datetime.strptime(os.path.basename(os.path.dirname(path)), "%Y%m%d").date()
+        except ValueError:
+            record_date = None
+        try:
+            with open(path, "rb") as f:
+                records.append(({}, json_loads(f.read()), record_date))
+        except Exception as e:
+            warning(f"读取响应文件失败: {path} - {e}")
+            records.append(({}, None, record_date))
+    parsed, skipped = _parse_records(prefix, records)
+    return prefix, parsed, len(records), skipped
+
+
+def _parse_archive_segment(prefix: str, path: str) -> Tuple[str, List[Tuple[Dict[str, Any], Any]], int, int]:
+    """工作进程：解析一个归档分段"""
+    records = []
+    for record in read_archive_segment(path):
+        try:
+            record_date = datetime.fromisoformat(record["archived_at"]).date()
+        except (KeyError, TypeError, ValueError):
+            record_date = None
+        records.append((record.get("parameters"), record.get("response"), record_date))
+    parsed, skipped = _parse_records(prefix, records)
+    return prefix, parsed, len(records), skipped
+
+
+class ReplayService:
+    """离线回放服务，将已保存的Coze原始响应重新解析并写入数据库，不发起任何网络请求"""
+
+    @staticmethod
+    def collect_sources(prefixes: List[str], include_legacy: bool = True, include_archive: bool = True, files_per_task: int = 200) -> List[Tuple[str, str, Any]]:
+        """
+        收集待回放的数据源
+
+        Args:
+            prefixes: 需要回放的前缀
+            include_legacy: 是否包含旧版逐条保存的响应文件
+            include_archive: 是否包含压缩归档分段
+            files_per_task: 旧版文件每个任务包含的文件数量
+
+        Returns:
+            任务列表，每项为 (类型, 前缀, 路径或路径列表)
+        """
+        sources = []
+        for prefix in prefixes:
+            if include_legacy:
+                paths = sorted(glob.glob(os.path.join(LEGACY_LOG_DIR, prefix, "*", "*.json")))
+                for start in range(0, len(paths), files_per_task):
+                    sources.append(("legacy", prefix, paths[start:start + files_per_task]))
+            if include_archive:
+                for path in iter_archive_segments(settings.COZE_ARCHIVE_DIR, prefix):
+                    sources.append(("archive", prefix, path))
+        return sources
+
+    @staticmethod
+    def _store(db, prefix: str, parsed: List[Tuple[Dict[str, Any], Any]]) -> int:
+        """调用前缀对应的存储方法写入数据库，返回成功写入的响应数量"""
+        _, method_name, _ = REPLAY_HANDLERS[prefix]
+        db_method = getattr(XhsDAO, method_name)
+
+        # 笔记详情有批量写入方法，整批只提交一次
+        if method_name == "store_note_details":
+            return len(db_method(db, parsed))
+
+        stored = 0
+        for req_info, response_obj in parsed:
+            try:
+                if db_method(db, req_info, response_obj):
+                    stored += 1
+            except Exception as e:
+                error(f"回放写入 {prefix} 数据失败: {e}")
+                db.rollback()
+        return stored
+
+    @staticmethod
+    def replay(
+        prefixes: Optional[List[str]] = None,
+        workers: int = 4,
+        include_legacy: bool = True,
+        include_archive: bool = True,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """
+        回放已保存的响应
+
+        解析在进程池中并行进行，解析结果回到主进程后按前缀调用 XhsDAO 的批量存储方法写入。
+        写入按回放任务的提交顺序(即归档的时间顺序)进行，避免较早的响应后解析完成时覆盖较新的数据。
+
+        Args:
+            prefixes: 需要回放的前缀，默认全部支持的前缀
+            workers: 解析进程数量
+            include_legacy: 是否包含旧版逐条保存的响应文件
+            include_archive: 是否包含压缩归档分段
+            dry_run: 只解析不写库，可用于压测解析路径
+
+        Returns:
+            统计信息
+        """
+        prefixes = prefixes or list(REPLAY_HANDLERS.keys())
+        unknown = [prefix for prefix in prefixes if prefix not in REPLAY_HANDLERS]
+        if unknown:
+            raise ValueError(f"不支持回放的前缀: {', '.join(unknown)}，可选: {', '.join(REPLAY_HANDLERS.keys())}")
+
+        sources = ReplayService.collect_sources(prefixes, include_legacy, include_archive)
+        info(f"共找到 {len(sources)} 个回放任务，解析进程数量: {workers}{'，仅解析不写库' if dry_run else ''}")
+
+        stats = {"records": 0, "parsed": 0, "skipped": 0, "stored": 0, "failed_tasks": 0}
+        started_at = time.monotonic()
+        db = None if dry_run else next(get_db())
+
+        try:
+            with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = [
+                    executor.submit(_parse_legacy_files if kind == "legacy" else _parse_archive_segment, prefix, target)
+                    for kind, prefix, target in sources
+                ]
+                # 按提交顺序取结果：后面的任务先解析完成时等待前面的任务，保证按归档时间顺序写入
+                for future in futures:
+                    try:
+                        prefix, parsed, record_count, skipped = future.result()
+                    except Exception as e:
+                        stats["failed_tasks"] += 1
+                        error(f"回放任务解析失败: {e}")
+                        error(traceback.format_exc())
+                        continue
+
+                    stats["records"] += record_count
+                    stats["parsed"] += len(parsed)
+                    stats["skipped"] += skipped
+                    if db is not None and parsed:
+                        stats["stored"] += ReplayService._store(db, prefix, parsed)
+        finally:
+            if db is not None:
+                db.close()
+
+        elapsed = time.monotonic() - started_at
+        stats["elapsed"] = round(elapsed, 2)
+        stats["records_per_second"] = round(stats["records"] / elapsed, 1) if elapsed > 0 else 0
+        info(
+            f"回放完成: 读取 {stats['records']} 条响应，解析 {stats['parsed']} 条，跳过 {stats['skipped']} 条，"
+            f"写入 {stats['stored']} 条，失败任务 {stats['failed_tasks']} 个，耗时 {elapsed:.1f} 秒 "
+            f"({stats['records_per_second']} 条/秒)"
+        )
+        return stats
@@ -0,0 +1,293 @@
+import atexit
+import glob
+import gzip
+import os
+import queue
+import threading
+import traceback
+import uuid
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Optional, Iterator, IO
+
+from app.config.settings import settings
+from app.utils.json_utils import json_loads, json_dumps_bytes
+from app.utils.logger import get_logger, info, warning, error
+
+# zstandard 为可选依赖，未安装时使用 gzip 压缩
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 取决于运行环境
+    zstandard = None
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+# 归档时从请求参数中去掉的敏感字段
+SENSITIVE_PARAMETERS = ("cookie",)
+
+
+class ResponseArchive:
+    """
+    Coze原始响应归档
+
+    调用方通过 submit() 将响应放入队列后立即返回，由后台线程追加写入压缩的JSONL分段文件：
+    logs/coze_archive/<前缀>/<日期>-<时间>-<进程ID>.jsonl.gz(安装 zstandard 且配置为 zstd 时为 .jsonl.zst)。
+    每条记录带有唯一ID，同时在 <前缀>/index.jsonl 中记录ID所在的分段和行号，便于批量回放。
+    分段在日期变化或超过大小上限时轮转。
+    """
+
+    def __init__(
+        self,
+        archive_dir: Optional[str] = None,
+        compression: Optional[str] = None,
+        segment_max_bytes: Optional[int] = None,
+    ):
+        """
+        初始化归档
+
+        Args:
+            archive_dir: 归档根目录，默认读取配置 COZE_ARCHIVE_DIR
+            compression: 压缩格式 gzip 或 zstd，默认读取配置 COZE_ARCHIVE_COMPRESSION
+            segment_max_bytes: 单个分段的最大(未压缩)字节数，默认读取配置 COZE_ARCHIVE_SEGMENT_MAX_MB
+        """
+        self.archive_dir = archive_dir or settings.COZE_ARCHIVE_DIR
+        compression = (compression or settings.COZE_ARCHIVE_COMPRESSION).lower()
+        if compression == "zstd" and zstandard is None:
+            warning("未安装 zstandard，归档改用 gzip 压缩")
+            compression = "gzip"
+        self.compression = compression
+        self.segment_max_bytes = segment_max_bytes or settings.COZE_ARCHIVE_SEGMENT_MAX_MB * 1024 * 1024
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # 每个前缀当前打开的分段: {prefix: {"path", "file", "date", "lines", "bytes"}}
+        self._segments: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def extension(self) -> str:
+        """分段文件扩展名"""
+        return ".jsonl.zst" if self.compression == "zstd" else ".jsonl.gz"
+
+    def submit(self, prefix: str, workflow_id: str, parameters: Dict[str, Any], response: Dict[str, Any]) -> str:
+        """
+        提交一条响应到归档队列，不等待写入
+
+        Args:
+            prefix: 归档前缀，与原 log_file_prefix 一致
+            workflow_id: 工作流ID
+            parameters: 请求参数(敏感字段不会写入)
+            response: Coze原始响应
+
+        Returns:
+            记录的唯一ID
+        """
+        record_id = uuid.uuid4().hex
+        self._queue.put({
+            "id": record_id,
+            "prefix": prefix,
+            "workflow_id": workflow_id,
+            "archived_at": datetime.now().isoformat(timespec="seconds"),
+            "parameters": {k: v for k, v in parameters.items() if k not in SENSITIVE_PARAMETERS},
+            "response": response,
+        })
+        self._ensure_writer()
+        return record_id
+
+    def _ensure_writer(self) -> None:
+        """按需启动后台写入线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="coze-response-archive", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """后台线程：不断从队列取出记录写入分段，队列暂时为空时刷新缓冲区"""
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    self._close_segments()
+                    return
+                self._write(record)
+                if self._queue.empty():
+                    self._flush_segments()
+            except Exception as e:
+                error(f"写入响应归档失败: {e}")
+                error(traceback.format_exc())
+            finally:
+                self._queue.task_done()
+
+    def _open_compressed(self, path: str) -> IO[bytes]:
+        """以追加方式打开压缩文件，每次打开都会追加一个新的压缩帧，整体仍可顺序解压"""
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().stream_writer(open(path, "ab"), closefd=True)
+        return gzip.open(path, "ab")
+
+    def _create_segment_file(self, prefix_dir: str) -> str:
+        """
+        独占创建新的分段文件
+
+        文件名包含创建时间(精确到微秒)和进程ID，按文件名排序即为创建顺序；
+        以 O_EXCL 创建，多个采集进程写同一前缀时不会选中同一个分段文件。
+        """
+        while True:
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S%f")
+            path = os.path.join(prefix_dir, f"{stamp}-{os.getpid()}{self.extension}")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except FileExistsError:
+                continue
+
+    def _get_segment(self, prefix: str) -> Dict[str, Any]:
+        """获取前缀当前的分段，日期变化或超过大小上限时轮转到新分段"""
+        date = datetime.now().strftime("%Y%m%d")
+        segment = self._segments.get(prefix)
+        if segment and segment["date"] == date and segment["bytes"] < self.segment_max_bytes:
+            return segment
+
+        if segment:
+            segment["file"].close()
+
+        prefix_dir = os.path.join(self.archive_dir, prefix)
+        os.makedirs(prefix_dir, exist_ok=True)
+        path = self._create_segment_file(prefix_dir)
+        segment = {"path": path, "file": self._open_compressed(path), "date": date, "lines": 0, "bytes": 0}
+        self._segments[prefix] = segment
+        info(f"创建响应归档分段: {path}")
+        return segment
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """写入一条记录并追加索引"""
+        segment = self._get_segment(record["prefix"])
+        line = json_dumps_bytes(record) + b"\n"
+        segment["file"].write(line)
+
+        index_entry = {
+            "id": record["id"],
+            "segment": os.path.basename(segment["path"]),
+            "line": segment["lines"],
+            "archived_at": record["archived_at"],
+            "workflow_id": record["workflow_id"],
+            "code": record["response"].get("code") if isinstance(record["response"], dict) else None,
+        }
+        with open(os.path.join(self.archive_dir, record["prefix"], "index.jsonl"), "ab") as f:
+            f.write(json_dumps_bytes(index_entry) + b"\n")
+
+        segment["lines"] += 1
+        segment["bytes"] += len(line)
+
+    def _flush_segments(self) -> None:
+        """刷新所有打开分段的缓冲区"""
+        for segment in self._segments.values():
+            segment["file"].flush()
+
+    def _close_segments(self) -> None:
+        """关闭所有打开的分段"""
+        for segment in self._segments.values():
+            try:
+                segment["file"].close()
+            except Exception as e:
+                error(f"关闭响应归档分段失败: {segment['path']} - {e}")
+        self._segments = {}
+
+    def close(self, timeout: float = 30) -> None:
+        """等待队列中的记录写完并关闭分段"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+def iter_archive_records(archive_dir: Optional[str] = None, prefix: str = "*") -> Iterator[Dict[str, Any]]:
+    """
+    按分段顺序读取归档记录
+
+    Args:
+        archive_dir: 归档根目录，默认读取配置 COZE_ARCHIVE_DIR
+        prefix: 归档前缀，支持通配符
+
+    Returns:
+        归档记录迭代器
+    """
+    for path in iter_archive_segments(archive_dir, prefix):
+        yield from read_archive_segment(path)
+
+
+def iter_archive_segments(archive_dir: Optional[str] = None, prefix: str = "*") -> Iterator[str]:
+    """按前缀和文件名顺序列出归档分段路径"""
+    base_dir = archive_dir or settings.COZE_ARCHIVE_DIR
+    paths = glob.glob(os.path.join(base_dir, prefix, "*.jsonl.gz")) + glob.glob(os.path.join(base_dir, prefix, "*.jsonl.zst"))
+    yield from sorted(paths)
+
+
+def _iter_decompressed(path: str) -> Iterator[bytes]:
+    """
+    逐块解压分段文件
+
+    使用增量解压对象而不是 gzip.open，这样正在写入(尚未写入结束标记)的分段也能读出已刷新的全部内容。
+    """
+    if path.endswith(".zst"):
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = zlib.decompressobj(wbits=31)
+
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            while chunk:
+                yield decompressor.decompress(chunk)
+                if not decompressor.eof:
+                    break
+                # 追加写入会产生多个压缩帧，一个帧结束后继续解压剩余数据
+                chunk = decompressor.unused_data
+                if path.endswith(".zst"):
+                    decompressor = zstandard.ZstdDecompressor().decompressobj()
+                else:
+                    decompressor = zlib.decompressobj(wbits=31)
+
+
+def read_archive_segment(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    读取单个归档分段，未正常关闭的分段只读取已完整写入的记录
+
+    Args:
+        path: 分段路径
+
+    Returns:
+        归档记录迭代器
+    """
+    if path.endswith(".zst") and zstandard is None:
+        warning(f"未安装 zstandard，跳过分段: {path}")
+        return
+
+    buffer = b""
+    try:
+        for data in _iter_decompressed(path):
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line:
+                    yield json_loads(line)
+    except Exception as e:
+        warning(f"归档分段已损坏，停止读取: {path} - {e}")
+
+
+# 进程内共享的归档实例
+_response_archive: Optional[ResponseArchive] = None
+
+
+def get_response_archive() -> ResponseArchive:
+    """获取共享的响应归档，进程退出时自动写完队列中的记录"""
+    global _response_archive
+    if _response_archive is None:
+        _response_archive = ResponseArchive()
+        atexit.register(_response_archive.close)
+    return _response_archive
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Iterable
+
+import numpy as np
+
+from app.config.settings import settings
+from app.utils.logger import get_logger, info, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+
+class EmbeddingCache:
+    """
+    标签向量缓存
+
+    以 (模型名称, 标签文本) 为键缓存标签向量：内存中保留最近使用的向量(LRU)，
+    同时持久化到本地SQLite文件(float32 二进制)，同一模型下每个不同的标签跨运行只需编码一次。
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_size: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite文件路径，默认读取配置 EMBEDDING_CACHE_PATH
+            memory_size: 内存中最多保留的向量数量，默认读取配置 EMBEDDING_CACHE_MEMORY_SIZE
+        """
+        self.path = path or settings.EMBEDDING_CACHE_PATH
+        self.memory_size = memory_size or settings.EMBEDDING_CACHE_MEMORY_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # 多进程分析时各进程共用同一个文件，写入冲突时等待而不是立即失败
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tag_embeddings (
+                model_name TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                embedding BLOB NOT NULL,
+                PRIMARY KEY (model_name, tag)
+            )
+        """)
+        self._conn.commit()
+
+    def _remember(self, key: tuple, vector: np.ndarray) -> None:
+        """放入内存LRU，超出容量时淘汰最久未使用的向量(调用方需持有锁)"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_name: str, tags: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        批量查询标签向量
+
+        Args:
+            model_name: 模型名称
+            tags: 标签列表
+
+        Returns:
+            {标签: 向量}，只包含已缓存的标签
+        """
+        unique_tags = list(dict.fromkeys(tags))
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        with self._lock:
+            for tag in unique_tags:
+                vector = self._memory.get((model_name, tag))
+                if vector is None:
+                    missing.append(tag)
+                else:
+                    self._memory.move_to_end((model_name, tag))
+                    found[tag] = vector
+
+            # 内存未命中的标签一次性从磁盘读取(分块避免超过SQLite参数个数上限)
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT tag, dim, embedding FROM tag_embeddings WHERE model_name = ? AND tag IN ({','.join('?' * len(chunk))})",
+                    [model_name, *chunk]
+                ).fetchall()
+                for tag, dim, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32, count=dim)
+                    self._remember((model_name, tag), vector)
+                    found[tag] = vector
+
+            self.hits += len(found)
+            self.misses += len(unique_tags) - len(found)
+        return found
+
+    def put_many(self, model_name: str, embeddings: Dict[str, np.ndarray]) -> None:
+        """
+        批量写入标签向量
+
+        Args:
+            model_name: 模型名称
+            embeddings: {标签: 向量}
+        """
+        if not embeddings:
+            return
+        rows = []
+        with self._lock:
+            for tag, vector in embeddings.items():
+                vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+                self._remember((model_name, tag), vector)
+                rows.append((model_name, tag, int(vector.shape[0]), vector.tobytes()))
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO tag_embeddings (model_name, tag, dim, embedding) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.commit()
+            except Exception as e:
+                error(f"写入标签向量缓存失败: {e}")
+
+    def clear(self, model_name: Optional[str] = None) -> None:
+        """清空缓存，指定模型名称时只清空该模型的向量"""
+        with self._lock:
+            if model_name:
+                self._conn.execute("DELETE FROM tag_embeddings WHERE model_name = ?", (model_name,))
+                self._memory = OrderedDict((k, v) for k, v in self._memory.items() if k[0] != model_name)
+            else:
+                self._conn.execute("DELETE FROM tag_embeddings")
+                self._memory.clear()
+            self._conn.commit()
+        info(f"已清空标签向量缓存: {model_name or '全部模型'}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            包含各模型向量数、内存中向量数、本进程命中/未命中次数和命中率的字典
+        """
+        with self._lock:
+            models = dict(self._conn.execute(
+                "SELECT model_name, COUNT(*) FROM tag_embeddings GROUP BY model_name"
+            ).fetchall())
+            memory_entries = len(self._memory)
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "models": models,
+            "memory_entries": memory_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 进程内共享的缓存实例
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """获取共享的标签向量缓存，EMBEDDING_CACHE_ENABLED 为 False 时返回None"""
+    global _embedding_cache
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -0,0 +1,330 @@
+import base64
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from app.config.settings import settings
+from app.utils.logger import get_logger, debug, info, warning, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+# 项目根目录，自动启动服务时作为工作目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# 自动启动服务后等待其可用的最长时间(秒)
+START_TIMEOUT = 30
+
+
+class EmbeddingServerError(Exception):
+    """嵌入服务返回错误或无法连接"""
+
+
+class _ModelBatcher:
+    """
+    单个模型的微批处理线程
+
+    并发的编码请求先放入队列，处理线程取到第一个请求后在 window 秒内继续收集其他请求，
+    去重后合并成一次模型调用，再按请求拆分结果。同一模型的调用只在该线程中进行，不需要额外加锁。
+    """
+
+    def __init__(self, analyzer, window: float, max_batch: int):
+        self.analyzer = analyzer
+        self.window = window
+        self.max_batch = max_batch
+        self.requests: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.served_requests = 0
+        self.encoded_tags = 0
+        self.batches = 0
+        threading.Thread(target=self._run, name=f"embedding-{analyzer.model_name}", daemon=True).start()
+
+    def encode(self, tags: List[str]) -> np.ndarray:
+        """提交编码请求并等待结果"""
+        item = {"tags": tags, "done": threading.Event(), "result": None, "error": None}
+        self.requests.put(item)
+        item["done"].wait()
+        if item["error"] is not None:
+            raise item["error"]
+        return item["result"]
+
+    def _collect(self) -> List[Dict[str, Any]]:
+        """阻塞等待第一个请求，再在窗口期内收集后续请求，标签总数达到 max_batch 时提前结束"""
+        batch = [self.requests.get()]
+        count = len(batch[0]["tags"])
+        deadline = time.monotonic() + self.window
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item["tags"])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            unique_tags = list(dict.fromkeys(tag for item in batch for tag in item["tags"]))
+            try:
+                embeddings = np.asarray(self.analyzer._encode_with_model(unique_tags), dtype=np.float32)
+                index = {tag: i for i, tag in enumerate(unique_tags)}
+                for item in batch:
+                    item["result"] = embeddings[[index[tag] for tag in item["tags"]]]
+            except Exception as e:
+                error(f"嵌入服务编码失败({self.analyzer.model_name}): {e}")
+                for item in batch:
+                    item["error"] = e
+            self.served_requests += len(batch)
+            self.encoded_tags += len(unique_tags)
+            self.batches += 1
+            for item in batch:
+                item["done"].set()
+
+
+class EmbeddingServer:
+    """
+    本地嵌入服务
+
+    常驻进程中保存已加载的标签模型(TagSimilarityAnalyzer._load_model)，通过本机HTTP接口提供编码，
+    多次CLI调用和多进程分析的各个子进程共用同一份模型，不再各自冷启动加载。
+
+    接口:
+        GET  /health  服务状态、已加载模型和各模型的批处理统计
+        POST /encode  {"model_name": 模型名称, "tags": [标签]} -> {"shape": [行, 列], "embeddings": base64 float32}
+    """
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, device: Optional[str] = None,
+                 window_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        """
+        初始化服务
+
+        Args:
+            host: 监听地址，默认读取配置 EMBEDDING_SERVER_HOST
+            port: 监听端口，默认读取配置 EMBEDDING_SERVER_PORT
+            device: 模型运行的设备，默认读取配置 TAG_MODEL_DEVICE
+            window_ms: 微批处理等待窗口(毫秒)，默认读取配置 EMBEDDING_SERVER_BATCH_WINDOW_MS
+            max_batch: 单次合并编码的最大标签数，默认读取配置 EMBEDDING_SERVER_MAX_BATCH
+        """
+        self.host = host or settings.EMBEDDING_SERVER_HOST
+        self.port = port or settings.EMBEDDING_SERVER_PORT
+        self.device = device or settings.TAG_MODEL_DEVICE
+        self.window = (settings.EMBEDDING_SERVER_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or settings.EMBEDDING_SERVER_MAX_BATCH
+        self.started_at = time.time()
+        self._batchers: Dict[str, _ModelBatcher] = {}
+        self._lock = threading.Lock()
+
+    def get_batcher(self, model_name: str) -> _ModelBatcher:
+        """获取模型对应的批处理线程，首次使用时加载模型"""
+        with self._lock:
+            batcher = self._batchers.get(model_name)
+            if batcher is None:
+                from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+
+                started_at = time.monotonic()
+                analyzer = TagSimilarityAnalyzer(model_name=model_name, device=self.device, use_server=False)
+                # 向量缓存由各客户端进程负责，服务端只做模型推理
+                analyzer.embedding_cache = None
+                batcher = _ModelBatcher(analyzer, self.window, self.max_batch)
+                self._batchers[model_name] = batcher
+                info(f"嵌入服务已加载模型 {model_name}({self.device})，耗时 {time.monotonic() - started_at:.1f} 秒")
+            return batcher
+
+    def health(self) -> Dict[str, Any]:
+        """服务状态"""
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "device": self.device,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "models": {
+                name: {
+                    "requests": batcher.served_requests,
+                    "tags": batcher.encoded_tags,
+                    "batches": batcher.batches
+                }
+                for name, batcher in list(self._batchers.items())
+            }
+        }
+
+    def serve_forever(self, preload: Optional[List[str]] = None) -> None:
+        """
+        启动服务并阻塞运行
+
+        Args:
+            preload: 启动后在后台预先加载的模型名称列表
+        """
+        httpd = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        httpd.daemon_threads = True
+        for model_name in preload or []:
+            threading.Thread(target=self.get_batcher, args=(model_name,), daemon=True).start()
+        info(f"嵌入服务已启动: http://{self.host}:{self.port}，设备 {self.device}，"
+             f"批处理窗口 {self.window * 1000:.0f} ms，单批最多 {self.max_batch} 个标签")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            info("嵌入服务已停止")
+        finally:
+            httpd.server_close()
+
+
+def _make_handler(server: EmbeddingServer):
+    """创建绑定到指定服务实例的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, server.health())
+            else:
+                self._send_json(404, {"error": f"未知路径: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/encode":
+                self._send_json(404, {"error": f"未知路径: {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                model_name = request["model_name"]
+                tags = [str(tag) for tag in request["tags"]]
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": f"请求格式错误: {e}"})
+                return
+            try:
+                embeddings = server.get_batcher(model_name).encode(tags) if tags else np.zeros((0, 0), dtype=np.float32)
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {
+                "shape": list(embeddings.shape),
+                "embeddings": base64.b64encode(np.ascontiguousarray(embeddings).tobytes()).decode("ascii")
+            })
+
+        def log_message(self, format, *args):
+            debug(f"嵌入服务 {self.address_string()} {format % args}")
+
+    return Handler
+
+
+class EmbeddingClient:
+    """嵌入服务客户端"""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        初始化客户端
+
+        Args:
+            host: 服务地址，默认读取配置 EMBEDDING_SERVER_HOST
+            port: 服务端口，默认读取配置 EMBEDDING_SERVER_PORT
+            timeout: 编码请求超时时间(秒)，默认读取配置 EMBEDDING_SERVER_TIMEOUT，首次请求需要等待服务加载模型
+        """
+        self.base_url = f"http://{host or settings.EMBEDDING_SERVER_HOST}:{port or settings.EMBEDDING_SERVER_PORT}"
+        self.timeout = timeout or settings.EMBEDDING_SERVER_TIMEOUT
+        # 本机服务不经过代理
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def health(self, timeout: float = 0.5) -> Optional[Dict[str, Any]]:
+        """
+        查询服务状态
+
+        Returns:
+            服务状态，服务不可用时返回None
+        """
+        try:
+            with self._opener.open(f"{self.base_url}/health", timeout=timeout) as response:
+                return json.loads(response.read())
+        except (OSError, ValueError):
+            return None
+
+    def encode(self, model_name: str, tags: List[str]) -> np.ndarray:
+        """
+        请求服务编码标签
+
+        Args:
+            model_name: 模型名称(含推理后端后缀)
+            tags: 标签列表
+
+        Returns:
+            标签向量矩阵
+        """
+        request = urllib.request.Request(
+            f"{self.base_url}/encode",
+            data=json.dumps({"model_name": model_name, "tags": list(tags)}, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with self._opener.open(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise EmbeddingServerError(f"嵌入服务返回错误 {e.code}: {message}") from e
+        except (OSError, ValueError) as e:
+            raise EmbeddingServerError(f"无法连接嵌入服务 {self.base_url}: {e}") from e
+        return np.frombuffer(base64.b64decode(payload["embeddings"]), dtype=np.float32).reshape(payload["shape"])
+
+
+def start_embedding_server(client: EmbeddingClient) -> bool:
+    """
+    在后台启动嵌入服务进程并等待其可用
+
+    服务输出写入 logs/embedding_server.log，启动后独立于当前进程运行。
+
+    Returns:
+        服务是否在 START_TIMEOUT 秒内可用
+    """
+    log_path = os.path.join(PROJECT_ROOT, "logs", "embedding_server.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    info(f"正在后台启动嵌入服务，日志: {log_path}")
+    with open(log_path, "ab") as log_file:
+        subprocess.Popen(
+            [sys.executable, "-m", "cli.main", "tag", "embedding_server"],
+            cwd=PROJECT_ROOT, stdout=log_file, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            start_new_session=True
+        )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if client.health() is not None:
+            return True
+        time.sleep(0.2)
+    warning(f"嵌入服务 {START_TIMEOUT} 秒内未启动，改用本地模型")
+    return False
+
+
+def get_embedding_client() -> Optional[EmbeddingClient]:
+    """
+    获取可用的嵌入服务客户端
+
+    EMBEDDING_SERVER_ENABLED 为 False 时返回None；服务未运行时，
+    EMBEDDING_SERVER_AUTOSTART 为 True 则在后台启动服务，否则返回None，由调用方加载本地模型。
+    """
+    if not settings.EMBEDDING_SERVER_ENABLED:
+        return None
+    client = EmbeddingClient()
+    if client.health() is not None:
+        return client
+    if settings.EMBEDDING_SERVER_AUTOSTART and start_embedding_server(client):
+        return client
+    return None
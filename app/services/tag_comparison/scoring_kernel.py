@@ -0,0 +1,111 @@
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+# 较小一侧的标签数不超过该值时用状态压缩DP求最优匹配，超过时用 scipy
+MAX_DP_SIZE = 5
+
+# 同一形状的矩阵少于该数量时直接逐个调用 scipy，批量DP的固定开销不划算
+MIN_DP_BATCH = 8
+
+# 较小一侧大小 -> 每一位对应的包含该位的全部状态
+_MASKS_WITH_BIT: Dict[int, List[np.ndarray]] = {}
+
+
+def _masks_with_bit(size: int) -> List[np.ndarray]:
+    """预先计算 size 位状态中包含第 i 位的全部状态"""
+    if size not in _MASKS_WITH_BIT:
+        masks = np.arange(1 << size)
+        _MASKS_WITH_BIT[size] = [masks[(masks >> i) & 1 == 1] for i in range(size)]
+    return _MASKS_WITH_BIT[size]
+
+
+def _bitmask_assignment(weights: np.ndarray) -> np.ndarray:
+    """
+    批量求最优一对一匹配的相似度之和
+
+    weights 的形状为 (矩阵数, s, L) 且 s <= L。依次处理较大一侧的每一列，
+    状态为较小一侧已匹配的行集合，同一批矩阵的状态转移用向量化运算一起完成。
+
+    Returns:
+        每个矩阵最优匹配的相似度之和
+    """
+    count, size, columns = weights.shape
+    masks_with_bit = _masks_with_bit(size)
+    dp = np.full((count, 1 << size), -np.inf)
+    dp[:, 0] = 0.0
+    for column in range(columns):
+        new_dp = dp.copy()
+        for row, masks in enumerate(masks_with_bit):
+            candidate = dp[:, masks ^ (1 << row)] + weights[:, row, column][:, None]
+            new_dp[:, masks] = np.maximum(new_dp[:, masks], candidate)
+        dp = new_dp
+    return dp[:, (1 << size) - 1]
+
+
+def _scipy_assignment(matrix: np.ndarray) -> float:
+    """用匈牙利算法求单个矩阵最优匹配的平均相似度"""
+    from scipy.optimize import linear_sum_assignment
+
+    row_ind, col_ind = linear_sum_assignment(-matrix)
+    return matrix[row_ind, col_ind].mean()
+
+
+def batched_optimal_matching(block: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    批量计算最优匹配得分
+
+    block 由多个相似度矩阵按行拼接而成，第 k 个矩阵为 block[starts[k]:starts[k] + lengths[k]]。
+    形状相同的矩阵分为一组，较小一侧不超过 MAX_DP_SIZE 时整组用状态压缩DP求解，其余逐个调用 scipy。
+
+    Returns:
+        每个矩阵最优一对一匹配的平均相似度，与 linear_sum_assignment 的结果一致
+    """
+    results = np.empty(len(lengths), dtype=np.float64)
+    groups = defaultdict(list)
+    for k, length in enumerate(lengths):
+        groups[int(length)].append(k)
+
+    columns = block.shape[1]
+    for length, members in groups.items():
+        size = min(length, columns)
+        if size > MAX_DP_SIZE or len(members) < MIN_DP_BATCH:
+            for k in members:
+                results[k] = _scipy_assignment(block[starts[k]:starts[k] + length])
+            continue
+        row_index = starts[members][:, None] + np.arange(length)
+        weights = block[row_index].astype(np.float64)
+        if length > columns:
+            weights = weights.transpose(0, 2, 1)
+        if size == 1:
+            # 只有一行或一列时，最优匹配就是最大值
+            results[members] = weights.reshape(len(members), -1).max(axis=1)
+        else:
+            results[members] = _bitmask_assignment(weights) / size
+    return results
+
+
+def score_blocks(block: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    批量计算相似度指标
+
+    block 由多个相似度矩阵按行拼接而成(列为同一组标准标签)，
+    按矩阵分段用向量化运算计算 TagSimilarityAnalyzer._calculate_scores 中的五项指标。
+
+    Args:
+        block: 拼接后的相似度矩阵，形状 (总行数, 标准标签数)
+        starts: 每个矩阵的起始行
+        lengths: 每个矩阵的行数
+
+    Returns:
+        {指标名称: 每个矩阵的得分数组}
+    """
+    cells = lengths * block.shape[1]
+    return {
+        "max_similarity": np.add.reduceat(block.max(axis=1), starts) / lengths,
+        "optimal_matching": batched_optimal_matching(block, starts, lengths),
+        "threshold_matching": np.add.reduceat((block >= 0.7).sum(axis=1), starts) / cells,
+        "average_similarity": np.add.reduceat(block.sum(axis=1), starts) / cells,
+        "coverage": (np.maximum.reduceat(block, starts, axis=0) > 0.5).mean(axis=1)
+    }
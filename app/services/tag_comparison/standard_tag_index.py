@@ -0,0 +1,93 @@
+import threading
+import time
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
+
+from app.database.tag_dao import TagDAO
+from app.utils.logger import get_logger, info
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+
+class StandardTagIndex:
+    """
+    标准标签索引
+
+    一次查询加载全部 tag_standards，并按 (模型名称, 标签类型) 缓存归一化后的标准标签向量，
+    对比标签时不再每次查询数据库和重新编码标准标签。
+    索引记录加载时数据库中标准标签的版本(TagDAO.get_standard_tags_version)，
+    使用时最多每 CHECK_INTERVAL 秒查询一次版本，其他进程修改标准标签并提交后，版本变化时重新加载。
+    """
+
+    # 两次查询标准标签版本的最小间隔(秒)
+    CHECK_INTERVAL = 5.0
+
+    _version: Optional[Tuple] = None
+    _checked_at = 0.0
+    _tags: Dict[str, List[str]] = {}
+    _embeddings: Dict[Tuple[str, str], "np.ndarray"] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _ensure_loaded() -> None:
+        """版本变化时重新加载标准标签，并清空已编码的向量(调用方需持有锁)"""
+        now = time.monotonic()
+        if StandardTagIndex._version is not None and now - StandardTagIndex._checked_at < StandardTagIndex.CHECK_INTERVAL:
+            return
+        StandardTagIndex._checked_at = now
+        version = TagDAO.get_standard_tags_version()
+        if StandardTagIndex._version == version:
+            return
+        StandardTagIndex._tags = TagDAO.get_all_standard_tags()
+        StandardTagIndex._embeddings = {}
+        StandardTagIndex._version = version
+        info(f"已加载标准标签索引(共 {version[0]} 个): "
+             + ", ".join(f"{tag_type} {len(tags)} 个" for tag_type, tags in StandardTagIndex._tags.items()))
+
+    @staticmethod
+    def get_tags(tag_type: str) -> List[str]:
+        """
+        获取指定类型的标准标签列表
+
+        Args:
+            tag_type: 标签类型
+
+        Returns:
+            标准标签列表
+        """
+        with StandardTagIndex._lock:
+            StandardTagIndex._ensure_loaded()
+            return list(StandardTagIndex._tags.get(tag_type, []))
+
+    @staticmethod
+    def get(analyzer, tag_type: str) -> Tuple[List[str], Optional["np.ndarray"]]:
+        """
+        获取指定类型的标准标签及其归一化向量
+
+        Args:
+            analyzer: TagSimilarityAnalyzer 实例，用于编码标准标签，向量按其模型名称缓存
+            tag_type: 标签类型
+
+        Returns:
+            (标准标签列表, 归一化向量矩阵)，没有标准标签时向量为None
+        """
+        with StandardTagIndex._lock:
+            StandardTagIndex._ensure_loaded()
+            tags = StandardTagIndex._tags.get(tag_type, [])
+            if not tags:
+                return [], None
+            key = (analyzer.model_name, tag_type)
+            embeddings = StandardTagIndex._embeddings.get(key)
+            if embeddings is None:
+                embeddings = analyzer._encode_normalized(tags)
+                StandardTagIndex._embeddings[key] = embeddings
+            return list(tags), embeddings
+
+    @staticmethod
+    def invalidate() -> None:
+        """强制下次使用时重新加载，用于本进程修改标准标签并提交后立即生效"""
+        with StandardTagIndex._lock:
+            StandardTagIndex._version = None
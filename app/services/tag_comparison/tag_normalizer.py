@@ -0,0 +1,364 @@
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+from app.database.db import get_db
+from app.models.llm_dao import LlmDAO
+from app.services.tag_comparison.standard_tag_index import StandardTagIndex
+from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+from app.utils.logger import get_logger, info, warning
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+
+# 计算向量与聚类中心相似度时每块的行数，控制临时矩阵的内存
+ASSIGN_CHUNK_SIZE = 8192
+
+
+class IvfIndex:
+    """
+    倒排文件(IVF)近似最近邻索引
+
+    用球面 k-means 把归一化向量划分到若干个列表，查询时只计算与查询最相近的 n_probe 个列表中的向量，
+    向量数量较少时退化为精确搜索。
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray, vectors: np.ndarray):
+        """
+        Args:
+            centroids: 聚类中心，形状 (列表数, 维度)
+            offsets: 每个列表在 ids/vectors 中的起始位置，长度为列表数+1
+            ids: 按列表排序后的向量原始编号
+            vectors: 按列表排序后的归一化向量
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: Optional[int] = None, iterations: int = 8, seed: int = 0) -> "IvfIndex":
+        """
+        构建索引
+
+        Args:
+            vectors: 归一化向量，形状 (数量, 维度)
+            n_lists: 列表数量，默认为向量数量的平方根
+            iterations: k-means 迭代次数
+            seed: 初始化聚类中心的随机种子
+
+        Returns:
+            索引实例
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        count = len(vectors)
+        n_lists = min(n_lists or max(1, int(np.sqrt(count))), max(count, 1))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(count, n_lists, replace=False)] if count else vectors[:0]
+
+        assign = np.zeros(count, dtype=np.int64)
+        for _ in range(iterations if n_lists > 1 else 0):
+            assign = cls._assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # 空列表保留原来的中心
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        if n_lists > 1:
+            assign = cls._assign(vectors, centroids)
+
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+        return cls(centroids, offsets, order, vectors[order])
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """将每个向量分配到最相近的聚类中心"""
+        return np.concatenate([
+            np.argmax(vectors[start:start + ASSIGN_CHUNK_SIZE] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE)
+        ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+    def search(self, queries: np.ndarray, k: int = 10, n_probe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        查询最相近的向量
+
+        Args:
+            queries: 归一化的查询向量，形状 (查询数, 维度)
+            k: 每个查询返回的数量
+            n_probe: 每个查询搜索的列表数量
+
+        Returns:
+            (原始编号, 余弦相似度)，形状均为 (查询数, k)，不足 k 个时编号为 -1、相似度为 -inf
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        n_lists = len(self.centroids)
+        if not len(self.ids) or not len(queries):
+            return result_ids, result_scores
+
+        n_probe = min(n_probe, n_lists)
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe] if n_probe < n_lists \
+            else np.tile(np.arange(n_lists), (len(queries), 1))
+
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            # 每个列表在排序后的数组中是连续的一段，直接切片计算，避免复制向量
+            ranges = [(self.offsets[i], self.offsets[i + 1]) for i in lists if self.offsets[i + 1] > self.offsets[i]]
+            if not ranges:
+                continue
+            scores = np.concatenate([self.vectors[start:end] @ query for start, end in ranges])
+            candidates = np.concatenate([self.ids[start:end] for start, end in ranges])
+            top = min(k, len(candidates))
+            best = np.argpartition(-scores, top - 1)[:top] if top < len(candidates) else np.arange(len(candidates))
+            best = best[np.argsort(-scores[best])]
+            result_ids[row, :top] = candidates[best]
+            result_scores[row, :top] = scores[best]
+        return result_ids, result_scores
+
+
+class TagNormalizer:
+    """
+    标签归一化
+
+    对诊断结果中出现过的全部标签按类型建立 IVF 近似最近邻索引，把相似度不低于阈值的近似重复标签
+    归并到出现次数最多的标签(规范标签)，并提供查询最相近的规范标签和标准标签的能力。
+    索引可以保存为 .npz 文件，供接口等其他进程直接加载。
+    """
+
+    def __init__(self, analyzer, threshold: Optional[float] = None):
+        """
+        Args:
+            analyzer: TagSimilarityAnalyzer 实例，用于编码标签
+            threshold: 归并近似重复标签的相似度阈值，默认读取配置 TAG_NORMALIZE_THRESHOLD
+        """
+        self.analyzer = analyzer
+        self.threshold = threshold if threshold is not None else settings.TAG_NORMALIZE_THRESHOLD
+        # 标签类型 -> {"tags", "counts", "canonical", "tag_ids", "index"}
+        self._types: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def index_path(model_name: str) -> str:
+        """索引文件路径，按模型名称区分"""
+        file_name = model_name.replace("/", "_").replace(":", "_")
+        return os.path.join(settings.TAG_INDEX_DIR, f"{file_name}.npz")
+
+    def build(self, neighbours: int = 32) -> Dict[str, Dict[str, int]]:
+        """
+        从 llm_note_diagnosis 读取全部标签并构建索引
+
+        Args:
+            neighbours: 归并近似重复标签时每个标签考察的近邻数量
+
+        Returns:
+            {标签类型: {"tags": 不同标签数, "canonical": 规范标签数}}
+        """
+        db = next(get_db())
+        try:
+            tag_counts = LlmDAO.get_distinct_tags(db)
+        finally:
+            db.close()
+
+        summary = {}
+        for tag_type, counter in tag_counts.items():
+            started_at = time.monotonic()
+            # 出现次数多的标签排在前面，优先成为规范标签
+            tags = [tag for tag, _ in counter.most_common()]
+            counts = np.array([counter[tag] for tag in tags], dtype=np.int64)
+            if not tags:
+                continue
+            embeddings = self.analyzer._encode_normalized(tags)
+            index = IvfIndex.build(embeddings)
+            canonical = self._cluster(index, embeddings, neighbours)
+            self._types[tag_type] = {
+                "tags": tags,
+                "counts": counts,
+                "canonical": canonical,
+                "tag_ids": {tag: i for i, tag in enumerate(tags)},
+                "index": index
+            }
+            summary[tag_type] = {"tags": len(tags), "canonical": int(np.sum(canonical == np.arange(len(tags))))}
+            info(f"标签索引 {tag_type}: {summary[tag_type]['tags']} 个不同标签，归并为 {summary[tag_type]['canonical']} 个规范标签，"
+                 f"耗时 {time.monotonic() - started_at:.1f} 秒")
+        return summary
+
+    def _cluster(self, index: IvfIndex, embeddings: np.ndarray, neighbours: int) -> np.ndarray:
+        """
+        归并近似重复标签
+
+        按出现次数从多到少遍历标签，尚未归并的标签成为规范标签，
+        并把其近邻中相似度不低于阈值且尚未归并的标签归并到它。
+
+        Returns:
+            每个标签对应的规范标签编号
+        """
+        neighbour_ids, neighbour_scores = index.search(embeddings, k=neighbours)
+        canonical = np.full(len(embeddings), -1, dtype=np.int64)
+        for i in range(len(embeddings)):
+            if canonical[i] >= 0:
+                continue
+            canonical[i] = i
+            members = neighbour_ids[i][(neighbour_scores[i] >= self.threshold) & (neighbour_ids[i] >= 0)]
+            members = members[canonical[members] < 0]
+            canonical[members] = i
+        return canonical
+
+    def save(self, path: Optional[str] = None) -> str:
+        """保存索引到 .npz 文件，返回文件路径"""
+        path = path or self.index_path(self.analyzer.model_name)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays: Dict[str, Any] = {"threshold": np.array(self.threshold), "tag_types": np.array(list(self._types))}
+        for tag_type, data in self._types.items():
+            index = data["index"]
+            arrays.update({
+                f"{tag_type}/tags": np.array(data["tags"]),
+                f"{tag_type}/counts": data["counts"],
+                f"{tag_type}/canonical": data["canonical"],
+                f"{tag_type}/centroids": index.centroids,
+                f"{tag_type}/offsets": index.offsets,
+                f"{tag_type}/ids": index.ids,
+                f"{tag_type}/vectors": index.vectors
+            })
+        np.savez(path, **arrays)
+        info(f"标签索引已保存: {path}")
+        return path
+
+    @classmethod
+    def load(cls, analyzer, path: Optional[str] = None) -> Optional["TagNormalizer"]:
+        """从 .npz 文件加载索引，文件不存在时返回None"""
+        path = path or cls.index_path(analyzer.model_name)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            normalizer = cls(analyzer, threshold=float(arrays["threshold"]))
+            for tag_type in arrays["tag_types"].tolist():
+                tags = arrays[f"{tag_type}/tags"].tolist()
+                normalizer._types[tag_type] = {
+                    "tags": tags,
+                    "counts": arrays[f"{tag_type}/counts"],
+                    "canonical": arrays[f"{tag_type}/canonical"],
+                    "tag_ids": {tag: i for i, tag in enumerate(tags)},
+                    "index": IvfIndex(
+                        arrays[f"{tag_type}/centroids"], arrays[f"{tag_type}/offsets"],
+                        arrays[f"{tag_type}/ids"], arrays[f"{tag_type}/vectors"]
+                    )
+                }
+        info(f"已加载标签索引: {path}")
+        return normalizer
+
+    def _canonical_of(self, tag_type: str, embeddings: np.ndarray, tags: List[str]) -> List[Tuple[str, float]]:
+        """查询每个标签对应的规范标签及相似度，索引中没有足够相似的标签时返回标签本身"""
+        data = self._types.get(tag_type)
+        if data is None:
+            return [(tag, 1.0) for tag in tags]
+        results = []
+        ids, scores = data["index"].search(embeddings, k=1)
+        for tag, (tag_id,), (score,) in zip(tags, ids, scores):
+            known_id = data["tag_ids"].get(tag)
+            if known_id is not None:
+                results.append((data["tags"][data["canonical"][known_id]], 1.0))
+            elif tag_id >= 0 and score >= self.threshold:
+                results.append((data["tags"][data["canonical"][tag_id]], float(score)))
+            else:
+                results.append((tag, 1.0))
+        return results
+
+    def normalize(self, tags: List[str], tag_type: str) -> List[str]:
+        """
+        将标签替换为规范标签
+
+        Args:
+            tags: 标签列表
+            tag_type: 标签类型
+
+        Returns:
+            与 tags 一一对应的规范标签列表
+        """
+        if not tags:
+            return []
+        embeddings = self.analyzer._encode_normalized(tags)
+        return [canonical for canonical, _ in self._canonical_of(tag_type, embeddings, tags)]
+
+    def nearest(self, tag: str, tag_type: str, k: int = 5) -> Dict[str, Any]:
+        """
+        查询标签对应的规范标签和最相近的标准标签
+
+        Args:
+            tag: 标签
+            tag_type: 标签类型
+            k: 返回的标准标签数量
+
+        Returns:
+            包含规范标签、最相近的标准标签及相似度、查询耗时的字典
+        """
+        started_at = time.perf_counter()
+        embedding = self.analyzer._encode_normalized([tag])
+        encoded_at = time.perf_counter()
+
+        canonical_tag, canonical_score = self._canonical_of(tag_type, embedding, [tag])[0]
+        standard_tags, standard_embeddings = StandardTagIndex.get(self.analyzer, tag_type)
+        nearest_standard = []
+        if standard_tags:
+            scores = standard_embeddings @ embedding[0]
+            for i in np.argsort(-scores)[:k]:
+                nearest_standard.append({"tag": standard_tags[i], "score": float(scores[i])})
+        finished_at = time.perf_counter()
+
+        return {
+            "tag": tag,
+            "tag_type": tag_type,
+            "canonical_tag": canonical_tag,
+            "canonical_score": canonical_score,
+            "standard_tags": nearest_standard,
+            "encode_ms": (encoded_at - started_at) * 1000,
+            "lookup_ms": (finished_at - encoded_at) * 1000
+        }
+
+    def clusters(self, tag_type: str, min_size: int = 2) -> Dict[str, List[str]]:
+        """
+        获取归并结果
+
+        Args:
+            tag_type: 标签类型
+            min_size: 只返回成员数量不少于该值的规范标签
+
+        Returns:
+            {规范标签: 成员标签列表}
+        """
+        data = self._types.get(tag_type)
+        if data is None:
+            return {}
+        groups: Dict[str, List[str]] = {}
+        for tag, canonical_id in zip(data["tags"], data["canonical"]):
+            groups.setdefault(data["tags"][canonical_id], []).append(tag)
+        return {canonical: members for canonical, members in groups.items() if len(members) >= min_size}
+
+
+# 进程内共享的标签归一化实例，按模型名称区分
+_normalizers: Dict[str, TagNormalizer] = {}
+_normalizers_lock = threading.Lock()
+
+
+def get_tag_normalizer(model_name: Optional[str] = None) -> Optional[TagNormalizer]:
+    """
+    获取已构建的标签归一化实例，首次调用时加载模型和索引文件
+
+    Args:
+        model_name: 模型名称，默认读取配置 TAG_INDEX_MODEL
+
+    Returns:
+        标签归一化实例，索引文件不存在时返回None
+    """
+    model_name = model_name or settings.TAG_INDEX_MODEL
+    with _normalizers_lock:
+        if model_name not in _normalizers:
+            if not os.path.exists(TagNormalizer.index_path(model_name)):
+                warning(f"标签索引不存在: {TagNormalizer.index_path(model_name)}，请先执行 tag build_tag_index")
+                return None
+            _normalizers[model_name] = TagNormalizer.load(TagSimilarityAnalyzer(model_name=model_name))
+        return _normalizers[model_name]
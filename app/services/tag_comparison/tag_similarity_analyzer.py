@@ -1,32 +1,86 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.optimize import linear_sum_assignment
+from app.config.settings import settings
+from app.services.tag_comparison.embedding_cache import get_embedding_cache
+from app.services.tag_comparison.embedding_server import EmbeddingServerError, get_embedding_client
+from app.services.tag_comparison.scoring_kernel import score_blocks
+from app.utils.logger import warning
 
 class TagSimilarityAnalyzer:
     """标签组相似度分析工具"""
     
-    def __init__(self, model_name='distiluse-v2'):
+    # 批量编码时每次送入模型的标签数量
+    ENCODE_BATCH_SIZE = 256
+    
+    # 模型简称 -> 预训练模型名称
+    MODEL_IDS = {
+        'bge': 'BAAI/bge-large-zh-v1.5',
+        'distiluse-v2': 'distiluse-base-multilingual-cased-v2'
+    }
+    
+    # 可选的推理后端，通过模型名称后缀选择，如 'bge:onnx'、'distiluse-v2:int8'
+    # onnx: ONNX Runtime 推理，需要安装 optimum[onnxruntime]
+    # int8: 对线性层做 int8 动态量化，只支持CPU
+    BACKENDS = ('torch', 'onnx', 'int8')
+    
+    def __init__(self, model_name='distiluse-v2', device=None, use_server=True):
         """
         初始化标签相似度分析器
         
         Args:
             model_name: 使用的预训练模型名称
+            device: 模型运行的设备，如 'cpu'、'cuda'，默认读取配置 TAG_MODEL_DEVICE
+            use_server: 本地嵌入服务可用时是否通过服务编码，为 True 且服务可用时不在本进程加载模型
         """
         self.model_name = model_name
-        self.model = self._load_model(model_name)
+        self.base_model_name, self.backend = self.parse_model_name(model_name)
+        self.device = device or settings.TAG_MODEL_DEVICE
+        self.embedding_client = get_embedding_client() if use_server else None
+        self._model = None if self.embedding_client else self._load_model(self.base_model_name)
+        self.embedding_cache = get_embedding_cache()
+        
+    @property
+    def model(self):
+        """本进程中的模型，通过嵌入服务编码时在首次使用时才加载"""
+        if self._model is None:
+            self._model = self._load_model(self.base_model_name)
+        return self._model
+        
+    @classmethod
+    def parse_model_name(cls, model_name):
+        """
+        拆分模型名称中的推理后端后缀
         
+        Args:
+            model_name: 模型名称，如 'bge'、'bge:onnx'
+            
+        Returns:
+            (模型简称, 推理后端)，没有后缀时后端为 'torch'
+        """
+        base_model_name, _, backend = model_name.partition(':')
+        backend = backend or 'torch'
+        if backend not in cls.BACKENDS:
+            raise ValueError(f"不支持的推理后端: {backend}，可选值: {', '.join(cls.BACKENDS)}")
+        return base_model_name, backend
+
     def _load_model(self, model_name):
-        """加载指定的模型"""
-        if model_name == 'bge':
-            # 对于 BAAI/bge-large-zh-v1.5 模型，我们需要特殊处理
-            return SentenceTransformer('BAAI/bge-large-zh-v1.5', device='cuda')
-        else:
-            return SentenceTransformer('distiluse-base-multilingual-cased-v2')
+        """加载指定的模型，按 self.backend 选择推理后端"""
+        # sentence_transformers 会加载 torch 等大型依赖，只在真正需要模型时导入
+        from sentence_transformers import SentenceTransformer
+        
+        model_id = self.MODEL_IDS.get(model_name, self.MODEL_IDS['distiluse-v2'])
+        if self.backend == 'onnx':
+            # sentence-transformers 会优先使用模型仓库中已导出的ONNX文件，没有时自动导出
+            return SentenceTransformer(model_id, device=self.device, backend='onnx')
+        
+        model = SentenceTransformer(model_id, device=self.device)
+        if self.backend == 'int8':
+            if self.device != 'cpu':
+                raise ValueError(f"int8 动态量化只支持CPU，当前设备: {self.device}")
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
 
-    def compare_tags(self, collected_tags, standard_tags, visualize=False):
+    def compare_tags(self, collected_tags, standard_tags, visualize=False, standard_embeddings=None):
         """
         比较收集的标签与标准标签的相似度
         
@@ -34,6 +88,7 @@ class TagSimilarityAnalyzer:
             collected_tags: 收集的标签列表
             standard_tags: 标准标签列表
             visualize: 是否可视化相似度矩阵
+            standard_embeddings: 可选，标准标签已归一化的向量(如 StandardTagIndex 中的向量)，传入时不再编码标准标签
             
         Returns:
             包含各种相似度指标的字典
@@ -48,18 +103,13 @@ class TagSimilarityAnalyzer:
                 "similarity_matrix": np.array([[0]])
             }
             
-        # 将标签转换为向量
-        collected_embeddings = self._encode_tags(collected_tags)
-        standard_embeddings = self._encode_tags(standard_tags)
+        # 将标签转换为归一化向量
+        collected_embeddings = self._encode_normalized(collected_tags)
+        if standard_embeddings is None:
+            standard_embeddings = self._encode_normalized(standard_tags)
         
-        # 确保向量是二维数组
-        if len(collected_embeddings.shape) == 1:
-            collected_embeddings = collected_embeddings.reshape(1, -1)
-        if len(standard_embeddings.shape) == 1:
-            standard_embeddings = standard_embeddings.reshape(1, -1)
-        
-        # 计算相似度矩阵
-        similarity_matrix = cosine_similarity(collected_embeddings, standard_embeddings)
+        # 计算相似度矩阵，归一化向量的点积即余弦相似度
+        similarity_matrix = collected_embeddings @ standard_embeddings.T
         
         # 计算多种相似度指标
         scores = self._calculate_scores(similarity_matrix)
@@ -84,22 +134,127 @@ class TagSimilarityAnalyzer:
         }
 
     def _encode_tags(self, tags):
-        """编码标签，处理不同模型的特殊需求"""
+        """
+        编码标签，已编码过的标签直接从向量缓存读取，
+        未命中的标签去重后一次性交给模型编码并写回缓存
+        """
+        if self.embedding_cache is None:
+            return self._encode_with_model(tags)
+        
+        cached = self.embedding_cache.get_many(self.model_name, tags)
+        missing = [tag for tag in dict.fromkeys(tags) if tag not in cached]
+        if missing:
+            new_embeddings = dict(zip(missing, self._encode_with_model(missing)))
+            self.embedding_cache.put_many(self.model_name, new_embeddings)
+            cached.update(new_embeddings)
+        return np.array([cached[tag] for tag in tags], dtype=np.float32)
+
+    def _encode_with_model(self, tags):
+        """调用模型编码标签，嵌入服务可用时交给服务编码，处理不同模型的特殊需求"""
+        if self.embedding_client is not None:
+            try:
+                return self.embedding_client.encode(self.model_name, tags)
+            except EmbeddingServerError as e:
+                warning(f"{e}，改用本地模型")
+                self.embedding_client = None
+        
         if self.model_name == 'BAAI/bge-large-zh-v1.5':
             # 对于 BAAI/bge-large-zh-v1.5 模型，需要添加特殊前缀
-            return self.model.encode([f"给出以下文本的意思：{tag}" for tag in tags])
+            return self.model.encode([f"给出以下文本的意思：{tag}" for tag in tags], batch_size=self.ENCODE_BATCH_SIZE)
         else:
-            return self.model.encode(tags)
+            return self.model.encode(tags, batch_size=self.ENCODE_BATCH_SIZE)
+
+    def _encode_normalized(self, tags):
+        """编码标签并做L2归一化，归一化后的向量点积即余弦相似度"""
+        embeddings = np.asarray(self._encode_tags(tags), dtype=np.float32)
+        if len(embeddings.shape) == 1:
+            embeddings = embeddings.reshape(1, -1)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
 
-    def _calculate_scores(self, similarity_matrix):
+    def compare_tags_batch(self, collected_tag_lists, standard_tags, standard_embeddings=None):
+        """
+        批量比较多组收集标签与同一组标准标签的相似度
+        
+        所有组中不重复的标签只编码一次，与归一化后的标准标签向量做一次矩阵乘法得到全部相似度，
+        再由 scoring_kernel.score_blocks 按组分段向量化计算 _calculate_scores 中的各项指标。
+        
+        Args:
+            collected_tag_lists: 收集的标签列表的列表，每个元素对应一篇笔记
+            standard_tags: 标准标签列表
+            standard_embeddings: 可选，标准标签已归一化的向量，传入时不再编码标准标签
+            
+        Returns:
+            与 collected_tag_lists 一一对应的结果列表，每项结构与 compare_tags 的返回值相同
+        """
+        results = [None] * len(collected_tag_lists)
+        non_empty = [i for i, tags in enumerate(collected_tag_lists) if tags]
+        for i, tags in enumerate(collected_tag_lists):
+            if not tags or not standard_tags:
+                results[i] = self._empty_result(tags, standard_tags)
+        if not non_empty or not standard_tags:
+            return results
+        
+        # 所有组的标签去重后一次编码，一次矩阵乘法得到每个标签与标准标签的相似度
+        unique_tags = list(dict.fromkeys(tag for i in non_empty for tag in collected_tag_lists[i]))
+        tag_index = {tag: idx for idx, tag in enumerate(unique_tags)}
+        if standard_embeddings is None:
+            standard_embeddings = self._encode_normalized(standard_tags)
+        similarity_all = self._encode_normalized(unique_tags) @ standard_embeddings.T
+        
+        # 按组拼接成一个大矩阵，每组占连续的若干行
+        row_index = np.array([tag_index[tag] for i in non_empty for tag in collected_tag_lists[i]])
+        lengths = np.array([len(collected_tag_lists[i]) for i in non_empty])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        block = similarity_all[row_index]
+        scores = score_blocks(block, starts, lengths)
+        weighted_scores = self._calculate_weighted_score(scores)
+        
+        for pos, (i, start, length) in enumerate(zip(non_empty, starts, lengths)):
+            results[i] = {
+                "score": float(weighted_scores[pos]),
+                "detailed_scores": {metric: float(values[pos]) for metric, values in scores.items()},
+                "similarity_matrix": block[start:start + length],
+                "collected_tags": collected_tag_lists[i],
+                "standard_tags": standard_tags
+            }
+        return results
+
+    @staticmethod
+    def _empty_result(collected_tags, standard_tags):
+        """收集标签或标准标签为空时的零分结果"""
+        return {
+            "score": 0,
+            "message": "收集的标签为空" if not collected_tags else "标准标签为空",
+            "detailed_scores": {
+                'max_similarity': 0.0,
+                'optimal_matching': 0.0,
+                'threshold_matching': 0.0,
+                'average_similarity': 0.0,
+                'coverage': 0.0
+            },
+            "collected_tags": collected_tags or [],
+            "standard_tags": standard_tags or [],
+            "similarity_matrix": np.array([[0]])
+        }
+
+    @staticmethod
+    def _optimal_matching(similarity_matrix):
+        """匈牙利算法（最优匹配）：整体最优的一对一匹配的平均相似度"""
+        from scipy.optimize import linear_sum_assignment
+        
+        row_ind, col_ind = linear_sum_assignment(-similarity_matrix)
+        return similarity_matrix[row_ind, col_ind].mean()
+
+    @staticmethod
+    def _calculate_scores(similarity_matrix):
         """计算多种相似度指标"""
         
         # 1. 最大匹配法：每个收集标签与最相似的标准标签匹配
         max_similarity = np.mean(np.max(similarity_matrix, axis=1))
         
         # 2. 匈牙利算法（最优匹配）：整体最优的一对一匹配
-        row_ind, col_ind = linear_sum_assignment(-similarity_matrix)
-        optimal_matching = similarity_matrix[row_ind, col_ind].mean()
+        optimal_matching = TagSimilarityAnalyzer._optimal_matching(similarity_matrix)
         
         # 3. 阈值匹配：相似度超过阈值(0.7)的标签对数量占比
         threshold_matching = np.mean(similarity_matrix >= 0.7)
@@ -118,7 +273,8 @@ class TagSimilarityAnalyzer:
             "coverage": coverage
         }
     
-    def _calculate_weighted_score(self, scores):
+    @staticmethod
+    def _calculate_weighted_score(scores):
         """计算加权总分"""
         weights = {
             "max_similarity": 0.3,
@@ -132,6 +288,9 @@ class TagSimilarityAnalyzer:
     
     def _visualize_similarity_matrix(self, matrix, collected_tags, standard_tags):
         """可视化相似度矩阵"""
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        
         plt.figure(figsize=(12, 8))
         sns.heatmap(matrix, annot=True, fmt=".2f", 
                     xticklabels=standard_tags, 
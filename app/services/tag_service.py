@@ -1,36 +1,101 @@
 import os
+import asyncio
+import multiprocessing
 import json
+import time
 import traceback
-from typing import Dict, Any, List, Optional, Tuple, TypeVar, Generic, Callable
-
-import numpy as np
-from sentence_transformers import SentenceTransformer, util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple, TypeVar, Generic, Callable, TYPE_CHECKING
 
 from app.config.settings import settings
 from app.database.db import get_db
 from sqlalchemy import text
 from app.services.llm_service import LlmService
-from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
 from app.services.xhs_service import XhsService
 from app.database.tag_dao import TagDAO
+from app.models.llm_dao import LlmDAO
+from app.services.tag_comparison.standard_tag_index import StandardTagIndex
 from app.utils.logger import get_logger, info, warning, error, debug
 
-from rich import print as rich_print
+# numpy、sentence_transformers 等向量计算依赖只在用到标签对比时导入，不拖慢采集等其他命令的启动
+if TYPE_CHECKING:
+    import numpy as np
+    from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
 
 os.environ['NUMEXPR_MAX_THREADS'] = '16'
 logger = get_logger(__name__)
 
 T = TypeVar('T')
 
+# 参与相似度分析的标签类型
+ANALYSE_TAG_TYPES = ("geo", "cultural")
+
+# 分片分析时子进程持有的分析器和标准标签向量，由 _init_analyse_worker 创建
+_worker_analyzer: Optional["TagSimilarityAnalyzer"] = None
+_worker_standard_embeddings: Dict[Tuple[str, Tuple[str, ...]], "np.ndarray"] = {}
+
+
+def _init_analyse_worker(model_name: str, device: Optional[str], threads: int):
+    """子进程初始化：限制计算线程数并在本进程加载一次模型，不经过嵌入服务，否则多进程分片并不能分摊编码计算"""
+    global _worker_analyzer
+    from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_analyzer = TagSimilarityAnalyzer(model_name=model_name, device=device, use_server=False)
+
+
+def _analyse_shard(shard: List[Tuple[str, str, Dict[str, List[str]]]], standard_tags: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """
+    在子进程中分析一个分片的笔记
+    
+    Args:
+        shard: (笔记ID, LLM模型名称, {标签类型: 标签列表}) 列表
+        standard_tags: {标签类型: 标准标签列表}
+        
+    Returns:
+        对比结果列表，每项的键与 TagDAO.save_comparison_result 的参数一致
+    """
+    analyzer = _worker_analyzer
+    results = []
+    for tag_type in ANALYSE_TAG_TYPES:
+        tags = standard_tags.get(tag_type, [])
+        key = (tag_type, tuple(tags))
+        if tags and key not in _worker_standard_embeddings:
+            _worker_standard_embeddings[key] = analyzer._encode_normalized(tags)
+        batch = analyzer.compare_tags_batch(
+            [collected[tag_type] for _, _, collected in shard], tags, _worker_standard_embeddings.get(key)
+        )
+        for (note_id, llm_name, _), result in zip(shard, batch):
+            results.append({
+                "note_id": note_id,
+                "llm_name": llm_name,
+                "tag_type": tag_type,
+                "collected_tags": result["collected_tags"],
+                "standard_tags": result["standard_tags"],
+                "similarity_matrix": result["similarity_matrix"].tolist(),
+                "scores": result["detailed_scores"],
+                "weighted_score": result["score"],
+                "interpretation": analyzer.get_interpretation(result["score"]),
+                "compare_model_name": analyzer.model_name
+            })
+    return results
+
+
 class TagService:
-    def __init__(self, model_name='distiluse-v2'):
+    def __init__(self, model_name='distiluse-v2', device=None):
         """
         初始化标签服务
         
         Args:
             model_name: 使用的预训练模型名称，可选值：'distiluse-v2', 'bge'
+            device: 模型运行的设备，默认读取配置 TAG_MODEL_DEVICE
         """
-        self.analyzer = TagSimilarityAnalyzer(model_name=model_name)
+        from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+        
+        self.analyzer = TagSimilarityAnalyzer(model_name=model_name, device=device)
         self.tag_dao = TagDAO()
     
     @staticmethod
@@ -41,12 +106,73 @@ class TagService:
         return []
     
     @staticmethod
-    def make_tags_from_note(note_id: str):
+    def _parse_diagnosis(response_text: str) -> Dict[str, Any]:
+        """将模型返回的文本解析为诊断数据"""
+        response_text = response_text.replace("False", "false")
+        response_text = response_text.replace("True", "true")
+        return json.loads(response_text)
+    
+    @staticmethod
+    def _split_batch_diagnosis(response_text: str, count: int) -> Dict[int, Dict[str, Any]]:
+        """
+        拆分批量提取的响应
+        
+        Args:
+            response_text: 模型返回的文本，格式为 {"results": [{"id": 编号, "keywords": ..., "data": ...}]}
+            count: 本批笔记数量
+            
+        Returns:
+            {笔记编号: 诊断数据}，只包含编号有效且结构完整的项
+        """
+        response_text = response_text.strip()
+        if response_text.startswith("```"):
+            response_text = response_text.strip("`").removeprefix("json").strip()
+        parsed = TagService._parse_diagnosis(response_text)
+        items = parsed.get("results", []) if isinstance(parsed, dict) else parsed
+        
+        results = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            if not 1 <= index <= count or index in results:
+                continue
+            if not isinstance(item.get("keywords"), dict) or not isinstance(item.get("data"), dict):
+                continue
+            results[index] = {"keywords": item["keywords"], "data": item["data"]}
+        return results
+    
+    @staticmethod
+    def make_tags_from_note(note_id: str, concurrency: Optional[int] = None, batch_size: int = 50, notes_per_request: int = 1):
         """
         给指定的笔记提取标签
 
         Args:
-            note_id (str): _description_
+            note_id (str): 笔记ID，为空时处理全部未诊断的笔记
+            concurrency: 同时请求模型的数量，默认按模型别名读取配置
+            batch_size: 每积累多少条诊断结果写一次数据库
+            notes_per_request: 每次请求打包的笔记数量，大于1时启用批量提取
+        """
+        return asyncio.run(TagService.make_tags_from_note_async(note_id, concurrency, batch_size, notes_per_request))
+    
+    @staticmethod
+    async def make_tags_from_note_async(note_id: str, concurrency: Optional[int] = None, batch_size: int = 50, notes_per_request: int = 1):
+        """
+        给笔记提取标签(异步版本)
+        
+        各笔记并发请求模型，并发数和限流重试由 LlmService.request_llm_async 按模型别名控制；
+        解析成功的诊断结果每 batch_size 条批量写入一次数据库。
+        notes_per_request 大于1时，未命中缓存的笔记每 notes_per_request 条打包成一次请求，
+        共用一份系统提示词；批量响应中缺失或格式错误的笔记改为逐条请求。
+
+        Args:
+            note_id (str): 笔记ID，为空时处理全部未诊断的笔记
+            concurrency: 同时请求模型的数量，默认按模型别名读取配置
+            batch_size: 每积累多少条诊断结果写一次数据库
+            notes_per_request: 每次请求打包的笔记数量，大于1时启用批量提取
         """
         
         db = next(get_db())
@@ -78,34 +204,104 @@ class TagService:
                 result = db.execute(query, {"llm_alias": llm_alias})
             
             notes = [(row[0], row[1], row[2]) for row in result]
-            if len(notes) == 0:
-                info("没有需要处理的数据")
-                return []
-            notes_length = len(notes)
-            for index, (note_id, note_display_title, note_desc) in enumerate(notes):
-                info(f"处理第 {index+1}/{notes_length} 条数据")
-                try:
-                    note_content = f"""【标题】：{note_display_title}
-【描述】：{note_desc}"""
-                    response_text = LlmService.request_llm(llm_alias=llm_alias, prompt=note_content, log_file_prefix="make_tags_from_note")
-                    # response_text = TagService._req_coze_api(note_content=note_content, note_id=note_id)
-                    response_text = response_text.replace("False", "false")
-                    response_text = response_text.replace("True", "true")
-                    diagnosis_data = json.loads(response_text)
-                    success = LlmService.store_note_diagnosis(note_id=note_id, llm_alias=llm_alias, diagnosis_data=diagnosis_data)
-                    if success:
-                        info(f"{note_id} 更新成功")
-                    else:
-                        error(f"{note_id} 更新失败")
-                except Exception as e:  
-                    error(f"出错: {note_id} - {e}")
-                    traceback.print_exc()
-                
         except Exception as e:
             error(f"提取标签失败: {e}")
             raise e
         finally:
             db.close()
+        
+        if len(notes) == 0:
+            info("没有需要处理的数据")
+            return []
+        notes_length = len(notes)
+        info(f"共 {notes_length} 条笔记待提取标签，模型: {llm_alias}，并发数: {concurrency or LlmService.get_alias_concurrency(llm_alias)}")
+        
+        def build_content(note_display_title: str, note_desc: str) -> str:
+            return f"""【标题】：{note_display_title}
+【描述】：{note_desc}"""
+        
+        async def diagnose(note_id: str, note_display_title: str, note_desc: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+            try:
+                note_content = build_content(note_display_title, note_desc)
+                response_text = await LlmService.request_llm_async(
+                    llm_alias=llm_alias, prompt=note_content, log_file_prefix="make_tags_from_note", concurrency=concurrency
+                )
+                # response_text = TagService._req_coze_api(note_content=note_content, note_id=note_id)
+                try:
+                    return note_id, TagService._parse_diagnosis(response_text)
+                except Exception:
+                    # 无法解析的响应不保留在缓存中，下次重新请求
+                    LlmService.invalidate_cached_response(llm_alias, note_content)
+                    raise
+            except Exception as e:
+                error(f"出错: {note_id} - {e}")
+                return note_id, None
+        
+        async def diagnose_group(group: List[Tuple[str, str, str]]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+            if len(group) == 1:
+                return [await diagnose(*group[0])]
+            
+            contents = [build_content(title, desc) for _, title, desc in group]
+            split_results: Dict[int, Dict[str, Any]] = {}
+            try:
+                response_text = await LlmService.request_llm_batch_async(
+                    llm_alias=llm_alias, prompts=contents, log_file_prefix="make_tags_from_note_batch", concurrency=concurrency
+                )
+                split_results = TagService._split_batch_diagnosis(response_text, len(group))
+            except Exception as e:
+                error(f"批量提取出错，{len(group)} 条笔记改为逐条请求: {e}")
+            
+            results = []
+            fallback = []
+            for index, (note, content) in enumerate(zip(group, contents), 1):
+                if index in split_results:
+                    # 拆分出的单篇结果按笔记内容和批量提示词版本写入缓存，之后重跑可以直接命中
+                    LlmService.cache_response(llm_alias, content, json.dumps(split_results[index], ensure_ascii=False))
+                    results.append((note[0], split_results[index]))
+                else:
+                    fallback.append(note)
+            
+            if fallback:
+                warning(f"批量响应中有 {len(fallback)}/{len(group)} 条笔记缺失或格式错误，改为逐条请求")
+                results.extend(await asyncio.gather(*(diagnose(*note) for note in fallback)))
+            return results
+        
+        # 已缓存的笔记逐条处理(直接命中缓存)，其余笔记按 notes_per_request 分组打包请求
+        groups: List[List[Tuple[str, str, str]]] = []
+        uncached = []
+        for note in notes:
+            if notes_per_request > 1 and LlmService.get_cached_response(llm_alias, build_content(note[1], note[2])) is None:
+                uncached.append(note)
+            else:
+                groups.append([note])
+        for start in range(0, len(uncached), notes_per_request):
+            groups.append(uncached[start:start + notes_per_request])
+        
+        pending: List[Tuple[str, Dict[str, Any]]] = []
+        processed = 0
+        stored = 0
+        failed = 0
+        started_at = time.monotonic()
+        tasks = [asyncio.create_task(diagnose_group(group)) for group in groups]
+        for task in asyncio.as_completed(tasks):
+            for note_id, diagnosis_data in await task:
+                processed += 1
+                if diagnosis_data is None:
+                    failed += 1
+                else:
+                    pending.append((note_id, diagnosis_data))
+            
+            if len(pending) >= batch_size or (processed == notes_length and pending):
+                # 数据库写入是同步操作，放到线程中执行，不阻塞其他请求
+                stored += await asyncio.to_thread(LlmService.store_note_diagnoses, llm_alias, pending)
+                pending = []
+                elapsed = time.monotonic() - started_at
+                info(f"已处理 {processed}/{notes_length} 条，写入 {stored} 条，失败 {failed} 条，{processed / elapsed:.2f} 条/秒")
+        
+        cache = LlmService.get_response_cache()
+        if cache is not None:
+            stats = cache.stats()
+            info(f"LLM响应缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，命中率 {stats['hit_rate']:.1%}，共 {stats['entries']} 条记录")
                 
         return []
     
@@ -126,64 +322,55 @@ class TagService:
         
         try:
             for tag_type, tags in collected_tags.items():
-                # 获取标准标签
-                standard_tags = self.tag_dao.get_standard_tags(tag_type)
+                # 从标准标签索引获取标准标签及其向量
+                standard_tags, standard_embeddings = StandardTagIndex.get(self.analyzer, tag_type)
                 
                 # 如果收集的标签为空，直接返回零分结果
                 if not tags:
-                    comparison_result = {
-                        "score": 0,
-                        "message": "收集的标签为空",
-                        "detailed_scores": {
-                            'max_similarity': 0.0,
-                            'optimal_matching': 0.0,
-                            'threshold_matching': 0.0,
-                            'average_similarity': 0.0,
-                            'coverage': 0.0
-                        },
-                        "collected_tags": [],
-                        "standard_tags": standard_tags,
-                        "similarity_matrix": np.array([[0]])
-                    }
+                    comparison_result = self.analyzer._empty_result([], standard_tags)
                 else:
                     # 进行标签对比
                     comparison_result = self.analyzer.compare_tags(
                         collected_tags=tags,
                         standard_tags=standard_tags,
-                        visualize=False
+                        visualize=False,
+                        standard_embeddings=standard_embeddings
                     )
                 
-                # 保存结果到数据库
-                scores = comparison_result.get('detailed_scores', {})
-                success = self.tag_dao.save_comparison_result(
-                    db=db,
-                    note_id=note_id,
-                    llm_name=llm_name,
-                    tag_type=tag_type,
-                    collected_tags=comparison_result.get('collected_tags', []),
-                    standard_tags=comparison_result.get('standard_tags', []),
-                    similarity_matrix=comparison_result.get('similarity_matrix', np.array([[0]])).tolist(),
-                    scores={
-                        'max_similarity': scores.get('max_similarity', 0.0),
-                        'optimal_matching': scores.get('optimal_matching', 0.0),
-                        'threshold_matching': scores.get('threshold_matching', 0.0),
-                        'average_similarity': scores.get('average_similarity', 0.0),
-                        'coverage': scores.get('coverage', 0.0)
-                    },
-                    weighted_score=comparison_result.get('score', 0),
-                    interpretation=self.analyzer.get_interpretation(comparison_result.get('score', 0)),
-                    compare_model_name=self.analyzer.model_name
-                )
-                
-                if not success:
-                    raise Exception(f"保存标签对比结果失败: {note_id} - {tag_type}")
-                
                 results[tag_type] = comparison_result
             
+            # 各类型的结果一次写入数据库
+            records = [self._comparison_record(note_id, llm_name, tag_type, result) for tag_type, result in results.items()]
+            if TagDAO.save_comparison_results(db, records) != len(records):
+                raise Exception(f"保存标签对比结果失败: {note_id}")
+            
             return results
         finally:
             db.close()
     
+    def _comparison_record(self, note_id: str, llm_name: str, tag_type: str, comparison_result: Dict[str, Any]) -> Dict[str, Any]:
+        """将一条标签对比结果转换为 TagDAO.save_comparison_results 的记录"""
+        scores = comparison_result.get('detailed_scores', {})
+        similarity_matrix = comparison_result.get('similarity_matrix', [[0]])
+        return {
+            "note_id": note_id,
+            "llm_name": llm_name,
+            "tag_type": tag_type,
+            "collected_tags": comparison_result.get('collected_tags', []),
+            "standard_tags": comparison_result.get('standard_tags', []),
+            "similarity_matrix": similarity_matrix.tolist() if hasattr(similarity_matrix, 'tolist') else similarity_matrix,
+            "scores": {
+                'max_similarity': scores.get('max_similarity', 0.0),
+                'optimal_matching': scores.get('optimal_matching', 0.0),
+                'threshold_matching': scores.get('threshold_matching', 0.0),
+                'average_similarity': scores.get('average_similarity', 0.0),
+                'coverage': scores.get('coverage', 0.0)
+            },
+            "weighted_score": comparison_result.get('score', 0),
+            "interpretation": self.analyzer.get_interpretation(comparison_result.get('score', 0)),
+            "compare_model_name": self.analyzer.model_name
+        }
+    
     def get_tag_comparison_results(self, note_id: str, llm_name: str = None) -> List[Dict[str, Any]]:
         """
         获取笔记的标签对比结果
@@ -223,27 +410,34 @@ class TagService:
     
     def similar_tag(self):
         """给标签做相似度匹配"""
+        from rich import print as rich_print
+        from sentence_transformers import util
+        
         # 示例标签
         tag1 = "护肤"
         tag2 = "美白精华"
 
         # 使用当前实例的 analyzer 进行编码
-        embedding1 = self.analyzer.model.encode(tag1)
-        embedding2 = self.analyzer.model.encode(tag2)
+        embedding1, embedding2 = self.analyzer._encode_tags([tag1, tag2])
 
         similarity = util.cos_sim(embedding1, embedding2).item()
         rich_print(similarity)
     
-    def analyse_tag_similarity(self, note_id: str = None):
+    @staticmethod
+    def _load_diagnosis_tags(note_id: str = None, limit: Optional[int] = None, normalize: Optional[bool] = None) -> List[Tuple[str, str, Dict[str, List[str]]]]:
         """
-        分析标签相似度并存储结果
+        查询需要分析的笔记及其诊断出的标签
         
         Args:
-            note_id (str, optional): 指定笔记ID，如果为None则分析所有未分析的笔记
+            note_id (str, optional): 指定笔记ID，如果为None则查询全部笔记
+            limit: 最多返回的记录数量，默认不限制
+            normalize: 是否将标签替换为规范标签(见 _normalize_collected_tags)，默认读取配置 TAG_NORMALIZE_ENABLED
+            
+        Returns:
+            (笔记ID, LLM模型名称, {标签类型: 标签列表}) 列表
         """
         db = next(get_db())
         try:
-            # 查询需要分析的笔记
             if note_id:
                 query = text("""
                     select l.note_id, l.llm_name, l.geo_tags, l.cultural_tags
@@ -255,47 +449,126 @@ class TagService:
                 query = text("""
                     select l.note_id, l.llm_name, l.geo_tags, l.cultural_tags
                     from llm_note_diagnosis as l
-                """)
-                result = db.execute(query)
+                """ + (" limit :limit" if limit else ""))
+                result = db.execute(query, {"limit": limit} if limit else {})
             
-            notes = [(row[0], row[1], json.loads(row[2]) if row[2] else [], 
-                     json.loads(row[3]) if row[3] else []) for row in result]
+            notes = [
+                (row[0], row[1], {
+                    "geo": LlmDAO.parse_tag_list(row[2]),
+                    "cultural": LlmDAO.parse_tag_list(row[3])
+                })
+                for row in result
+            ]
+        finally:
+            db.close()
+        
+        if normalize is None:
+            normalize = settings.TAG_NORMALIZE_ENABLED
+        if normalize:
+            return TagService._normalize_collected_tags(notes)
+        return notes
+    
+    @staticmethod
+    def _normalize_collected_tags(notes: List[Tuple[str, str, Dict[str, List[str]]]]) -> List[Tuple[str, str, Dict[str, List[str]]]]:
+        """
+        将笔记的标签替换为规范标签
+        
+        使用 tag build_tag_index 构建的标签归一化索引，近似重复的标签(如 "丽江古城" 与 "丽江古城景区")
+        替换为同一个规范标签，同一篇笔记中替换后重复的标签只保留一个。每种标签类型的不重复标签只编码一次。
+        索引不存在时保持原标签。
+        
+        Args:
+            notes: (笔记ID, LLM模型名称, {标签类型: 标签列表}) 列表
             
+        Returns:
+            标签替换为规范标签后的笔记列表
+        """
+        from app.services.tag_comparison.tag_normalizer import get_tag_normalizer
+        
+        normalizer = get_tag_normalizer()
+        if normalizer is None or not notes:
+            return notes
+        
+        canonical: Dict[str, Dict[str, str]] = {}
+        for tag_type in ANALYSE_TAG_TYPES:
+            unique_tags = list(dict.fromkeys(tag for _, _, collected in notes for tag in collected[tag_type]))
+            canonical[tag_type] = dict(zip(unique_tags, normalizer.normalize(unique_tags, tag_type)))
+            replaced = sum(1 for tag, target in canonical[tag_type].items() if tag != target)
+            info(f"{tag_type} 标签归一化: {len(unique_tags)} 个不重复标签中 {replaced} 个替换为规范标签")
+        
+        return [
+            (note_id, llm_name, {
+                tag_type: list(dict.fromkeys(canonical[tag_type][tag] for tag in collected[tag_type]))
+                for tag_type in ANALYSE_TAG_TYPES
+            })
+            for note_id, llm_name, collected in notes
+        ]
+    
+    def _compare_notes(self, notes: List[Tuple[str, str, Dict[str, List[str]]]], tag_type: str) -> List[Optional[Dict[str, Any]]]:
+        """
+        整批对比所有笔记中某一类型的标签
+        
+        整批对比失败时退回逐篇调用 compare_tags，出错的笔记结果为None并记录日志，不影响其他笔记。
+        
+        Args:
+            notes: (笔记ID, LLM模型名称, {标签类型: 标签列表}) 列表
+            tag_type: 标签类型
+            
+        Returns:
+            与 notes 一一对应的对比结果列表
+        """
+        standard_tags, standard_embeddings = StandardTagIndex.get(self.analyzer, tag_type)
+        try:
+            return self.analyzer.compare_tags_batch(
+                [collected[tag_type] for _, _, collected in notes], standard_tags, standard_embeddings
+            )
+        except Exception as e:
+            error(f"批量对比 {tag_type} 标签失败，改为逐篇对比: {e}")
+        
+        results = []
+        for note_id, llm_name, collected in notes:
+            tags = collected[tag_type]
+            try:
+                if not tags:
+                    results.append(self.analyzer._empty_result([], standard_tags))
+                else:
+                    results.append(self.analyzer.compare_tags(tags, standard_tags, standard_embeddings=standard_embeddings))
+            except Exception as e:
+                error(f"对比笔记 {note_id} - {llm_name} 的 {tag_type} 标签失败: {e}")
+                results.append(None)
+        return results
+    
+    def analyse_tag_similarity(self, note_id: str = None, batch_size: int = 500):
+        """
+        分析标签相似度并存储结果
+        
+        Args:
+            note_id (str, optional): 指定笔记ID，如果为None则分析所有未分析的笔记
+            batch_size: 每积累多少条结果写一次数据库
+        """
+        db = next(get_db())
+        try:
+            notes = self._load_diagnosis_tags(note_id)
             if not notes:
                 info("没有需要分析的笔记")
                 return
             
+            # 所有笔记按标签类型整批对比：不重复的标签只编码一次，相似度和各项得分向量化计算
+            batch_results = {tag_type: self._compare_notes(notes, tag_type) for tag_type in ANALYSE_TAG_TYPES}
+            
             total = len(notes)
-            for idx, (note_id, llm_name, geo_tags, cultural_tags) in enumerate(notes, 1):
+            pending: List[Dict[str, Any]] = []
+            stored = 0
+            for idx, (note_id, llm_name, _) in enumerate(notes, 1):
                 info(f"正在处理 {idx}/{total}: {note_id} - {llm_name}")
                 
-                # 处理可能的字符串列表问题
-                if isinstance(geo_tags, str):
-                    try:
-                        geo_tags = json.loads(geo_tags)
-                    except:
-                        # 如果是一个字符串，尝试将其转换为列表
-                        geo_tags = [tag.strip() for tag in geo_tags.strip('[]').replace('"', '').split(',') if tag.strip()]
-                
-                if isinstance(cultural_tags, str):
-                    try:
-                        cultural_tags = json.loads(cultural_tags)
-                    except:
-                        # 如果是一个字符串，尝试将其转换为列表
-                        cultural_tags = [tag.strip() for tag in cultural_tags.strip('[]').replace('"', '').split(',') if tag.strip()]
-                
                 try:
-                    # 准备标签数据
-                    collected_tags = {
-                        "geo": geo_tags,
-                        "cultural": cultural_tags
-                    }
-                    
-                    # 执行对比并保存
-                    results = self.compare_and_save_tags(
-                        note_id=note_id,
-                        llm_name=llm_name,
-                        collected_tags=collected_tags
+                    results = {tag_type: batch_results[tag_type][idx - 1] for tag_type in batch_results}
+                    failed_types = [tag_type for tag_type, result in results.items() if result is None]
+                    if failed_types:
+                        raise Exception(f"标签对比失败: {', '.join(failed_types)}")
+                    pending.extend(
+                        self._comparison_record(note_id, llm_name, tag_type, result) for tag_type, result in results.items()
                     )
                     
                     # 打印分析结果
@@ -314,7 +587,13 @@ class TagService:
                 except Exception as e:
                     error(f"处理笔记 {note_id} 时出错: {str(e)}")
                     traceback.print_exc()
-                    continue
+                
+                # 结果积累到 batch_size 条或处理完最后一条笔记时批量写入
+                if len(pending) >= batch_size or (idx == total and pending):
+                    stored += TagDAO.save_comparison_results(db, pending)
+                    pending = []
+            
+            info(f"标签相似度分析完成: {total} 条笔记，写入 {stored} 条结果")
                 
         except Exception as e:
             error(f"标签分析过程出错: {str(e)}")
@@ -322,6 +601,190 @@ class TagService:
         finally:
             db.close()
             
+    @staticmethod
+    def analyse_tag_similarity_parallel(
+        note_id: str = None,
+        model_name: str = 'distiluse-v2',
+        workers: Optional[int] = None,
+        device: Optional[str] = None,
+        shard_size: int = 200,
+        batch_size: int = 500
+    ):
+        """
+        多进程分片分析标签相似度并批量存储结果
+        
+        笔记按 shard_size 切分后分发到进程池，每个子进程只加载一次模型；
+        子进程返回的结果在主进程中每积累 batch_size 条批量写入一次数据库，并输出处理速度。
+        
+        Args:
+            note_id (str, optional): 指定笔记ID，如果为None则分析全部笔记
+            model_name: 使用的预训练模型名称，可选值：'distiluse-v2', 'bge'
+            workers: 子进程数量，默认为CPU核数
+            device: 模型运行的设备，默认读取配置 TAG_MODEL_DEVICE
+            shard_size: 每个分片包含的笔记数量
+            batch_size: 每积累多少条结果写一次数据库
+        """
+        notes = TagService._load_diagnosis_tags(note_id)
+        if not notes:
+            info("没有需要分析的笔记")
+            return
+        
+        cpu_count = os.cpu_count() or 1
+        workers = max(1, workers or cpu_count)
+        # 每个子进程分到的计算线程数，避免多个进程的线程争抢CPU
+        threads = max(1, cpu_count // workers)
+        standard_tags = TagDAO.get_all_standard_tags()
+        shards = [notes[start:start + shard_size] for start in range(0, len(notes), shard_size)]
+        total = len(notes)
+        info(f"共 {total} 条笔记待分析，分为 {len(shards)} 个分片，进程数: {workers}，"
+             f"设备: {device or settings.TAG_MODEL_DEVICE}，模型: {model_name}")
+        
+        db = next(get_db())
+        pending: List[Dict[str, Any]] = []
+        processed = 0
+        stored = 0
+        failed = 0
+        started_at = time.monotonic()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_analyse_worker,
+                initargs=(model_name, device, threads)
+            ) as executor:
+                futures = {executor.submit(_analyse_shard, shard, standard_tags): len(shard) for shard in shards}
+                for future in as_completed(futures):
+                    try:
+                        pending.extend(future.result())
+                    except Exception as e:
+                        failed += futures[future]
+                        error(f"分片分析失败，{futures[future]} 条笔记未处理: {e}")
+                    processed += futures[future]
+                    
+                    if len(pending) >= batch_size or (processed == total and pending):
+                        stored += TagDAO.save_comparison_results(db, pending)
+                        pending = []
+                        elapsed = time.monotonic() - started_at
+                        info(f"已分析 {processed}/{total} 条笔记，写入 {stored} 条结果，失败 {failed} 条，{processed / elapsed:.2f} 条/秒")
+        finally:
+            db.close()
+        
+        elapsed = time.monotonic() - started_at
+        info(f"标签相似度分析完成: {total} 条笔记，写入 {stored} 条结果，失败 {failed} 条，"
+             f"耗时 {elapsed:.1f} 秒，{total / elapsed:.2f} 条/秒")
+    
+    @staticmethod
+    def _current_rss_mb() -> float:
+        """当前进程的常驻内存(MB)，非Linux系统返回进程的内存峰值"""
+        try:
+            with open("/proc/self/status", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    
+    @staticmethod
+    def check_backend(
+        model_name: str,
+        reference_model_name: Optional[str] = None,
+        limit: int = 200,
+        tolerance: float = 0.02,
+        device: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        检查推理后端的精度和性能
+        
+        用参考模型和待检查的模型分别编码同一批笔记标签和标准标签，比较相似度得分的差异，
+        并输出两者的编码速度和加载模型增加的内存。检查时不使用标签向量缓存。
+        
+        Args:
+            model_name: 待检查的模型名称，如 'bge:onnx'、'distiluse-v2:int8'
+            reference_model_name: 参考模型名称，默认为去掉后端后缀的模型
+            limit: 参与检查的笔记数量
+            tolerance: 允许的加权得分最大差异
+            device: 模型运行的设备，默认读取配置 TAG_MODEL_DEVICE
+            
+        Returns:
+            检查结果，passed 表示加权得分最大差异不超过 tolerance
+        """
+        import numpy as np
+        from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+        
+        base_model_name, _ = TagSimilarityAnalyzer.parse_model_name(model_name)
+        reference_model_name = reference_model_name or base_model_name
+        # 比较的是推理后端的差异，使用原始标签
+        notes = TagService._load_diagnosis_tags(limit=limit, normalize=False)
+        standard_tags = TagDAO.get_all_standard_tags()
+        all_tags = list(dict.fromkeys(
+            [tag for _, _, collected in notes for tag_type in ANALYSE_TAG_TYPES for tag in collected[tag_type]]
+            + [tag for tag_type in ANALYSE_TAG_TYPES for tag in standard_tags.get(tag_type, [])]
+        ))
+        if not all_tags:
+            warning("没有可用于检查的标签")
+            return {}
+        
+        runs = {}
+        for name in (reference_model_name, model_name):
+            rss_before = TagService._current_rss_mb()
+            analyzer = TagSimilarityAnalyzer(model_name=name, device=device, use_server=False)
+            analyzer.embedding_cache = None
+            rss_after = TagService._current_rss_mb()
+            
+            started_at = time.monotonic()
+            embeddings = analyzer._encode_normalized(all_tags)
+            encode_seconds = time.monotonic() - started_at
+            
+            scores = []
+            for tag_type in ANALYSE_TAG_TYPES:
+                batch = analyzer.compare_tags_batch(
+                    [collected[tag_type] for _, _, collected in notes], standard_tags.get(tag_type, [])
+                )
+                scores.extend(result["score"] for result in batch)
+            
+            runs[name] = {
+                "analyzer": analyzer,
+                "embeddings": embeddings,
+                "scores": np.array(scores, dtype=np.float64),
+                "tags_per_second": len(all_tags) / encode_seconds if encode_seconds else float("inf"),
+                "rss_mb": rss_after - rss_before
+            }
+            info(f"{name}: 编码 {len(all_tags)} 个标签，{runs[name]['tags_per_second']:.1f} 个/秒，"
+                 f"加载模型增加内存 {runs[name]['rss_mb']:.0f} MB")
+        
+        reference = runs[reference_model_name]
+        candidate = runs[model_name]
+        score_diff = np.abs(candidate["scores"] - reference["scores"])
+        interpretation_agreement = np.mean([
+            reference["analyzer"].get_interpretation(a) == candidate["analyzer"].get_interpretation(b)
+            for a, b in zip(reference["scores"], candidate["scores"])
+        ])
+        embedding_cosine = np.sum(reference["embeddings"] * candidate["embeddings"], axis=1)
+        
+        report = {
+            "model_name": model_name,
+            "reference_model_name": reference_model_name,
+            "notes": len(notes),
+            "tags": len(all_tags),
+            "max_score_diff": float(score_diff.max()),
+            "mean_score_diff": float(score_diff.mean()),
+            "interpretation_agreement": float(interpretation_agreement),
+            "min_embedding_cosine": float(embedding_cosine.min()),
+            "mean_embedding_cosine": float(embedding_cosine.mean()),
+            "speedup": candidate["tags_per_second"] / reference["tags_per_second"],
+            "rss_mb": {reference_model_name: reference["rss_mb"], model_name: candidate["rss_mb"]},
+            "passed": bool(score_diff.max() <= tolerance)
+        }
+        (info if report["passed"] else warning)(
+            f"{model_name} 对比 {reference_model_name}: 加权得分最大差异 {report['max_score_diff']:.4f}，"
+            f"平均差异 {report['mean_score_diff']:.4f}，解释一致率 {report['interpretation_agreement']:.1%}，"
+            f"向量平均余弦 {report['mean_embedding_cosine']:.4f}，编码速度 {report['speedup']:.2f} 倍，"
+            f"{'通过' if report['passed'] else '未通过'}(容差 {tolerance})"
+        )
+        return report
+    
     def init_standard_tags(self):
         """初始化标准标签到数据库"""
         standard_tags = {
@@ -348,6 +811,8 @@ class TagService:
                     if not success:
                         raise Exception(f"保存标准标签失败: {tag_name}")
             db.commit()
+            # 提交成功后再让标准标签索引失效，其他进程在下次检查版本时重新加载
+            StandardTagIndex.invalidate()
             info("标准标签初始化完成")
         except Exception as e:
             error(f"标准标签初始化失败: {str(e)}")
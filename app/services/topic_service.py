@@ -1,10 +1,11 @@
-import time
+import asyncio
 import sys
-import random
 from typing import List
 from sqlalchemy import text
 from app.database.db import get_db
 from app.services.xhs_service import XhsService
+from app.services.crawl_scheduler import CrawlScheduler, CrawlCheckpoint
+from app.models.xhs_dao import XhsDAO
 from app.utils.logger import get_logger, info, warning, error, debug
 import traceback
 from rich import print as rich_print
@@ -12,18 +13,35 @@ from rich import print as rich_print
 # 获取当前模块的日志器
 logger = get_logger(__name__)
 
+# 增量采集评论时每成功采集多少篇笔记保存一次评论数记录，运行结束时再保存一次
+COMMENT_COUNTS_FLUSH_EVERY = 100
+
 class TopicService:
     @staticmethod
-    def search_notes_by_topic(min_view_num: int = 10000, topic_limit: int = 20, notes_per_topic: int = 200):
+    def search_notes_by_topic(
+        min_view_num: int = 10000,
+        topic_limit: int = 20,
+        notes_per_topic: int = 200,
+        workers: int = 3,
+        rate_per_minute: float = 6,
+        min_delay: float = 10,
+        max_delay: float = 30,
+        resume: bool = True
+    ):
         """
         根据热门话题搜索笔记
         
-        从xhs_topic_discussions表中找到符合条件的热门话题，然后根据这些话题获取笔记
+        从xhs_topic_discussions表中找到符合条件的热门话题，然后由调度器将话题分发给多个worker并发获取笔记
         
         Args:
             min_view_num: 最小浏览量，默认10000
             topic_limit: 处理话题的最大数量，默认20个
             notes_per_topic: 每个话题获取的笔记数量，默认200
+            workers: 并发worker数量，默认3
+            rate_per_minute: 全局每分钟最多开始处理的话题数，默认6
+            min_delay: 每个worker处理两个话题之间的最小等待秒数，默认10
+            max_delay: 每个worker处理两个话题之间的最大等待秒数，默认30
+            resume: 是否从上次中断的进度继续，默认是
             
         Returns:
             处理的话题数量
@@ -65,32 +83,34 @@ class TopicService:
                 error(f"没有找到符合条件的热门话题!")
                 return 0
 
-            # 遍历话题获取笔记
-            total_notes = 0
+            # 过滤无效话题，话题名称作为任务唯一键
+            tasks = []
             for topic in topics:
                 # 确保键名存在
                 topic_name = topic.get("topic_name", "未知话题")
                 id = topic.get("id", topic.get("id", "未知ID"))
-                view_num = topic.get("view_num", 0)
                 
                 if not topic_name or topic_name == "未知话题":
                     warning(f"跳过无效话题: ID={id}")
                     continue
-                
-                info(f"处理话题: {topic_name}(ID: {id})，浏览量: {view_num}")
-                
-                try:
-                    # 使用话题名称作为标签获取笔记
-                    notes = XhsService.get_notes_by_tag(topic_name, notes_per_topic)
-                    total_notes += len(notes)
-                    info(f"成功获取话题 '{topic_name}' 的 {len(notes)} 条笔记")
-                except Exception as e:
-                    error(f"获取话题 '{topic_name}' 的笔记时出错: {e}")
-    
-                    error(traceback.format_exc())
-                    
-                info("等待60秒后处理下一个话题...")
-                time.sleep(60)
+                tasks.append((topic_name, topic))
+            
+            async def crawl_topic(topic) -> int:
+                info(f"处理话题: {topic['topic_name']}(ID: {topic['id']})，浏览量: {topic['view_num']}")
+                # 使用话题名称作为标签获取笔记，失败时抛出异常，由调度器记为失败并在续跑时重试
+                notes = await XhsService.get_notes_by_tag_async(topic["topic_name"], notes_per_topic, raise_on_error=True)
+                return len(notes)
+            
+            scheduler = CrawlScheduler(
+                name="search_notes_by_topic",
+                worker_count=workers,
+                rate_per_minute=rate_per_minute,
+                min_delay=min_delay,
+                max_delay=max_delay,
+                resume=resume
+            )
+            stats = XhsService.run_sync(scheduler.run(tasks, crawl_topic))
+            total_notes = sum(stat["yield"] for stat in stats)
             
             info(f"任务完成，共处理 {len(topics)} 个话题，获取 {total_notes} 条笔记")
             return len(topics)
@@ -104,46 +124,86 @@ class TopicService:
             db.close()
 
     @staticmethod
-    def deal_note_have_detail():
+    def deal_note_have_detail(page_size: int = 200, concurrency: int = 5, resume: bool = True):
         """
         处理没有详情页的笔记
+        
+        按 note_id 做键集分页，逐页拉取缺少详情的笔记，页内以有限并发获取详情，
+        整页结果通过 XhsDAO.store_note_details 批量写入，每页结束后保存游标，中断后可以继续
+        
+        Args:
+            page_size: 每页处理的笔记数量，默认200
+            concurrency: 页内同时获取详情的最大数量，默认5
+            resume: 是否从上次中断的游标继续，默认是
+            
+        Returns:
+            成功获取详情的笔记数量
         """
         info(f"开始处理没有详情页的笔记")
 
         # 获取数据库连接
         db = next(get_db())
-        processed_count = 0
+        checkpoint = CrawlCheckpoint("deal_note_have_detail")
+        state = checkpoint.load() if resume else {}
+        cursor = state.get("cursor", "")
+        processed_count = state.get("processed", 0)
+        if cursor:
+            info(f"从上次的游标继续: {cursor}，已处理 {processed_count} 条")
         
-        try:
-            # 查询没有详情页的笔记
-            query = text("""
-                SELECT xhs_notes.note_url
-                FROM xhs_notes left join xhs_note_details on xhs_notes.note_id = xhs_note_details.note_id
-                WHERE xhs_note_details.note_desc is null or xhs_note_details.note_id is null
-            """)
+        # 查询没有详情页的笔记，按note_id键集分页
+        query = text("""
+            SELECT xhs_notes.note_id, xhs_notes.note_url
+            FROM xhs_notes left join xhs_note_details on xhs_notes.note_id = xhs_note_details.note_id
+            WHERE (xhs_note_details.note_desc is null or xhs_note_details.note_id is null)
+            AND xhs_notes.note_id > :cursor
+            ORDER BY xhs_notes.note_id
+            LIMIT :page_size
+        """)
+        
+        async def fetch_page(note_urls: List[str]):
+            semaphore = asyncio.Semaphore(concurrency)
             
-            result = db.execute(query)
-            note_urls = [row[0] for row in result]
-            
-            info(f"------------ 找到 {len(note_urls)} 条没有详情页的笔记 ----------------")
-            
-            for index, note_url in enumerate(note_urls):
-                info(f"处理第 {index} 条笔记: {note_url}")
-                # 获取详情页
-                try:
-                    detail = XhsService.get_xhs_note_detail(note_url)
-                    if detail:
-                        processed_count += 1
-                    else:
-                        warning(f"获取笔记详情页失败: {note_url}")
-                except Exception as e:
-                    error(f"获取笔记详情页出错: {note_url} - {e}")
-                    
-                # 随机等待1-5秒
-                sleep_time = random.randint(1, 3)
-                info(f"等待 {sleep_time} 秒后继续...")
-                time.sleep(sleep_time)
+            async def fetch(note_url: str):
+                async with semaphore:
+                    try:
+                        detail = await XhsService.fetch_xhs_note_detail_async(note_url)
+                        if not detail:
+                            warning(f"获取笔记详情页失败: {note_url}")
+                        return note_url, detail
+                    except Exception as e:
+                        error(f"获取笔记详情页出错: {note_url} - {e}")
+                        return note_url, None
+            
+            return await asyncio.gather(*(fetch(note_url) for note_url in note_urls))
+        
+        async def backfill():
+            nonlocal cursor, processed_count
+            page_index = 0
+            while True:
+                rows = (await asyncio.to_thread(
+                    lambda: db.execute(query, {"cursor": cursor, "page_size": page_size}).fetchall()
+                ))
+                if not rows:
+                    break
                 
+                page_index += 1
+                info(f"------------ 第 {page_index} 页，{len(rows)} 条没有详情页的笔记，游标: {cursor or '起点'} ----------------")
+                results = await fetch_page([row[1] for row in rows])
+                detail_responses = [({"noteUrl": note_url}, detail) for note_url, detail in results if detail]
+                
+                if detail_responses:
+                    stored_notes = await asyncio.to_thread(XhsDAO.store_note_details, db, detail_responses)
+                    processed_count += len(stored_notes)
+                
+                cursor = rows[-1][0]
+                checkpoint.save({"cursor": cursor, "processed": processed_count})
+                
+                if len(rows) < page_size:
+                    break
+        
+        try:
+            XhsService.run_sync(backfill())
+            checkpoint.clear()
             info(f"任务完成，共处理 {processed_count} 条笔记")
             return processed_count
             
@@ -156,45 +216,123 @@ class TopicService:
             db.close()
     
     @staticmethod
-    def deal_note_comments():
+    def deal_note_comments(
+        limit: int = 500,
+        workers: int = 3,
+        rate_per_minute: float = 6,
+        min_delay: float = 5,
+        max_delay: float = 15,
+        resume: bool = True
+    ):
         """
-        处理没有评论的笔记
+        增量处理笔记评论
+        
+        对比 xhs_comments 中已存储的评论数与 xhs_note_details.comment_count，只处理有新增评论或仍有未展开子评论
+        (comment_sub_comment_has_more)的笔记，按新增评论数、互动量从高到低排序后由调度器以有限并发获取。
+        每篇笔记成功采集时记录当时的评论数和未展开子评论数，两者都没有变化的笔记在后续运行中不会重复采集，
+        避免子评论始终无法展开的笔记被反复采集；采集失败时抛出异常，由调度器记为 failed，不记录评论数。
+        评论数记录每 COMMENT_COUNTS_FLUSH_EVERY 篇笔记和运行结束时各保存一次，不在每篇笔记后重写整个文件。
+        
+        Args:
+            limit: 本次最多处理的笔记数量，默认500
+            workers: 并发worker数量，默认3
+            rate_per_minute: 全局每分钟最多开始处理的笔记数，默认6
+            min_delay: 每个worker处理两篇笔记之间的最小等待秒数，默认5
+            max_delay: 每个worker处理两篇笔记之间的最大等待秒数，默认15
+            resume: 是否从上次中断的进度继续，默认是
+            
+        Returns:
+            成功获取评论的笔记数量
         """
-        info(f"开始处理没有评论的笔记")
+        info(f"开始增量处理笔记评论")
 
         # 获取数据库连接
         db = next(get_db())
-        processed_count = 0
+        # 记录每篇笔记最近一次采集时的评论数和未展开子评论数
+        crawled_checkpoint = CrawlCheckpoint("note_comment_counts")
+        crawled_counts = crawled_checkpoint.load()
         
         try:
-            # 查询没有详情页的笔记
+            # 查询评论数与已存储评论数存在差额，或仍有未展开子评论的笔记
             query = text("""
-                select note_url, comment_count, note_liked_count
-                from xhs_note_details where comment_count > 0 and note_liked_count > 0
+                select d.note_id, d.note_url, d.comment_count,
+                    coalesce(c.stored_count, 0) as stored_count,
+                    coalesce(c.open_threads, 0) as open_threads
+                from xhs_note_details as d
+                left join (
+                    select note_id, count(*) as stored_count,
+                        sum(comment_sub_comment_has_more = 1) as open_threads
+                    from xhs_comments
+                    group by note_id
+                ) as c on d.note_id = c.note_id
+                where d.comment_count > 0 and d.note_liked_count > 0
+                and (d.comment_count > coalesce(c.stored_count, 0) or coalesce(c.open_threads, 0) > 0)
+                order by d.comment_count - coalesce(c.stored_count, 0) desc,
+                    d.note_liked_count + d.collected_count + d.share_count desc,
+                    coalesce(c.open_threads, 0) desc
             """)
 
             result = db.execute(query)
-            note_data = [(row[0], row[1]) for row in result]
-            
-            info(f"找到 {len(note_data)} 条需要获取评论的笔记")
-            
-            for note_url, comment_count in note_data:
-                info(f"处理笔记: {note_url}, 评论数: {comment_count}")
-                # 获取评论
-                try:
-                    comments = XhsService.get_comments_by_note_url(note_url, comment_count)
-                    if comments:
-                        info(f"获取笔记评论成功: {note_url} - {len(comments)} 条评论")
-                        processed_count += 1
-                    else:
-                        warning(f"获取笔记评论失败: {note_url}")
-                except Exception as e:
-                    error(f"获取笔记评论出错: {note_url} - {e}")
-                
-                # 随机等待60-100秒，避免频繁请求
-                sleep_time = random.randint(60, 100)
-                info(f"等待 {sleep_time} 秒后继续...")
-                time.sleep(sleep_time)
+            tasks = []
+            for note_id, note_url, comment_count, stored_count, open_threads in result:
+                open_threads = int(open_threads or 0)
+                crawled = crawled_counts.get(note_id)
+                # 兼容旧版本只记录评论数的进度文件
+                if isinstance(crawled, int):
+                    crawled = {"comment_count": crawled, "open_threads": 0}
+                # 评论数和未展开子评论数都与上次采集时相同，说明再次采集也取不到新评论
+                if crawled and crawled["comment_count"] >= comment_count and crawled["open_threads"] == open_threads:
+                    continue
+                tasks.append((note_id, {
+                    "note_id": note_id,
+                    "note_url": note_url,
+                    "comment_count": comment_count,
+                    "delta": comment_count - stored_count,
+                    "open_threads": open_threads
+                }))
+                if len(tasks) >= limit:
+                    break
+            
+            info(f"找到 {len(tasks)} 条需要增量获取评论的笔记")
+            if not tasks:
+                return 0
+            
+            unsaved = 0
+            
+            async def crawl_comments(note) -> int:
+                nonlocal unsaved
+                info(f"处理笔记: {note['note_url']}, 评论数: {note['comment_count']}, 新增: {note['delta']}, 未展开子评论: {note['open_threads']}")
+                # 失败时抛出异常，调度器将任务记为 failed，续跑时重试
+                comments = await XhsService.get_comments_by_note_url_async(
+                    note["note_url"], note["comment_count"], raise_on_error=True
+                )
+                if comments:
+                    crawled_counts[note["note_id"]] = {
+                        "comment_count": note["comment_count"],
+                        "open_threads": note["open_threads"]
+                    }
+                    unsaved += 1
+                    if unsaved >= COMMENT_COUNTS_FLUSH_EVERY:
+                        crawled_checkpoint.save(crawled_counts)
+                        unsaved = 0
+                else:
+                    warning(f"获取笔记评论失败: {note['note_url']}")
+                return len(comments)
+            
+            scheduler = CrawlScheduler(
+                name="deal_note_comments",
+                worker_count=workers,
+                rate_per_minute=rate_per_minute,
+                min_delay=min_delay,
+                max_delay=max_delay,
+                resume=resume
+            )
+            try:
+                stats = XhsService.run_sync(scheduler.run(tasks, crawl_comments))
+            finally:
+                if unsaved:
+                    crawled_checkpoint.save(crawled_counts)
+            processed_count = len([stat for stat in stats if stat["yield"] > 0])
                 
             info(f"任务完成，共处理 {processed_count} 条笔记评论")
             return processed_count
@@ -205,4 +343,4 @@ class TopicService:
             return 0
             
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
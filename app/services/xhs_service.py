@@ -1,15 +1,19 @@
 import os
-import time
-import requests
+import asyncio
 import json
 import traceback
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Tuple, Type, TypeVar, Generic, Callable
+from typing import Dict, Any, List, Optional, Tuple, Type, TypeVar, Generic, Callable, Awaitable
 
 from app.config.settings import settings
 from app.models.xhs_dao import XhsDAO
 from app.models.xhs_models import XhsSearchResponse, XhsNote, XhsAutherNotesResponse, XhsComment, XhsCommentsResponse, XhsNoteDetail, XhsNoteDetailResponse, XhsTopicDiscussion, XhsTopicsResponse
 from app.database.db import get_db
+from app.services.coze_client import CozeClient
+from app.services.rate_limiter import backoff_delay
+from app.services.response_archive import get_response_archive
+from app.utils.json_utils import json_loads
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
 from sqlalchemy import text
 from app.utils.logger import get_logger, info, warning, error, debug
 from rich import print as rich_print
@@ -22,11 +26,45 @@ T = TypeVar('T')
 class XhsService:
     """小红书服务类，处理与小红书相关的业务逻辑"""
     max_retries = 5
+    # 所有采集方法共享的Coze异步客户端
+    _coze_client: Optional[CozeClient] = None
+    # 各响应类型对应的data字段外层解析模型
+    _envelope_models: Dict[type, Type[BaseModel]] = {}
     
     @staticmethod
-    def _call_coze_api(workflow_id: str, parameters: Dict[str, Any], log_file_prefix: str, retries: int = 0) -> Dict[str, Any]:
+    def get_coze_client() -> CozeClient:
+        """获取共享的Coze异步客户端"""
+        if XhsService._coze_client is None:
+            XhsService._coze_client = CozeClient()
+        return XhsService._coze_client
+    
+    @staticmethod
+    def run_sync(coro: Awaitable[T]) -> T:
+        """
+        在新的事件循环中运行协程，结束后关闭共享连接池，供同步调用方使用
+        
+        Args:
+            coro: 需要运行的协程
+            
+        Returns:
+            协程的返回值
+        """
+        async def _runner():
+            try:
+                return await coro
+            finally:
+                await XhsService.get_coze_client().close()
+        
+        return asyncio.run(_runner())
+    
+    @staticmethod
+    async def _call_coze_api_async(workflow_id: str, parameters: Dict[str, Any], log_file_prefix: str) -> Dict[str, Any]:
         """
-        调用Coze API并保存响应
+        异步调用Coze API并保存响应
+        
+        请求前先从共享令牌桶获取令牌；遇到限流(4013)或服务端繁忙(720702222)时按带抖动的指数退避重试，
+        最多重试 max_retries 次。等待期间不阻塞事件循环，其他排队的请求可以继续执行。
+        每次的原始响应都会提交到 ResponseArchive，由后台线程写入压缩归档。
         
         Args:
             workflow_id: 工作流ID
@@ -34,113 +72,143 @@ class XhsService:
             log_file_prefix: log文件前缀
             
         Returns:
-            API响应结果
+            API响应结果，失败时返回空字典
         """
-        url = "https://api.coze.cn/v1/workflow/run"
-        headers = {
-            "Authorization": f"Bearer {settings.COZE_API_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
         # 确保cookie存在于参数中
         if "cookie" not in parameters:
             parameters["cookie"] = settings.XHS_COOKIE
-            
-        payload = {
-            "parameters": parameters,
-            "workflow_id": workflow_id
-        }
+        
+        client = XhsService.get_coze_client()
         
         try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()  # 如果请求失败，抛出异常
-            
-            # 确保目录存在
-            log_dir = "logs/coze_http_request"
-            date = datetime.now().strftime("%Y%m%d")
-            os.makedirs(f"{log_dir}/{log_file_prefix}/{date}", exist_ok=True)
-            # 生成文件名,使用时间戳避免重名
-            timestamp = datetime.now().strftime("%H%M%S")
-            filename = f"{log_dir}/{log_file_prefix}/{date}/{timestamp}.json"
-            # 保存响应内容
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(response.json(), f, ensure_ascii=False, indent=2)
+            for attempt in range(XhsService.max_retries + 1):
+                await client.rate_limiter.acquire()
+                resp_json = await client.run_workflow(workflow_id, parameters)
+                
+                # 交给后台线程追加到压缩归档，不占用请求耗时
+                get_response_archive().submit(log_file_prefix, workflow_id, parameters, resp_json)
+                
+                # 根据响应状态码处理逻辑
+                match resp_json.get("code"):
+                    case 4013:
+                        # 请求频率超出限制，降低共享速率后退避重试
+                        client.rate_limiter.on_throttled()
+                        reason = "请求频率超出限制"
+                    case 720702222:
+                        # We're currently experiencing server issues. Please try your request again after a short delay. If the problem persists, contact our support team.
+                        reason = "Coze服务端繁忙"
+                    case _:
+                        client.rate_limiter.on_success()
+                        if resp_json.get("code") != 0:
+                            error(f"请求Coze出现异常:{resp_json.get('code')}|{resp_json.get('msg')}")
+                        return resp_json
+                
+                if attempt >= XhsService.max_retries:
+                    break
+                delay = backoff_delay(attempt, settings.COZE_BACKOFF_BASE, settings.COZE_BACKOFF_MAX)
+                warning(f"{reason}，{delay:.1f} 秒后进行第 {attempt + 1} 次重试: {log_file_prefix}")
+                await asyncio.sleep(delay)
             
-            resp_json = response.json()
-            # 根据响应状态码处理逻辑
-            match resp_json.get("code"):
-                case 4013:
-                    # 请求频率超出限制，等待60秒后重试
-                    time.sleep(60)
-                    return XhsService._call_coze_api(workflow_id, parameters, log_file_prefix, retries + 1)
-                case 720702222:
-                    # We're currently experiencing server issues. Please try your request again after a short delay. If the problem persists, contact our support team.
-                    time.sleep(120)
-                    return XhsService._call_coze_api(workflow_id, parameters, log_file_prefix, retries + 1)
-                case _:
-                    if resp_json.get("code") != 0:
-                        error(f"请求Coze出现异常:{resp_json.get('code')}|{resp_json.get('msg')}")
-                    return resp_json
+            error(f"调用Coze API超过最大重试次数({XhsService.max_retries}): {log_file_prefix}")
+            return {}
                 
         except Exception as e:
             error(f"调用Coze API失败: {e}")
             traceback.print_exc()
             return {}
     
+    @staticmethod
+    def _call_coze_api(workflow_id: str, parameters: Dict[str, Any], log_file_prefix: str) -> Dict[str, Any]:
+        """
+        调用Coze API并保存响应(同步版本)
+        
+        Args:
+            workflow_id: 工作流ID
+            parameters: API参数
+            log_file_prefix: log文件前缀
+            
+        Returns:
+            API响应结果
+        """
+        return XhsService.run_sync(
+            XhsService._call_coze_api_async(workflow_id, parameters, log_file_prefix)
+        )
+    
+    @staticmethod
+    def _get_envelope_model(response_type: Type[T]) -> Type[BaseModel]:
+        """
+        获取Coze data字段外层结构对应的解析模型，按响应类型缓存
+        
+        data字段是形如 {"resp_code": ..., "resp_data": {...}} 的JSON字符串，resp_data 的类型
+        与响应对象的 data 字段一致，这样整个字符串可以交给 pydantic-core 一次完成解析和校验。
+        """
+        envelope = XhsService._envelope_models.get(response_type)
+        if envelope is None:
+            envelope = create_model(
+                f"{response_type.__name__}Envelope",
+                __config__=ConfigDict(extra="allow"),
+                resp_code=(Any, 0),
+                resp_data=(response_type.model_fields["data"].annotation, ...),
+            )
+            XhsService._envelope_models[response_type] = envelope
+        return envelope
+    
     @staticmethod
     def _process_response(result: Dict[str, Any], response_type: Type[T]) -> Tuple[Optional[T], Dict[str, Any]]:
         """
         处理API响应并解析数据
         
+        data字段的JSON字符串直接由 pydantic-core 解析为带类型的条目模型，不再先 json.loads
+        成完整的字典树再逐层构造模型，峰值内存和CPU开销都更低。
+        
         Args:
             result: API响应结果
             response_type: 响应对象类型
             
         Returns:
-            解析后的响应对象和请求信息
+            解析后的响应对象和请求信息(data字段中除 resp_data 外的其他字段)
         """
-        if not isinstance(result["data"], str):
+        if not isinstance(result.get("data"), str):
             error("data字段不是字符串")
             info("返回的完整数据:", json.dumps(result, ensure_ascii=False, indent=2))
             return None, {}
             
+        # 检查字符串是否为空
+        if not result["data"]:
+            error("data字段为空")
+            return None, {}
+        
         try:
-            # 检查字符串是否为空
-            if not result["data"]:
-                error("data字段为空")
+            envelope = XhsService._get_envelope_model(response_type).model_validate_json(result["data"])
+        except ValidationError as e:
+            # 区分JSON格式错误和结构不符，保持原有的错误提示
+            try:
+                data_json = json_loads(result["data"])
+            except json.JSONDecodeError as decode_error:
+                error(f"data字段JSON解析错误: {decode_error}")
+                error(f"data字段内容: {result['data']}")  # 打印原始字符串以便调试
                 return None, {}
-                
-            # 替换中文逗号为英文逗号
-            data_json = json.loads(result["data"])
-            
-            # 检查resp_data字段
-            if "resp_data" in data_json:
-                resp_data = data_json["resp_data"]
-                
-                # 创建响应对象
-                if response_type == XhsTopicsResponse:
-                    response_obj = response_type(
-                        code=data_json.get("resp_code", 0),
-                        data=resp_data
-                    )
-                else:
-                    response_obj = response_type(
-                        status=data_json.get("resp_code", 0),
-                        data=resp_data
-                    )
-                    
-                return response_obj, data_json
+            if not isinstance(data_json, dict) or "resp_data" not in data_json:
+                error(f"未找到resp_data字段,data字段内容: {json.dumps(data_json, ensure_ascii=False, indent=2)}")
             else:
-                error("未找到resp_data字段,data字段内容:", json.dumps(data_json, ensure_ascii=False, indent=2))
-                return None, {}
-                
-        except json.JSONDecodeError as e:
-            error(f"data字段JSON解析错误: {e}")
-            error("data字段内容:", result["data"])  # 打印原始字符串以便调试
+                error(f"resp_data字段结构不符合 {response_type.__name__}: {e}")
             return None, {}
+        
+        data_json = {"resp_code": envelope.resp_code, **(envelope.model_extra or {})}
+        
+        # 条目已在上一步校验过，这里直接组装响应对象，不再重复校验
+        if response_type == XhsTopicsResponse:
+            response_obj = response_type.model_construct(
+                code=envelope.resp_code or 0,
+                data=envelope.resp_data
+            )
+        else:
+            response_obj = response_type.model_construct(data=envelope.resp_data)
+            
+        return response_obj, data_json
     
     @staticmethod
-    def _store_data_in_db(db_method: Callable, req_info: Dict[str, Any], response_obj: Any, data_type: str = "笔记") -> List[Any]:
+    def _store_data_in_db(db_method: Callable, req_info: Dict[str, Any], response_obj: Any, data_type: str = "笔记", raise_on_error: bool = False) -> List[Any]:
         """
         将数据存储到数据库
         
@@ -149,6 +217,7 @@ class XhsService:
             req_info: 请求信息
             response_obj: 响应对象
             data_type: 数据类型描述
+            raise_on_error: 存储失败时是否抛出异常，默认记录日志后返回空列表
             
         Returns:
             存储的数据列表
@@ -168,6 +237,8 @@ class XhsService:
         except Exception as e:
             error(f"存储{data_type}数据到数据库时出错: {e}")
             traceback.print_exc()
+            if raise_on_error:
+                raise
             
         finally:
             db.close()
@@ -175,54 +246,108 @@ class XhsService:
         return stored_data
     
     @staticmethod
-    def get_notes_by_tag(tag: str = "", num: int = 10) -> List[XhsNote]:
+    async def _crawl_async(
+        workflow_id: str,
+        parameters: Dict[str, Any],
+        log_file_prefix: str,
+        response_type: Type[T],
+        db_method: Callable,
+        req_info: Dict[str, Any],
+        data_type: str,
+        raise_on_error: bool = False
+    ) -> List[Any]:
         """
-        根据标签获取小红书笔记
+        调用工作流、解析响应并存储数据的通用流程
         
         Args:
-            tag: 搜索的标签
-            num: 获取的笔记数量
+            workflow_id: 工作流ID
+            parameters: API参数
+            log_file_prefix: log文件前缀
+            response_type: 响应对象类型
+            db_method: 数据库操作方法
+            req_info: 请求信息
+            data_type: 数据类型描述
+            raise_on_error: 调用、解析或存储失败时是否抛出异常，默认记录日志后返回空列表。
+                由 CrawlScheduler 调度时需要抛出，失败的任务才会记为 failed 并在续跑时重试
             
         Returns:
-            存储的笔记列表
+            存储的数据列表
         """
-        # 设置API参数
-        parameters = {
-            "search_tag": tag,
-            "search_num": num,
-            "cookie": settings.XHS_COOKIE
-        }
-        
         # 调用API
-        result = XhsService._call_coze_api(
-            workflow_id="7480441452158648331",
+        result = await XhsService._call_coze_api_async(
+            workflow_id=workflow_id,
             parameters=parameters,
-            log_file_prefix="get_notes_by_tag"
+            log_file_prefix=log_file_prefix
         )
+        if raise_on_error and result.get("code") != 0:
+            raise RuntimeError(f"调用Coze工作流失败({log_file_prefix}): {result.get('code')}|{result.get('msg')}")
         
         # 处理响应
-        response_obj, data_json = XhsService._process_response(result, XhsSearchResponse)
+        response_obj, data_json = XhsService._process_response(result, response_type)
         if not response_obj:
+            if raise_on_error:
+                raise RuntimeError(f"解析Coze响应失败({log_file_prefix})")
             return []
+        
+        # 数据库写入是同步操作，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(
+            XhsService._store_data_in_db,
+            db_method,
+            req_info,
+            response_obj,
+            data_type,
+            raise_on_error
+        )
+    
+    @staticmethod
+    async def get_notes_by_tag_async(tag: str = "", num: int = 10, raise_on_error: bool = False) -> List[XhsNote]:
+        """
+        根据标签获取小红书笔记(异步版本)
+        
+        Args:
+            tag: 搜索的标签
+            num: 获取的笔记数量
+            raise_on_error: Coze调用、解析或存储失败时是否抛出异常
             
-        # 准备请求信息
-        req_info = {
-            "keywords": tag,
-            "search_num": num
-        }
-        
-        # 存储数据
-        return XhsService._store_data_in_db(
+        Returns:
+            存储的笔记列表
+        """
+        return await XhsService._crawl_async(
+            workflow_id="7480441452158648331",
+            parameters={
+                "search_tag": tag,
+                "search_num": num,
+                "cookie": settings.XHS_COOKIE
+            },
+            log_file_prefix="get_notes_by_tag",
+            response_type=XhsSearchResponse,
             db_method=XhsDAO.store_search_results,
-            req_info=req_info,
-            response_obj=response_obj,
-            data_type="笔记"
+            req_info={
+                "keywords": tag,
+                "search_num": num
+            },
+            data_type="笔记",
+            raise_on_error=raise_on_error
         )
+    
+    @staticmethod
+    def get_notes_by_tag(tag: str = "", num: int = 10) -> List[XhsNote]:
+        """
+        根据标签获取小红书笔记
+        
+        Args:
+            tag: 搜索的标签
+            num: 获取的笔记数量
+            
+        Returns:
+            存储的笔记列表
+        """
+        return XhsService.run_sync(XhsService.get_notes_by_tag_async(tag, num))
 
     @staticmethod
-    def get_notes_by_auther_id(auther_id: str) -> List[XhsNote]:
+    async def get_notes_by_auther_id_async(auther_id: str) -> List[XhsNote]:
         """
-        根据博主的用户Id获取全部笔记内容
+        根据博主的用户Id获取全部笔记内容(异步版本)
         
         Args:
             auther_id: 博主的用户ID
@@ -232,35 +357,63 @@ class XhsService:
         """
         user_profile_url = f"https://www.xiaohongshu.com/user/profile/{auther_id}"
         
-        # 设置API参数
-        parameters = {
-            "userProfileUrl": user_profile_url,
-            "cookie": settings.XHS_COOKIE
-        }
-        
-        # 调用API
-        result = XhsService._call_coze_api(
+        return await XhsService._crawl_async(
             workflow_id="7480852360857714739",
-            parameters=parameters,
-            log_file_prefix="xhs_get_notes_by_auther"
+            parameters={
+                "userProfileUrl": user_profile_url,
+                "cookie": settings.XHS_COOKIE
+            },
+            log_file_prefix="xhs_get_notes_by_auther",
+            response_type=XhsAutherNotesResponse,
+            db_method=XhsDAO.store_auther_notes,
+            req_info={
+                "userProfileUrl": user_profile_url
+            },
+            data_type="笔记"
         )
+
+    @staticmethod
+    def get_notes_by_auther_id(auther_id: str) -> List[XhsNote]:
+        """
+        根据博主的用户Id获取全部笔记内容
         
-        # 处理响应
-        response_obj, data_json = XhsService._process_response(result, XhsAutherNotesResponse)
-        if not response_obj:
-            return []
+        Args:
+            auther_id: 博主的用户ID
             
-        # 准备请求信息
-        req_info = {
-            "userProfileUrl": user_profile_url
-        }
+        Returns:
+            存储的笔记列表
+        """
+        return XhsService.run_sync(XhsService.get_notes_by_auther_id_async(auther_id))
+    
+    @staticmethod
+    async def get_comments_by_note_url_async(note_url: str, comments_num: int, raise_on_error: bool = False) -> List[XhsComment]:
+        """
+        根据笔记链接获取评论(异步版本)
         
-        # 存储数据
-        return XhsService._store_data_in_db(
-            db_method=XhsDAO.store_auther_notes,
-            req_info=req_info,
-            response_obj=response_obj,
-            data_type="笔记"
+        Args:
+            note_url: 笔记链接
+            comments_num: 评论数量
+            raise_on_error: Coze调用、解析或存储失败时是否抛出异常
+            
+        Returns:
+            存储的评论列表
+        """
+        return await XhsService._crawl_async(
+            workflow_id="7480889721393152035",
+            parameters={
+                "noteUrl": note_url,
+                "comments_num": comments_num,
+                "cookie": settings.XHS_COOKIE
+            },
+            log_file_prefix="xhs_get_comments_by_note",
+            response_type=XhsCommentsResponse,
+            db_method=XhsDAO.store_comments,
+            req_info={
+                "noteUrl": note_url,
+                "totalNumber": comments_num
+            },
+            data_type="评论",
+            raise_on_error=raise_on_error
         )
     
     @staticmethod
@@ -276,38 +429,52 @@ class XhsService:
         Returns:
             存储的评论列表
         """
+        return XhsService.run_sync(XhsService.get_comments_by_note_url_async(note_url, comments_num))
+    
+    @staticmethod
+    async def fetch_xhs_note_detail_async(note_url: str) -> Optional[XhsNoteDetailResponse]:
+        """
+        获取并解析笔记详情，不写入数据库，供批量写入的调用方使用
         
-        # 设置API参数
-        parameters = {
-            "noteUrl": note_url,
-            "comments_num": comments_num,
-            "cookie": settings.XHS_COOKIE
-        }
-        
-        # 调用API
-        result = XhsService._call_coze_api(
-            workflow_id="7480889721393152035",
-            parameters=parameters,
-            log_file_prefix="xhs_get_comments_by_note"
+        Args:
+            note_url: 笔记链接
+            
+        Returns:
+            笔记详情响应对象，获取或解析失败时返回None
+        """
+        result = await XhsService._call_coze_api_async(
+            workflow_id="7480895021278920716",
+            parameters={
+                "noteUrl": note_url,
+                "cookie": settings.XHS_COOKIE
+            },
+            log_file_prefix="xhs_get_note_detail"
         )
+        response_obj, data_json = XhsService._process_response(result, XhsNoteDetailResponse)
+        return response_obj
+    
+    @staticmethod
+    async def get_xhs_note_detail_async(note_url: str) -> List[XhsNoteDetail]:
+        """
+        获取笔记详情(异步版本)
         
-        # 处理响应
-        response_obj, data_json = XhsService._process_response(result, XhsCommentsResponse)
+        Args:
+            note_url: 笔记链接
+            
+        Returns:
+            存储的笔记详情
+        """
+        response_obj = await XhsService.fetch_xhs_note_detail_async(note_url)
         if not response_obj:
             return []
-            
-        # 准备请求信息
-        req_info = {
-            "noteUrl": note_url,
-            "totalNumber": comments_num
-        }
-        
-        # 存储数据
-        return XhsService._store_data_in_db(
-            db_method=XhsDAO.store_comments,
-            req_info=req_info,
-            response_obj=response_obj,
-            data_type="评论"
+        
+        # 数据库写入是同步操作，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(
+            XhsService._store_data_in_db,
+            XhsDAO.store_note_detail,
+            {"noteUrl": note_url},
+            response_obj,
+            "笔记详情"
         )
     
     @staticmethod
@@ -322,36 +489,32 @@ class XhsService:
         Returns:
             存储的笔记详情
         """
+        return XhsService.run_sync(XhsService.get_xhs_note_detail_async(note_url))
+    
+    @staticmethod
+    async def get_topics_async(tag: str) -> List[XhsTopicDiscussion]:
+        """
+        获取话题列表(异步版本)
         
-        # 设置API参数
-        parameters = {
-            "noteUrl": note_url,
-            "cookie": settings.XHS_COOKIE
-        }
-        
-        # 调用API
-        result = XhsService._call_coze_api(
-            workflow_id="7480895021278920716",
-            parameters=parameters,
-            log_file_prefix="xhs_get_note_detail"
-        )
-        
-        # 处理响应
-        response_obj, data_json = XhsService._process_response(result, XhsNoteDetailResponse)
-        if not response_obj:
-            return []
+        Args:
+            tag: 搜索的标签
             
-        # 准备请求信息
-        req_info = {
-            "noteUrl": note_url
-        }
-        
-        # 存储数据
-        return XhsService._store_data_in_db(
-            db_method=XhsDAO.store_note_detail,
-            req_info=req_info,
-            response_obj=response_obj,
-            data_type="笔记详情"
+        Returns:
+            存储的话题列表
+        """
+        return await XhsService._crawl_async(
+            workflow_id="7480898701533397031",
+            parameters={
+                "keyword": tag,
+                "cookie": settings.XHS_COOKIE
+            },
+            log_file_prefix="xhs_get_topics",
+            response_type=XhsTopicsResponse,
+            db_method=XhsDAO.store_topics,
+            req_info={
+                "keyword": tag
+            },
+            data_type="话题"
         )
     
     @staticmethod
@@ -365,36 +528,7 @@ class XhsService:
         Returns:
             存储的话题列表
         """
-        # 设置API参数
-        parameters = {
-            "keyword": tag,
-            "cookie": settings.XHS_COOKIE
-        }
-        
-        # 调用API
-        result = XhsService._call_coze_api(
-            workflow_id="7480898701533397031",
-            parameters=parameters,
-            log_file_prefix="xhs_get_topics"
-        )
-        
-        # 处理响应
-        response_obj, data_json = XhsService._process_response(result, XhsTopicsResponse)
-        if not response_obj:
-            return []
-            
-        # 准备请求信息
-        req_info = {
-            "keyword": tag
-        }
-        
-        # 存储数据
-        return XhsService._store_data_in_db(
-            db_method=XhsDAO.store_topics,
-            req_info=req_info,
-            response_obj=response_obj,
-            data_type="话题"
-        )
+        return XhsService.run_sync(XhsService.get_topics_async(tag))
     
     @staticmethod
     def fix_note_tags():
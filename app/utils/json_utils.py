@@ -0,0 +1,44 @@
+import json
+from typing import Any, Union
+
+# orjson 为可选依赖，安装后解析和序列化速度更快，未安装时回退到标准库 json
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+
+def json_loads(data: Union[str, bytes, bytearray]) -> Any:
+    """
+    解析JSON字符串或字节串
+
+    Args:
+        data: JSON文本，可以直接传入HTTP响应体的字节串，无需先解码
+
+    Returns:
+        解析后的Python对象
+
+    Raises:
+        json.JSONDecodeError: JSON格式错误(orjson.JSONDecodeError 也是它的子类)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """
+    将对象序列化为紧凑的UTF-8字节串(不转义中文)
+
+    Args:
+        obj: 待序列化对象
+
+    Returns:
+        JSON字节串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
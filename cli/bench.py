@@ -0,0 +1,137 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import typer
+from app.utils.logger import get_logger, info, warning, error
+
+# 获取当前模块的日志器
+logger = get_logger(__name__)
+app = typer.Typer()
+
+# 采集等命令启动时不应加载的大型依赖
+HEAVY_MODULES = (
+    "numpy", "scipy", "sklearn", "torch", "sentence_transformers", "transformers",
+    "matplotlib", "seaborn", "openai"
+)
+
+# 在新进程中导入模块，输出耗时、内存峰值和已加载的大型依赖
+IMPORT_PROBE = """
+import json, sys, time
+started_at = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - started_at) * 1000
+try:
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+except ImportError:
+    rss_mb = 0.0
+print(json.dumps({{"elapsed_ms": elapsed_ms, "rss_mb": rss_mb, "modules": sorted(sys.modules)}}))
+"""
+
+@app.command(name="import_time")
+def import_time(
+    module: str = typer.Option("cli.main", "--module", "-m", help="要测量的模块"),
+    budget_ms: float = typer.Option(2000, "--budget", "-b", help="导入耗时上限(毫秒)"),
+    repeat: int = typer.Option(3, "--repeat", "-r", help="重复测量次数，取中位数"),
+    allow_heavy: bool = typer.Option(False, "--allow-heavy", help="允许导入时加载 numpy、torch 等大型依赖")
+):
+    """
+    测量模块的冷启动导入耗时
+
+    每次在新的Python进程中导入模块，耗时中位数超过 budget 或加载了大型依赖时返回非零退出码，
+    用于防止采集命令的启动时间被标签分析等依赖拖慢。
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    elapsed_ms = statistics.median(run["elapsed_ms"] for run in runs)
+    rss_mb = max(run["rss_mb"] for run in runs)
+    loaded = [name for name in HEAVY_MODULES if name in runs[-1]["modules"]]
+    info(f"导入 {module}: {elapsed_ms:.0f} ms(中位数，共 {repeat} 次)，内存峰值 {rss_mb:.0f} MB，上限 {budget_ms:.0f} ms")
+
+    failed = False
+    if elapsed_ms > budget_ms:
+        failed = True
+        error(f"导入耗时 {elapsed_ms:.0f} ms 超过上限 {budget_ms:.0f} ms")
+    if loaded:
+        if allow_heavy:
+            warning(f"导入时加载了大型依赖: {', '.join(loaded)}")
+        else:
+            failed = True
+            error(f"导入时加载了大型依赖: {', '.join(loaded)}")
+    if failed:
+        raise typer.Exit(code=1)
+
+@app.command(name="tag_scoring")
+def tag_scoring(
+    notes: int = typer.Option(5000, "--notes", "-n", help="模拟的笔记数量"),
+    max_tags: int = typer.Option(10, "--max-tags", help="每篇笔记最多的收集标签数量"),
+    standard_count: int = typer.Option(12, "--standard", "-s", help="标准标签数量"),
+    dim: int = typer.Option(512, "--dim", help="向量维度"),
+    seed: int = typer.Option(0, "--seed", help="随机种子"),
+    tolerance: float = typer.Option(1e-6, "--tolerance", "-t", help="允许的得分最大差异")
+):
+    """
+    标签相似度打分的回归基准
+
+    用随机向量模拟笔记标签，分别用逐篇计算(_calculate_scores)和批量打分(scoring_kernel.score_blocks)计算五项指标和加权总分，
+    比较耗时并检查两者得分一致，差异超过 tolerance 时返回非零退出码。
+    """
+    import numpy as np
+    from app.services.tag_comparison.scoring_kernel import score_blocks
+    from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+
+    rng = np.random.default_rng(seed)
+    standard_embeddings = rng.normal(size=(standard_count, dim)).astype(np.float32)
+    lengths = rng.integers(1, max_tags + 1, size=notes)
+    # 收集标签由随机的标准标签加噪声生成，使相似度分布在较宽的范围内
+    sources = rng.integers(0, standard_count, size=int(lengths.sum()))
+    noise = rng.uniform(0.3, 2.0, size=(len(sources), 1))
+    collected_embeddings = (standard_embeddings[sources] + rng.normal(size=(len(sources), dim)) * noise).astype(np.float32)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    info(f"模拟 {notes} 篇笔记，共 {len(sources)} 个收集标签，{standard_count} 个标准标签，维度 {dim}")
+
+    def normalize(embeddings):
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    # 逐篇计算：每篇笔记单独计算余弦相似度矩阵和各项指标
+    started_at = time.perf_counter()
+    reference = []
+    for start, length in zip(starts, lengths):
+        matrix = normalize(collected_embeddings[start:start + length]) @ normalize(standard_embeddings).T
+        scores = TagSimilarityAnalyzer._calculate_scores(matrix)
+        reference.append({**scores, "score": TagSimilarityAnalyzer._calculate_weighted_score(scores)})
+    reference_seconds = time.perf_counter() - started_at
+
+    # 批量打分：一次矩阵乘法得到全部相似度，按笔记分段向量化计算
+    started_at = time.perf_counter()
+    block = normalize(collected_embeddings) @ normalize(standard_embeddings).T
+    batch = score_blocks(block, starts, lengths)
+    batch["score"] = TagSimilarityAnalyzer._calculate_weighted_score(batch)
+    batch_seconds = time.perf_counter() - started_at
+
+    info(f"逐篇计算: {reference_seconds:.3f} 秒，{notes / reference_seconds:.0f} 篇/秒")
+    info(f"批量打分: {batch_seconds:.3f} 秒，{notes / batch_seconds:.0f} 篇/秒，加速 {reference_seconds / batch_seconds:.1f} 倍")
+
+    failed = False
+    for metric, values in batch.items():
+        diff = float(np.max(np.abs(np.array([item[metric] for item in reference], dtype=np.float64) - values)))
+        if diff > tolerance:
+            failed = True
+            error(f"  - {metric}: 最大差异 {diff:.2e}，超过容差 {tolerance:.0e}")
+        else:
+            info(f"  - {metric}: 最大差异 {diff:.2e}")
+    if failed:
+        raise typer.Exit(code=1)
+    info("批量打分与逐篇计算的得分一致")
+
+if __name__ == "__main__":
+    app()
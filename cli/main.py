@@ -2,6 +2,7 @@ import typer
 from cli.xhs import app as xhs_app
 from cli.tag import app as tag_app
 from cli.spider import app as spider_app
+from cli.bench import app as bench_app
 from app.utils.logger import get_logger, info
 
 # 获取当前模块的日志器
@@ -12,6 +13,7 @@ app = typer.Typer()
 app.add_typer(xhs_app, name="xhs")
 app.add_typer(tag_app, name="tag")
 app.add_typer(spider_app, name="spider")
+app.add_typer(bench_app, name="bench")
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,5 +1,10 @@
+from typing import List
+
 import typer
 from app.utils.logger import get_logger, info, warning, error
+from app.services.llm_service import LlmService
+from app.config.settings import settings
+from app.models.llm_dao import LlmDAO
 from app.services.tag_service import TagService
 
 # 获取当前模块的日志器
@@ -15,15 +20,39 @@ def get_all_tags():
     logger.info(f"获取到所有标签: {tags}")
 
 @app.command(name="make_tags_from_note")
-def make_tags_from_note(note_id: str = typer.Option(None, "--note_id", help="笔记ID")):
+def make_tags_from_note(
+    note_id: str = typer.Option(None, "--note_id", help="笔记ID"),
+    concurrency: int = typer.Option(None, "--concurrency", "-c", help="同时请求模型的数量，默认按模型别名读取配置"),
+    batch_size: int = typer.Option(50, "--batch-size", "-b", help="每积累多少条诊断结果写一次数据库"),
+    notes_per_request: int = typer.Option(1, "--notes-per-request", "-k", help="每次请求打包的笔记数量，大于1时启用批量提取")
+):
     """
     给指定的笔记提取标签
     """
-    TagService.make_tags_from_note(note_id)
+    TagService.make_tags_from_note(note_id, concurrency=concurrency, batch_size=batch_size, notes_per_request=notes_per_request)
+    
+@app.command(name="llm_cache")
+def llm_cache(
+    clear: bool = typer.Option(False, "--clear", help="清空缓存"),
+    evict: bool = typer.Option(False, "--evict", help="立即删除过期和超出容量的记录")
+):
+    """
+    查看或清理LLM响应缓存
+    """
+    cache = LlmService.get_response_cache()
+    if cache is None:
+        warning("LLM响应缓存未启用(LLM_CACHE_ENABLED)")
+        return
+    if clear:
+        cache.clear()
+    elif evict:
+        cache.evict()
+    stats = cache.stats()
+    info(f"LLM响应缓存: {stats['path']}，共 {stats['entries']} 条记录")
     
 @app.command(name="similar_tag")
 def similar_tag(
-    model_name: str = typer.Option("distiluse-v2", "--model", "-m", help="使用的预训练模型名称，可选值：'distiluse-v2', 'bge'")
+    model_name: str = typer.Option("distiluse-v2", "--model", "-m", help="使用的预训练模型名称，可选值：'distiluse-v2', 'bge'，可加后缀 ':onnx'、':int8' 选择推理后端")
 ):
     """
     给标签做相似度匹配
@@ -37,7 +66,11 @@ def similar_tag(
 @app.command(name="analyse_tag_similarity")
 def analyse_tag_similarity(
     note_id: str = typer.Option(None, "--note_id", help="笔记ID"),
-    model_name: str = typer.Option("distiluse-v2", "--model", "-m", help="使用的预训练模型名称，可选值：'distiluse-v2', 'bge'")
+    model_name: str = typer.Option("distiluse-v2", "--model", "-m", help="使用的预训练模型名称，可选值：'distiluse-v2', 'bge'，可加后缀 ':onnx'、':int8' 选择推理后端"),
+    workers: int = typer.Option(1, "--workers", "-w", help="子进程数量，大于1时按分片多进程分析，0 表示使用全部CPU核"),
+    device: str = typer.Option(None, "--device", "-d", help="模型运行的设备，如 cpu、cuda，默认读取配置 TAG_MODEL_DEVICE"),
+    shard_size: int = typer.Option(200, "--shard-size", help="多进程分析时每个分片包含的笔记数量"),
+    batch_size: int = typer.Option(500, "--batch-size", "-b", help="每积累多少条结果写一次数据库")
 ):
     """
     分析标签相似度
@@ -45,15 +78,101 @@ def analyse_tag_similarity(
     Args:
         note_id: 笔记ID，可选
         model_name: 使用的预训练模型名称，可选值：'distiluse-v2', 'bge'
+        workers: 子进程数量，大于1时按分片多进程分析，0 表示使用全部CPU核
+        device: 模型运行的设备
+        shard_size: 多进程分析时每个分片包含的笔记数量
+        batch_size: 每积累多少条结果写一次数据库
     """
+    if workers != 1:
+        TagService.analyse_tag_similarity_parallel(
+            note_id, model_name=model_name, workers=workers or None, device=device,
+            shard_size=shard_size, batch_size=batch_size
+        )
+        return
+    
     # 创建 TagService 实例
-    tag_service = TagService(model_name=model_name)
+    tag_service = TagService(model_name=model_name, device=device)
     
     # 初始化标准标签
     # tag_service.init_standard_tags()
     
     # 分析标签相似度
-    tag_service.analyse_tag_similarity(note_id)
+    tag_service.analyse_tag_similarity(note_id, batch_size=batch_size)
+
+@app.command(name="build_tag_index")
+def build_tag_index(
+    model_name: str = typer.Option(None, "--model", "-m", help="使用的预训练模型名称，默认读取配置 TAG_INDEX_MODEL"),
+    threshold: float = typer.Option(None, "--threshold", "-t", help="归并近似重复标签的相似度阈值，默认读取配置 TAG_NORMALIZE_THRESHOLD"),
+    show: int = typer.Option(10, "--show", help="每种标签类型展示的归并结果数量")
+):
+    """
+    对诊断结果中的全部标签构建近似最近邻索引并归并近似重复标签
+    """
+    from app.services.tag_comparison.tag_normalizer import TagNormalizer
+    from app.services.tag_comparison.tag_similarity_analyzer import TagSimilarityAnalyzer
+    
+    normalizer = TagNormalizer(TagSimilarityAnalyzer(model_name=model_name or settings.TAG_INDEX_MODEL), threshold=threshold)
+    normalizer.build()
+    normalizer.save()
+    for tag_type in LlmDAO.TAG_COLUMNS:
+        clusters = sorted(normalizer.clusters(tag_type).items(), key=lambda item: -len(item[1]))
+        for canonical, members in clusters[:show]:
+            info(f"[{tag_type}] {canonical}: {', '.join(members)}")
+
+@app.command(name="nearest_tag")
+def nearest_tag(
+    tag: str = typer.Option(..., "--tag", help="标签"),
+    tag_type: str = typer.Option("geo", "--type", help="标签类型：geo、cultural、other"),
+    k: int = typer.Option(5, "-k", help="返回的标准标签数量"),
+    model_name: str = typer.Option(None, "--model", "-m", help="使用的预训练模型名称，默认读取配置 TAG_INDEX_MODEL")
+):
+    """
+    查询标签对应的规范标签和最相近的标准标签
+    """
+    from app.services.tag_comparison.tag_normalizer import get_tag_normalizer
+    
+    normalizer = get_tag_normalizer(model_name)
+    if normalizer is None:
+        return
+    result = normalizer.nearest(tag, tag_type, k=k)
+    info(f"{tag} -> 规范标签: {result['canonical_tag']} ({result['canonical_score']:.3f})，"
+         f"编码 {result['encode_ms']:.2f} ms，查询 {result['lookup_ms']:.3f} ms")
+    for item in result["standard_tags"]:
+        info(f"  - {item['tag']}: {item['score']:.3f}")
+
+@app.command(name="check_backend")
+def check_backend(
+    model_name: str = typer.Option(..., "--model", "-m", help="待检查的模型名称，如 'bge:onnx'、'distiluse-v2:int8'"),
+    reference_model_name: str = typer.Option(None, "--reference", "-r", help="参考模型名称，默认为去掉后端后缀的模型"),
+    limit: int = typer.Option(200, "--limit", "-n", help="参与检查的笔记数量"),
+    tolerance: float = typer.Option(0.02, "--tolerance", "-t", help="允许的加权得分最大差异"),
+    device: str = typer.Option(None, "--device", "-d", help="模型运行的设备，默认读取配置 TAG_MODEL_DEVICE")
+):
+    """
+    检查推理后端与参考模型的得分差异和编码速度
+    """
+    report = TagService.check_backend(
+        model_name, reference_model_name=reference_model_name, limit=limit, tolerance=tolerance, device=device
+    )
+    if report and not report["passed"]:
+        raise typer.Exit(code=1)
+
+@app.command(name="embedding_server")
+def embedding_server(
+    host: str = typer.Option(None, "--host", help="监听地址，默认读取配置 EMBEDDING_SERVER_HOST"),
+    port: int = typer.Option(None, "--port", "-p", help="监听端口，默认读取配置 EMBEDDING_SERVER_PORT"),
+    device: str = typer.Option(None, "--device", "-d", help="模型运行的设备，默认读取配置 TAG_MODEL_DEVICE"),
+    preload: List[str] = typer.Option([], "--model", "-m", help="启动后预先加载的模型名称，可重复指定"),
+    window_ms: float = typer.Option(None, "--window-ms", help="微批处理等待窗口(毫秒)，默认读取配置 EMBEDDING_SERVER_BATCH_WINDOW_MS")
+):
+    """
+    启动常驻的本地嵌入服务
+
+    服务保存已加载的标签模型，服务运行时其他命令的标签编码自动交给服务完成，不再各自加载模型。
+    """
+    from app.services.tag_comparison.embedding_server import EmbeddingServer
+    
+    EmbeddingServer(host=host, port=port, device=device, window_ms=window_ms).serve_forever(preload=preload)
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import typer
+from typing import List, Optional
 from app.services.xhs_service import XhsService
+from app.services.replay_service import ReplayService
 from app.services.topic_service import TopicService
 from app.utils.logger import get_logger, info, warning, error, debug
 
@@ -12,7 +14,12 @@ app = typer.Typer()
 def search_notes_by_topic(
     min_view_num: int = typer.Option(10000, "--min-view", "-v", help="最小话题浏览量"),
     topic_limit: int = typer.Option(20, "--topic-limit", "-l", help="处理话题的最大数量"),
-    notes_per_topic: int = typer.Option(200, "--notes-per-topic", "-n", help="每个话题获取的笔记数量")
+    notes_per_topic: int = typer.Option(200, "--notes-per-topic", "-n", help="每个话题获取的笔记数量"),
+    workers: int = typer.Option(3, "--workers", "-w", help="并发worker数量"),
+    rate_per_minute: float = typer.Option(6, "--rate", help="全局每分钟最多开始处理的话题数"),
+    min_delay: float = typer.Option(10, "--min-delay", help="每个worker处理两个话题之间的最小等待秒数"),
+    max_delay: float = typer.Option(30, "--max-delay", help="每个worker处理两个话题之间的最大等待秒数"),
+    resume: bool = typer.Option(True, "--resume/--no-resume", help="是否从上次中断的进度继续")
 ):
     """
     搜索热门话题的笔记
@@ -26,7 +33,12 @@ def search_notes_by_topic(
         processed_topics = TopicService.search_notes_by_topic(
             min_view_num=min_view_num,
             topic_limit=topic_limit,
-            notes_per_topic=notes_per_topic
+            notes_per_topic=notes_per_topic,
+            workers=workers,
+            rate_per_minute=rate_per_minute,
+            min_delay=min_delay,
+            max_delay=max_delay,
+            resume=resume
         )
         
         if processed_topics > 0:
@@ -39,14 +51,22 @@ def search_notes_by_topic(
         error(traceback.format_exc())
 
 @app.command(name="deal_note_have_detail")
-def deal_note_have_detail():
+def deal_note_have_detail(
+    page_size: int = typer.Option(200, "--page-size", "-p", help="每页处理的笔记数量"),
+    concurrency: int = typer.Option(5, "--concurrency", "-c", help="同时获取详情的最大数量"),
+    resume: bool = typer.Option(True, "--resume/--no-resume", help="是否从上次中断的游标继续")
+):
     """
     从数据库中查询没有详情页的笔记，然后获取详情页
     """
     
     try:
         # 调用业务逻辑方法
-        processed_notes = TopicService.deal_note_have_detail()
+        processed_notes = TopicService.deal_note_have_detail(
+            page_size=page_size,
+            concurrency=concurrency,
+            resume=resume
+        )
         
         if processed_notes > 0:
             info(f"任务完成! 共处理了 {processed_notes} 个笔记")
@@ -58,15 +78,29 @@ def deal_note_have_detail():
         error(traceback.format_exc())
 
 @app.command(name="deal_note_comments")
-def deal_note_comments():
+def deal_note_comments(
+    limit: int = typer.Option(500, "--limit", "-l", help="本次最多处理的笔记数量"),
+    workers: int = typer.Option(3, "--workers", "-w", help="并发worker数量"),
+    rate_per_minute: float = typer.Option(6, "--rate", help="全局每分钟最多开始处理的笔记数"),
+    min_delay: float = typer.Option(5, "--min-delay", help="每个worker处理两篇笔记之间的最小等待秒数"),
+    max_delay: float = typer.Option(15, "--max-delay", help="每个worker处理两篇笔记之间的最大等待秒数"),
+    resume: bool = typer.Option(True, "--resume/--no-resume", help="是否从上次中断的进度继续")
+):
     """
-    从数据库中查询没有评论的笔记，然后获取评论
+    从数据库中查询有新增评论的笔记，然后增量获取评论
     """
-    info(f"开始搜索没有评论的笔记")
+    info(f"开始搜索有新增评论的笔记")
     
     try:
         # 调用业务逻辑方法
-        processed_notes = TopicService.deal_note_comments()
+        processed_notes = TopicService.deal_note_comments(
+            limit=limit,
+            workers=workers,
+            rate_per_minute=rate_per_minute,
+            min_delay=min_delay,
+            max_delay=max_delay,
+            resume=resume
+        )
         
         if processed_notes > 0:
             info(f"任务完成! 共处理了 {processed_notes} 个笔记")
@@ -96,5 +130,30 @@ def export_note_content():
         error(traceback.format_exc())
 
 
+@app.command(name="replay")
+def replay(
+    prefixes: Optional[List[str]] = typer.Option(None, "--prefix", "-p", help="只回放指定前缀，可多次指定，默认全部"),
+    workers: int = typer.Option(4, "--workers", "-w", help="解析进程数量"),
+    legacy: bool = typer.Option(True, "--legacy/--no-legacy", help="是否包含 logs/coze_http_request 下的旧版响应文件"),
+    archive: bool = typer.Option(True, "--archive/--no-archive", help="是否包含压缩归档分段"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只解析不写库，用于压测解析路径")
+):
+    """
+    离线回放已保存的Coze响应，重新解析并写入数据库，不发起网络请求
+    """
+    try:
+        ReplayService.replay(
+            prefixes=prefixes,
+            workers=workers,
+            include_legacy=legacy,
+            include_archive=archive,
+            dry_run=dry_run
+        )
+    except Exception as e:
+        error(f"执行任务时出错: {e}")
+        import traceback
+        error(traceback.format_exc())
+
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
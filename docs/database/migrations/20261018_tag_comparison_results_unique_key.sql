@@ -0,0 +1,21 @@
+-- 为 tag_comparison_results 增加唯一键 uk_note_llm_type_model(note_id, llm_name, tag_type, compare_model_name)
+-- TagDAO.save_comparison_results 按该键批量执行 INSERT ... ON DUPLICATE KEY UPDATE，
+-- 没有唯一键时每次分析都会插入重复记录。执行前请先备份该表。
+
+-- 1. 早期记录未写入比较模型，按当时的默认模型 distiluse-v2 补齐
+UPDATE `tag_comparison_results` SET `compare_model_name` = 'distiluse-v2' WHERE `compare_model_name` IS NULL;
+
+-- 2. 删除重复记录，每个 (note_id, llm_name, tag_type, compare_model_name) 只保留 id 最大(最后写入)的一条
+DELETE `older` FROM `tag_comparison_results` AS `older`
+JOIN `tag_comparison_results` AS `newer`
+  ON `newer`.`note_id` = `older`.`note_id`
+ AND `newer`.`llm_name` = `older`.`llm_name`
+ AND `newer`.`tag_type` = `older`.`tag_type`
+ AND `newer`.`compare_model_name` = `older`.`compare_model_name`
+ AND `newer`.`id` > `older`.`id`;
+
+-- 3. 增加唯一键；原 idx_note_llm 是唯一键的前缀，一并删除
+ALTER TABLE `tag_comparison_results`
+  MODIFY `compare_model_name` varchar(255) NOT NULL COMMENT '比较模型名称',
+  ADD UNIQUE KEY `uk_note_llm_type_model` (`note_id`,`llm_name`,`tag_type`,`compare_model_name`),
+  DROP KEY `idx_note_llm`;
@@ -102,7 +102,7 @@ CREATE TABLE `tag_comparison_results` (
   `note_id` varchar(64) NOT NULL COMMENT '笔记ID，关联 xhs_notes(note_id)',
   `llm_name` varchar(128) NOT NULL COMMENT 'LLM模型名称',
   `tag_type` varchar(32) NOT NULL COMMENT '标签类型（geo: 地理位置, cultural: 文化标签）',
-  `compare_model_name` varchar(255) DEFAULT NULL,
+  `compare_model_name` varchar(255) NOT NULL COMMENT '比较模型名称',
   `collected_tags` json DEFAULT NULL,
   `standard_tags` json DEFAULT NULL,
   `similarity_matrix` json DEFAULT NULL,
@@ -116,7 +116,7 @@ CREATE TABLE `tag_comparison_results` (
   `created_at` datetime DEFAULT NULL,
   `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
   PRIMARY KEY (`id`),
-  KEY `idx_note_llm` (`note_id`,`llm_name`),
+  UNIQUE KEY `uk_note_llm_type_model` (`note_id`,`llm_name`,`tag_type`,`compare_model_name`),
   KEY `idx_tag_type` (`tag_type`)
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='标签对比结果表';
 /*!40101 SET character_set_client = @saved_cs_client */;